@@ -16,6 +16,39 @@ from config import (
     AI_SAFETY_MODE,
     get_google_safety_settings,
 )
+from services import metrics
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.llm")
+
+_upstream_calls = metrics.counter(
+    "aluna_llm_upstream_calls", "Llamadas a Gemini por resultado", ("outcome",)
+)
+_upstream_retries = metrics.counter("aluna_llm_upstream_retries", "Reintentos de llamadas a Gemini")
+_upstream_errors = metrics.counter(
+    "aluna_llm_upstream_errors", "Excepciones de llamadas a Gemini por tipo", ("kind",)
+)
+_upstream_latency = metrics.histogram(
+    "aluna_llm_upstream_duration_seconds", "Duración de cada llamada a generate_content (segundos)"
+)
+
+# finish_reason de Gemini que bloquean la respuesta -> resultado en métricas
+_BLOCKED_OUTCOMES = {2: "blocked_safety", 3: "blocked_recitation", 4: "blocked_other"}
+
+
+def _error_kind(error_message: str) -> str:
+    """Clasifica el mensaje de error para las métricas."""
+    if "api key" in error_message or "authentication" in error_message:
+        return "auth"
+    if "permission" in error_message or "forbidden" in error_message:
+        return "permission"
+    if "quota" in error_message or "limit" in error_message:
+        return "quota"
+    if "network" in error_message or "connection" in error_message:
+        return "network"
+    if "500" in error_message or "internal error" in error_message or "server error" in error_message:
+        return "server"
+    return "other"
 
 
 class GoogleAIClient:
@@ -28,11 +61,11 @@ class GoogleAIClient:
         self.model = None
         
         if not self.api_key:
-            print("⚠️ GOOGLE_AI_API_KEY no configurada")
+            log.warning("⚠️ GOOGLE_AI_API_KEY no configurada")
             return
             
         if not self.model_name:
-            print("⚠️ GOOGLE_AI_MODEL no configurado")
+            log.warning("⚠️ GOOGLE_AI_MODEL no configurado")
             return
             
         try:
@@ -61,13 +94,10 @@ class GoogleAIClient:
                 system_instruction=self._build_system_instruction()
             )
             
-            print(
-                f"🤖 Cliente Google AI inicializado - Modelo: {self.model_name} | "
-                f"Seguridad: {AI_SAFETY_MODE}"
-            )
+            log.info("🤖 Cliente Google AI inicializado", model=self.model_name, safety=AI_SAFETY_MODE)
             
         except Exception as e:
-            print(f"❌ Error inicializando Google AI: {e}")
+            log.error("❌ Error inicializando Google AI", error=str(e))
             self.model = None
     
     def _build_system_instruction(self) -> str:
@@ -123,17 +153,23 @@ class GoogleAIClient:
                 if attempt > 0:
                     # Esperar con backoff exponencial
                     wait_time = (2 ** attempt) + random.uniform(0, 1)
-                    print(f"🔄 Reintento {attempt}/{max_retries} en {wait_time:.1f}s...")
+                    _upstream_retries.inc()
+                    log.warning("🔄 Reintento", attempt=attempt, max_retries=max_retries, wait_s=wait_time)
                     time.sleep(wait_time)
                 
-                print(f"🤖 Enviando solicitud a Google AI Studio (Gemini)... (intento {attempt + 1})")
+                log.debug("🤖 Enviando solicitud a Google AI Studio (Gemini)...", attempt=attempt + 1)
                 
                 # Generar respuesta
-                response = self.model.generate_content(prompt)
+                started = time.perf_counter()
+                try:
+                    response = self.model.generate_content(prompt)
+                finally:
+                    _upstream_latency.observe(time.perf_counter() - started)
                 
                 # Verificar si hay candidatos en la respuesta
                 if not response.candidates:
-                    print("⚠️ No hay candidatos en la respuesta")
+                    _upstream_calls.inc(outcome="no_candidates")
+                    log.warning("⚠️ No hay candidatos en la respuesta", attempt=attempt + 1)
                     if attempt < max_retries:
                         continue
                     return "Lo siento, no pude generar una respuesta. Por favor, reformula tu pregunta."
@@ -143,19 +179,22 @@ class GoogleAIClient:
                 
                 # Verificar el motivo de finalización
                 finish_reason = candidate.finish_reason
+                if finish_reason in _BLOCKED_OUTCOMES:
+                    _upstream_calls.inc(outcome=_BLOCKED_OUTCOMES[finish_reason])
                 if finish_reason == 2:  # SAFETY
-                    print("⚠️ Respuesta bloqueada por filtros de seguridad")
+                    log.warning("⚠️ Respuesta bloqueada por filtros de seguridad")
                     return "Lo siento, no puedo procesar esa solicitud por razones de seguridad. Por favor, reformula tu pregunta de manera más específica."
                 elif finish_reason == 3:  # RECITATION
-                    print("⚠️ Respuesta bloqueada por recitación")
+                    log.warning("⚠️ Respuesta bloqueada por recitación")
                     return "Lo siento, no puedo proporcionar esa información. Por favor, haz una pregunta diferente."
                 elif finish_reason == 4:  # OTHER
-                    print("⚠️ Respuesta bloqueada por otras razones")
+                    log.warning("⚠️ Respuesta bloqueada por otras razones")
                     return "Lo siento, no pude completar tu solicitud. Por favor, intenta con una pregunta diferente."
                 
                 # Verificar si hay contenido en las partes
                 if not candidate.content or not candidate.content.parts:
-                    print("⚠️ No hay contenido en la respuesta")
+                    _upstream_calls.inc(outcome="empty")
+                    log.warning("⚠️ No hay contenido en la respuesta", attempt=attempt + 1)
                     if attempt < max_retries:
                         continue
                     return "Lo siento, no pude generar una respuesta completa. Por favor, intenta de nuevo."
@@ -164,25 +203,30 @@ class GoogleAIClient:
                 try:
                     response_text = candidate.content.parts[0].text
                     if not response_text or response_text.strip() == "":
-                        print("⚠️ Respuesta vacía")
+                        _upstream_calls.inc(outcome="empty")
+                        log.warning("⚠️ Respuesta vacía", attempt=attempt + 1)
                         if attempt < max_retries:
                             continue
                         return "Lo siento, la respuesta está vacía. Por favor, reformula tu pregunta."
                     
-                    print(f"✅ Respuesta recibida de Google AI Studio")
+                    _upstream_calls.inc(outcome="ok")
+                    log.debug("✅ Respuesta recibida de Google AI Studio", attempt=attempt + 1)
                     return response_text.strip()
                 except (AttributeError, IndexError) as e:
-                    print(f"⚠️ Error accediendo al texto de la respuesta: {e}")
+                    _upstream_calls.inc(outcome="malformed")
+                    log.warning("⚠️ Error accediendo al texto de la respuesta", error=str(e))
                     if attempt < max_retries:
                         continue
                     return "Lo siento, hubo un problema procesando la respuesta. Por favor, intenta de nuevo."
                     
             except Exception as e:
                 last_error = e
-                print(f"❌ Error generando respuesta (intento {attempt + 1}): {e}")
+                log.error("❌ Error generando respuesta", attempt=attempt + 1, error=str(e))
                 
                 # Manejo específico de errores comunes
                 error_message = str(e).lower()
+                _upstream_calls.inc(outcome="error")
+                _upstream_errors.inc(kind=_error_kind(error_message))
                 
                 # Errores que no deben reintentar
                 if any(keyword in error_message for keyword in ["api key", "authentication", "permission", "forbidden"]):
@@ -310,30 +354,30 @@ class GoogleAIClient:
             for model in genai.list_models():
                 model_name = model.name
                 available_models.append(model_name)
-                print(f"📋 Modelo disponible: {model_name}")
+                log.debug("📋 Modelo disponible", model=model_name)
             
             # Buscar el primer modelo de nuestra lista que esté disponible
             for preferred_model in models_to_try:
                 for available_model in available_models:
                     if preferred_model in available_model or available_model.endswith(preferred_model):
-                        print(f"✅ Usando modelo: {available_model}")
+                        log.info("✅ Usando modelo", model=available_model)
                         return available_model
                         
         except Exception as e:
-            print(f"⚠️ No se pudieron listar modelos: {e}")
+            log.warning("⚠️ No se pudieron listar modelos", error=str(e))
         
         # Si no se puede listar, probar modelos uno por uno
         for model_name in models_to_try:
             try:
                 # Intentar crear un modelo temporal para verificar
                 test_model = genai.GenerativeModel(model_name=model_name)
-                print(f"✅ Modelo verificado: {model_name}")
+                log.info("✅ Modelo verificado", model=model_name)
                 return model_name
             except Exception as e:
-                print(f"⚠️ Error probando modelo {model_name}: {e}")
+                log.warning("⚠️ Error probando modelo", model=model_name, error=str(e))
                 continue
         
         # Si ningún modelo funciona, usar gemini-1.5-flash como fallback
         fallback_model = "gemini-1.5-flash"
-        print(f"⚠️ Usando modelo por defecto: {fallback_model}")
+        log.warning("⚠️ Usando modelo por defecto", model=fallback_model)
         return fallback_model
\ No newline at end of file
@@ -7,11 +7,13 @@ from config import SERVER_HOST, SERVER_PORT, DEBUG_MODE
 from routes.chat_routes import register_chat_routes
 from routes.aluna_routes import register_origen_routes
 from routes.conversation_routes import register_conversation_routes
+from routes.metrics_routes import register_metrics_routes
 
 # Importar módulos de funcionalidades adicionales
 from routes.upload_routes import register_upload_routes
 from routes.vision_routes import vision_bp
 from scripts.reset_embeddings import registrar_ruta_reset
+from services.tracing import init_tracing
 
 
 def create_app() -> Flask:
@@ -23,10 +25,14 @@ def create_app() -> Flask:
     """
     app = Flask(__name__)
     
+    # Trazas por solicitud (cabecera Server-Timing y registro de trazas)
+    init_tracing(app)
+    
     # Registrar rutas principales de chat
     register_chat_routes(app)
     register_origen_routes(app)
     register_conversation_routes(app)
+    register_metrics_routes(app)
     
     # Registrar rutas adicionales de otros módulos
     register_upload_routes(app)
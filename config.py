@@ -71,11 +71,104 @@ HYBRID_MIN_SIMILARITY = float(os.getenv("HYBRID_MIN_SIMILARITY", "0.35"))
 # ------------------------
 # CONFIGURACIÓN DE MEMORIA SEMÁNTICA
 # ------------------------
+# Pickle del formato anterior; se migra automáticamente al snapshot + registro
 MEMORY_FILE = os.getenv("MEMORY_FILE", "data/semantic_memory.pkl")
+# Snapshot compacto (vectores binarios + metadatos) y registro de cambios de solo-anexado
+MEMORY_SNAPSHOT_FILE = os.getenv("MEMORY_SNAPSHOT_FILE", os.path.splitext(MEMORY_FILE)[0] + ".npz")
+MEMORY_LOG_FILE = os.getenv("MEMORY_LOG_FILE", os.path.splitext(MEMORY_FILE)[0] + ".log.jsonl")
+# Registros acumulados tras los cuales se compacta el registro en segundo plano
+MEMORY_COMPACT_EVERY = int(os.getenv("MEMORY_COMPACT_EVERY", "1000"))
 # Umbral de similitud para responder desde memoria (0 a 1)
 MEMORY_SIMILARITY_THRESHOLD = float(os.getenv("MEMORY_SIMILARITY_THRESHOLD", "0.85"))
 # Top K opcional para explotar varios candidatos en memoria
 MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "3"))
+# Capacidad inicial de la matriz de embeddings (crece duplicándose)
+MEMORY_INITIAL_CAPACITY = int(os.getenv("MEMORY_INITIAL_CAPACITY", "256"))
+# Máximo de entradas en memoria (0 = sin límite) y política de desalojo: lru | lfu | ttl | cost
+MEMORY_MAX_ENTRIES = int(os.getenv("MEMORY_MAX_ENTRIES", "5000"))
+MEMORY_EVICTION_POLICY = os.getenv("MEMORY_EVICTION_POLICY", "lru").lower()
+# Vida máxima de una entrada en segundos desde su creación (0 = sin vencimiento)
+MEMORY_TTL_SECONDS = float(os.getenv("MEMORY_TTL_SECONDS", "0"))
+# Máximo de entradas vencidas retiradas por operación (desalojo incremental)
+MEMORY_EVICTION_BATCH = int(os.getenv("MEMORY_EVICTION_BATCH", "32"))
+# Prefijo de los bancos de preguntas oficiales en KNOWLEDGE_DIR (importados como entradas fijadas)
+QUESTION_BANK_PREFIX = os.getenv("QUESTION_BANK_PREFIX", "BANCO DE PREGUNTAS")
+
+# ------------------------
+# COALESCENCIA DE PREGUNTAS EN VUELO
+# ------------------------
+# Agrupa preguntas idénticas concurrentes para que compartan una sola llamada al modelo
+CHAT_COALESCING_ENABLED = os.getenv("CHAT_COALESCING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Segundos máximos que una pregunta duplicada espera a la solicitud líder
+CHAT_COALESCING_TIMEOUT = float(os.getenv("CHAT_COALESCING_TIMEOUT", "90"))
+
+# ------------------------
+# EJECUCIÓN CONCURRENTE DEL FLUJO DE CHAT
+# ------------------------
+# Ejecuta seguridad/historial/memoria/recuperación como etapas concurrentes en un pool de hilos
+CHAT_PIPELINE_ENABLED = os.getenv("CHAT_PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Hilos del pool compartido entre solicitudes
+CHAT_PIPELINE_WORKERS = int(os.getenv("CHAT_PIPELINE_WORKERS", "8"))
+
+# ------------------------
+# TRAZAS DE LATENCIA
+# ------------------------
+# Tramos por etapa, cabecera Server-Timing e histogramas de latencia en proceso
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Registro JSONL con una traza por solicitud (vacío = desactivado)
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", os.path.join("logs", "traces.jsonl"))
+# Solo se registran solicitudes que tarden al menos estos milisegundos
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+
+# ------------------------
+# REGISTRO (LOGS)
+# ------------------------
+# Nivel global de los loggers "aluna.*" (DEBUG muestra diagnósticos detallados por solicitud)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Niveles por módulo, p. ej. "aluna.chat=DEBUG,aluna.llm=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Formato de consola: text | json
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Archivo JSONL adicional (vacío = solo consola)
+LOG_FILE = os.getenv("LOG_FILE", "")
+# Registros en espera del hilo escritor; si se llena se descartan en lugar de bloquear
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# ------------------------
+# MÉTRICAS (PROMETHEUS)
+# ------------------------
+# Directorio compartido por los workers para combinar métricas (vacío = un solo proceso)
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+# Cada cuántos segundos vuelca cada proceso sus métricas al directorio compartido
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+
+# ------------------------
+# ALMACENAMIENTO (HISTORIAL, CONVERSACIONES Y MEMORIA SEMÁNTICA)
+# ------------------------
+# Backend de persistencia: files (archivos por almacén) | sqlite (una base compartida
+# por todos los workers; migrar antes con `python -m scripts.migrate_storage`)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files").lower()
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", os.path.join("data", "aluna.db"))
+# PRAGMA synchronous en modo WAL: NORMAL (puede perder las últimas transacciones ante un
+# corte de energía, nunca corrompe) | FULL (sincroniza cada transacción)
+STORAGE_SQLITE_SYNCHRONOUS = os.getenv("STORAGE_SQLITE_SYNCHRONOUS", "NORMAL").upper()
+# Milisegundos que espera una escritura mientras otro proceso tiene el lock de la base
+STORAGE_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("STORAGE_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Directorio de conversaciones del backend de archivos
+CONVERSATIONS_DIR = os.getenv("CONVERSATIONS_DIR", "conversations")
+# Cambios del índice de metadatos de conversaciones tras los que se reescribe su snapshot
+CONVERSATIONS_INDEX_COMPACT_EVERY = int(os.getenv("CONVERSATIONS_INDEX_COMPACT_EVERY", "500"))
+# Caché write-behind de ConversationManager: conversaciones recientes en memoria
+# (0 = sin caché, cada cambio se escribe de inmediato). Con varios workers, cada uno
+# tiene su caché: usar afinidad de sesión en el balanceador o desactivarla
+CONVERSATIONS_CACHE_MAX = int(os.getenv("CONVERSATIONS_CACHE_MAX", "1000"))
+# Ventana de durabilidad: segundos máximos que un cambio espera en memoria antes de
+# escribirse (0 = escribir en cada cambio). Al cerrar el proceso se escribe todo
+CONVERSATIONS_FLUSH_SECONDS = float(os.getenv("CONVERSATIONS_FLUSH_SECONDS", "1"))
+# Índice de búsqueda de texto completo sobre los mensajes (/api/conversations/search).
+# Con archivos se construye al iniciar leyendo todas las conversaciones y cada worker
+# mantiene el suyo; con SQLite vive en la base (FTS5) y lo comparten todos los workers
+CONVERSATIONS_SEARCH_ENABLED = os.getenv("CONVERSATIONS_SEARCH_ENABLED", "true").lower() in ("1", "true", "yes")
 
 # ------------------------
 # HISTORIAL DE CHAT (PERSISTENCIA)
@@ -85,6 +178,50 @@ HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
 HISTORY_FILE = os.getenv("HISTORY_FILE", os.path.join(HISTORY_DIR, "chat_history.jsonl"))
 # Límite de turnos recientes a incluir en el prompt
 HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "8"))
+# Caché en memoria de turnos recientes: límite de sesiones y de MB (LRU) y turnos por sesión
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "5000"))
+HISTORY_CACHE_MAX_MB = float(os.getenv("HISTORY_CACHE_MAX_MB", "32"))
+HISTORY_CACHE_TURNS = int(os.getenv("HISTORY_CACHE_TURNS", str(HISTORY_MAX_TURNS)))
+# Franjas de locks por sesión para la caché (las sesiones de franjas distintas no se bloquean)
+HISTORY_LOCK_STRIPES = int(os.getenv("HISTORY_LOCK_STRIPES", "16"))
+# Sincronización a disco de las escrituras agrupadas del historial:
+#   always   = fsync antes de confirmar cada lote (no se pierde nada ante un corte de energía)
+#   interval = fsync como máximo cada HISTORY_FSYNC_INTERVAL_SECONDS (se pueden perder esos segundos)
+#   never    = lo decide el sistema operativo
+# En todos los casos una caída del proceso no pierde turnos confirmados.
+HISTORY_FSYNC = os.getenv("HISTORY_FSYNC", "interval").lower()
+HISTORY_FSYNC_INTERVAL_SECONDS = float(os.getenv("HISTORY_FSYNC_INTERVAL_SECONDS", "1"))
+# Índice persistente sesión -> posiciones en el archivo; se guarda cada N turnos nuevos y al salir
+HISTORY_INDEX_SAVE_EVERY = int(os.getenv("HISTORY_INDEX_SAVE_EVERY", "500"))
+# El registro se divide en segmentos; se abre uno nuevo al superar este tamaño o antigüedad
+HISTORY_SEGMENT_MAX_MB = float(os.getenv("HISTORY_SEGMENT_MAX_MB", "64"))
+HISTORY_SEGMENT_MAX_HOURS = float(os.getenv("HISTORY_SEGMENT_MAX_HOURS", "24"))
+# Cada cuántos segundos revisa el compactador los segmentos cerrados (0 = solo manual)
+HISTORY_COMPACT_INTERVAL_SECONDS = float(os.getenv("HISTORY_COMPACT_INTERVAL_SECONDS", "300"))
+# Comprimir con zstd los segmentos cerrados sin cambios en estas horas (requiere `zstandard`)
+HISTORY_COMPRESS_COLD = os.getenv("HISTORY_COMPRESS_COLD", "true").lower() in ("1", "true", "yes")
+HISTORY_COMPRESS_AFTER_HOURS = float(os.getenv("HISTORY_COMPRESS_AFTER_HOURS", "24"))
+# Días que se conservan los segmentos cerrados (0 = sin límite)
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+
+# ------------------------
+# ALERTAS DEL PROTOCOLO DE SEGURIDAD
+# ------------------------
+# Webhook que recibe las alertas de alto riesgo (vacío = solo quedan en el outbox local)
+SAFETY_ALERT_WEBHOOK_URL = os.getenv("SAFETY_ALERT_WEBHOOK_URL", "")
+# Token opcional enviado como "Authorization: Bearer <token>"
+SAFETY_ALERT_WEBHOOK_TOKEN = os.getenv("SAFETY_ALERT_WEBHOOK_TOKEN", "")
+# Registro de solo-anexado con las alertas y su estado de entrega
+SAFETY_ALERT_OUTBOX_FILE = os.getenv("SAFETY_ALERT_OUTBOX_FILE", os.path.join("alerts", "safety_outbox.jsonl"))
+# Segundos máximos por intento de entrega
+SAFETY_ALERT_TIMEOUT = float(os.getenv("SAFETY_ALERT_TIMEOUT", "5"))
+# Intentos antes de marcar la alerta como fallida
+SAFETY_ALERT_MAX_ATTEMPTS = int(os.getenv("SAFETY_ALERT_MAX_ATTEMPTS", "8"))
+# Espera exponencial entre intentos: base * 2^(intento-1), con tope
+SAFETY_ALERT_RETRY_BASE_SECONDS = float(os.getenv("SAFETY_ALERT_RETRY_BASE_SECONDS", "2"))
+SAFETY_ALERT_RETRY_MAX_SECONDS = float(os.getenv("SAFETY_ALERT_RETRY_MAX_SECONDS", "300"))
+# Días que se conservan las alertas ya resueltas al compactar el outbox
+SAFETY_ALERT_RETENTION_DAYS = float(os.getenv("SAFETY_ALERT_RETENTION_DAYS", "30"))
 
 # ------------------------
 # CONFIGURACIÓN DE SEGURIDAD DE IA
@@ -139,6 +276,22 @@ UNIVERSIDAD_KEYWORDS = [
     "docente", "profesor", "materia", "facultad", "admisión", "matrícula", "grado"
 ]
 
+# ------------------------
+# RESPUESTAS NEGATIVAS
+# ------------------------
+# Frases que delatan una respuesta sin información útil: no se guardan ni se sirven desde memoria
+NEGATIVE_ANSWER_MARKERS = [
+    "no tengo información suficiente",
+    "no puedo responder",
+    "no puedo proporcionar",
+    "no pude generar una respuesta",
+    "no dispongo de las regulaciones",
+    "no está en mi contexto",
+    "te aconsejo consultar",
+    "consulta el reglamento",
+    "consulta con la oficina",
+]
+
 # ------------------------
 # CONFIGURACIÓN DEL SERVIDOR
 # ------------------------
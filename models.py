@@ -3,6 +3,7 @@ Modelos y tipos de datos para el chatbot IguiChat
 """
 from typing import List, Tuple, Optional, Dict, Any
 from dataclasses import dataclass, field
+import uuid
 import numpy as np
 from time import time
 
@@ -61,6 +62,9 @@ class SearchResult:
     has_relevant_content: bool
     # Mejor similitud encontrada para la pregunta (0..1). Útil para decisiones híbridas.
     best_similarity: float = 0.0
+    # Ids de los fragmentos usados como contexto y versión del índice consultado
+    chunk_ids: List[str] = field(default_factory=list)
+    index_version: str = ""
 
 @dataclass
 class ChatRequest:
@@ -68,13 +72,17 @@ class ChatRequest:
     question: str
     # Identificador de sesión para historial/persistencia
     session_id: Optional[str] = None
+    # Conversación del sidebar: si se indica, el turno se registra allí y el historial
+    # del prompt se lee de ella (en lugar del historial por sesión)
+    conversation_id: Optional[str] = None
     
     @classmethod
     def from_json(cls, data: Dict[str, Any]) -> 'ChatRequest':
         """Crea instancia desde JSON"""
         return cls(
             question=data.get("question", "").strip(),
-            session_id=(data.get("session_id") or None)
+            session_id=(data.get("session_id") or None),
+            conversation_id=(data.get("conversation_id") or None)
         )
 
 @dataclass
@@ -123,6 +131,8 @@ class SafetyProtocolResult:
     label: str = ""
     recommendations: List[str] = field(default_factory=list)
     alert_required: bool = False
+    # Coincidencias de todos los niveles, en orden de prioridad
+    level_matches: Dict[str, List[str]] = field(default_factory=dict)
 
 
 @dataclass
@@ -156,6 +166,11 @@ class MemoryEntry:
     - last_used_at: último uso (segundos)
     - usage_count: número de veces que fue reutilizada
     - last_score: última similitud usada para hit
+    - id: identificador estable usado por el registro de persistencia
+    - chunk_ids: fragmentos/documentos en los que se fundamentó la respuesta
+    - index_version: versión del índice de conocimiento vigente al crearla
+    - pinned: entrada oficial (banco de preguntas) que nunca se desaloja ni vence
+    - source: archivo de origen de las entradas importadas
     """
     question: str
     answer: str
@@ -163,4 +178,18 @@ class MemoryEntry:
     created_at: float = time()
     last_used_at: float = time()
     usage_count: int = 0
-    last_score: float = 0.0
\ No newline at end of file
+    last_score: float = 0.0
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    chunk_ids: List[str] = field(default_factory=list)
+    index_version: str = ""
+    pinned: bool = False
+    source: str = ""
+
+@dataclass
+class QAPair:
+    """Par pregunta/respuesta de un banco de preguntas oficial"""
+    question: str
+    answer: str
+    # Archivo de origen y referencia normativa (p. ej. "Acuerdo 027 de 2023, Artículo 6")
+    source: str = ""
+    reference: str = ""
@@ -7,6 +7,7 @@ from sklearn.metrics.pairwise import cosine_similarity
 from models import Document, SearchResult, EmbeddingData
 from config import DEFAULT_TOP_K, MIN_SIMILARITY_THRESHOLD, RETRIEVAL_MAX_FRAGMENT_CHARS
 from rag.embedding_manager import EmbeddingManager
+from services.tracing import span
 
 
 class ContextSearchService:
@@ -43,7 +44,8 @@ class ContextSearchService:
             )
         
         # Obtener o generar embeddings
-        embedding_data = self.embedding_manager.get_or_generate_embeddings(documents)
+        with span("retrieval.load_index"):
+            embedding_data = self.embedding_manager.get_or_generate_embeddings(documents)
         
         if not embedding_data or len(embedding_data.embeddings) == 0:
             return SearchResult(
@@ -55,17 +57,20 @@ class ContextSearchService:
             )
         
         # Codificar la pregunta
-        question_embedding = self.embedding_manager.encode_query(question)
+        with span("retrieval.encode"):
+            question_embedding = self.embedding_manager.encode_query(question)
         
         # Calcular similitudes
-        similarities = cosine_similarity(
-            question_embedding, 
-            embedding_data.embeddings
-        )[0]
+        with span("retrieval.similarity", chunks=len(embedding_data.texts)) as attrs:
+            similarities = cosine_similarity(
+                question_embedding, 
+                embedding_data.embeddings
+            )[0]
 
-        # Obtener índices de los fragmentos más relevantes
-        top_indices = similarities.argsort()[-top_k:][::-1]
-        best_similarity = float(similarities[top_indices[0]]) if len(top_indices) > 0 else 0.0
+            # Obtener índices de los fragmentos más relevantes
+            top_indices = similarities.argsort()[-top_k:][::-1]
+            best_similarity = float(similarities[top_indices[0]]) if len(top_indices) > 0 else 0.0
+            attrs["best_similarity"] = round(best_similarity, 4)
         
         # Filtrar por umbral de similitud (más permisivo)
         relevant_indices = [
@@ -88,6 +93,7 @@ class ContextSearchService:
         
         context = "\n\n".join(context_parts)
         has_relevant_content = len(relevant_indices) > 0
+        chunk_ids = embedding_data.meta.get("chunk_ids") or []
         
         return SearchResult(
             context=context,
@@ -95,6 +101,8 @@ class ContextSearchService:
             relevant_indices=relevant_indices,
             has_relevant_content=has_relevant_content,
             best_similarity=best_similarity,
+            chunk_ids=[chunk_ids[idx] for idx in relevant_indices if idx < len(chunk_ids)],
+            index_version=embedding_data.meta.get("index_version", ""),
         )
     
     def search_context_legacy(
@@ -3,10 +3,65 @@ Gestor de embeddings para el sistema RAG
 """
 import os
 import pickle
-from typing import List, Optional
+import hashlib
+from typing import List, Optional, Set
 from sentence_transformers import SentenceTransformer
 from models import EmbeddingData, Document
 from config import EMBEDDINGS_FILE, EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.embeddings")
+
+
+def compute_chunk_id(filename: str, text: str) -> str:
+    """Identificador estable de un fragmento: depende solo de su archivo y contenido."""
+    digest = hashlib.md5()
+    digest.update(filename.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def compute_document_id(filename: str, content: str) -> str:
+    """Identificador estable de un documento completo (usado por coincidencias textuales)."""
+    return "doc:" + compute_chunk_id(filename, content)
+
+
+def compute_index_version(chunk_ids: List[str]) -> str:
+    """Versión del índice: huella del conjunto de fragmentos indexados."""
+    digest = hashlib.md5()
+    for chunk_id in sorted(chunk_ids):
+        digest.update(chunk_id.encode("ascii"))
+    return digest.hexdigest()[:12]
+
+
+def _document_hashes(documents: List[Document]) -> dict:
+    return {
+        doc.filename: hashlib.md5(doc.content.encode("utf-8")).hexdigest()
+        for doc in documents
+    }
+
+
+def ensure_chunk_metadata(embedding_data: EmbeddingData) -> EmbeddingData:
+    """Completa `chunk_ids` e `index_version` en índices generados antes de existir."""
+    meta = embedding_data.meta
+    if len(meta.get("chunk_ids") or []) != len(embedding_data.texts):
+        meta["chunk_ids"] = [
+            compute_chunk_id(filename, text)
+            for filename, text in zip(embedding_data.filenames, embedding_data.texts)
+        ]
+        meta["index_version"] = compute_index_version(meta["chunk_ids"])
+    elif not meta.get("index_version"):
+        meta["index_version"] = compute_index_version(meta["chunk_ids"])
+    return embedding_data
+
+
+def live_knowledge_ids(documents: List[Document], embedding_data: Optional[EmbeddingData]) -> Set[str]:
+    """Ids de fragmentos y documentos vigentes, para invalidar memoria desactualizada."""
+    live: Set[str] = {compute_document_id(doc.filename, doc.content) for doc in documents}
+    if embedding_data is not None:
+        live.update(ensure_chunk_metadata(embedding_data).meta.get("chunk_ids", []))
+    return live
 
 
 class EmbeddingManager:
@@ -15,7 +70,7 @@ class EmbeddingManager:
     def __init__(self):
         """Inicializa el gestor de embeddings"""
         self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        print(f"🤖 Modelo de embeddings cargado: {EMBEDDING_MODEL_NAME}")
+        log.info("🤖 Modelo de embeddings cargado", model=EMBEDDING_MODEL_NAME)
     
     def save_embeddings(self, embedding_data: EmbeddingData) -> None:
         """
@@ -30,9 +85,9 @@ class EmbeddingManager:
             
             with open(EMBEDDINGS_FILE, "wb") as f:
                 pickle.dump(embedding_data.to_dict(), f)
-            print(f"💾 Embeddings guardados en: {EMBEDDINGS_FILE}")
+            log.info("💾 Embeddings guardados", path=EMBEDDINGS_FILE)
         except Exception as e:
-            print(f"❌ Error guardando embeddings: {e}")
+            log.error("❌ Error guardando embeddings", error=str(e))
     
     def load_embeddings(self) -> Optional[EmbeddingData]:
         """
@@ -42,16 +97,16 @@ class EmbeddingManager:
             Datos de embeddings o None si no existen
         """
         if not os.path.exists(EMBEDDINGS_FILE):
-            print(f"⚠️ Archivo de embeddings no existe: {EMBEDDINGS_FILE}")
+            log.warning("⚠️ Archivo de embeddings no existe", path=EMBEDDINGS_FILE)
             return None
             
         try:
             with open(EMBEDDINGS_FILE, "rb") as f:
                 data = pickle.load(f)
-            print(f"📥 Embeddings cargados desde: {EMBEDDINGS_FILE}")
-            return EmbeddingData.from_dict(data)
+            log.info("📥 Embeddings cargados", path=EMBEDDINGS_FILE)
+            return ensure_chunk_metadata(EmbeddingData.from_dict(data))
         except Exception as e:
-            print(f"❌ Error cargando embeddings: {e}")
+            log.error("❌ Error cargando embeddings", error=str(e))
             return None
     
     def generate_embeddings(self, documents: List[Document]) -> EmbeddingData:
@@ -65,7 +120,7 @@ class EmbeddingManager:
             Datos de embeddings generados
         """
         if not documents:
-            print("⚠️ No hay documentos para generar embeddings")
+            log.warning("⚠️ No hay documentos para generar embeddings")
             return EmbeddingData(embeddings=[], filenames=[], texts=[])
         
         # Crear chunks por documento para mejorar el recall y la precisión
@@ -95,8 +150,9 @@ class EmbeddingManager:
             filenames.extend([doc.filename] * len(doc_chunks))
         
         try:
-            print(f"🔄 Generando embeddings para {len(documents)} documentos...")
+            log.info("🔄 Generando embeddings...", documents=len(documents))
             doc_embeddings = self.model.encode(texts, show_progress_bar=True)
+            chunk_ids = [compute_chunk_id(filename, text) for filename, text in zip(filenames, texts)]
             
             embedding_data = EmbeddingData(
                 embeddings=doc_embeddings,
@@ -107,17 +163,20 @@ class EmbeddingManager:
                     "chunk_size": CHUNK_SIZE,
                     "chunk_overlap": CHUNK_OVERLAP,
                     "doc_count": len(documents),
+                    "doc_hashes": _document_hashes(documents),
+                    "chunk_ids": chunk_ids,
+                    "index_version": compute_index_version(chunk_ids),
                 }
             )
             
             # Guardar automáticamente
             self.save_embeddings(embedding_data)
-            print("✅ Embeddings generados y guardados exitosamente")
+            log.info("✅ Embeddings generados y guardados exitosamente")
             
             return embedding_data
             
         except Exception as e:
-            print(f"❌ Error generando embeddings: {e}")
+            log.error("❌ Error generando embeddings", error=str(e))
             return EmbeddingData(embeddings=[], filenames=[], texts=[])
     
     def get_or_generate_embeddings(self, documents: List[Document]) -> Optional[EmbeddingData]:
@@ -139,17 +198,22 @@ class EmbeddingManager:
             meta.get("chunk_size") == CHUNK_SIZE and \
             meta.get("chunk_overlap") == CHUNK_OVERLAP
 
+        # Detectar documentos cuyo contenido cambió aunque conserven el nombre
+        stored_hashes = meta.get("doc_hashes")
+        content_changed = bool(stored_hashes) and stored_hashes != _document_hashes(documents)
+
         needs_regeneration = (
             embedding_data is None or
             set(embedding_data.filenames) != current_files or
-            not strategy_ok
+            not strategy_ok or
+            content_changed
         )
         
         if needs_regeneration:
-            print("🔄 Regenerando embeddings debido a cambios en documentos...")
+            log.info("🔄 Regenerando embeddings debido a cambios en documentos...")
             embedding_data = self.generate_embeddings(documents)
         else:
-            print("✅ Usando embeddings existentes")
+            log.debug("✅ Usando embeddings existentes")
         
         return embedding_data
     
@@ -163,4 +227,17 @@ class EmbeddingManager:
         Returns:
             Embedding de la consulta
         """
-        return self.model.encode([query])
\ No newline at end of file
+        return self.model.encode([query])
+
+    def encode_queries(self, queries: List[str], batch_size: int = 64):
+        """
+        Codifica varias consultas en una sola pasada por lotes
+        
+        Args:
+            queries: Textos a codificar
+            batch_size: Tamaño de lote para el modelo
+            
+        Returns:
+            Matriz de embeddings de forma (N, D)
+        """
+        return self.model.encode(list(queries), batch_size=batch_size, show_progress_bar=False)
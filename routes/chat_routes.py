@@ -4,6 +4,10 @@ Rutas de la API para el chat
 from flask import Blueprint, request, jsonify
 from models import ChatRequest
 from services.chat_service import ChatService
+from services.tracing import latency_snapshot
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.routes.chat")
 
 # Crear blueprint para las rutas de chat
 chat_bp = Blueprint('chat', __name__)
@@ -28,7 +32,9 @@ def chat():
     Acepta:
     {
         "question": "string",
-        "session_id": "string?"  // opcional para historial persistente
+        "session_id": "string?",      // opcional para historial persistente
+        "conversation_id": "string?"  // opcional: registra pregunta y respuesta en la
+                                      // conversación del sidebar y usa su historial
     }
     
     Retorna:
@@ -54,7 +60,7 @@ def chat():
         return jsonify(response.to_dict())
         
     except Exception as e:
-        print(f"❌ Error en endpoint de chat: {e}")
+        log.exception("❌ Error en endpoint de chat", error=str(e))
         return jsonify({
             "answer": "Lo siento, ocurrió un error procesando tu pregunta."
         }), 500
@@ -67,22 +73,27 @@ def get_history():
 
     Parámetros query:
       - session_id: id de sesión
-      - limit: número máximo de turnos a retornar (por defecto 8)
+      - conversation_id: id de conversación del sidebar (en lugar de session_id)
+      - limit: número máximo de turnos a retornar (por defecto 8; 0 = historial completo)
     """
     try:
         session_id = request.args.get("session_id", type=str)
+        conversation_id = request.args.get("conversation_id", type=str)
         limit = request.args.get("limit", default=8, type=int)
-        if not session_id:
+        if not session_id and not conversation_id:
             return jsonify({"history": []})
         service = init_chat_service()
-        turns = service.history_store.get_recent(session_id, limit=max(1, limit))
+        if conversation_id:
+            turns = service.conversations.recent_turns(conversation_id, limit=max(0, limit))
+        else:
+            turns = service.history_store.get_recent(session_id, limit=max(0, limit))
         return jsonify({
             "history": [
                 {"role": t.role, "content": t.content, "timestamp": t.timestamp} for t in turns
             ]
         })
     except Exception as e:
-        print(f"❌ Error obteniendo historial: {e}")
+        log.exception("❌ Error obteniendo historial", error=str(e))
         return jsonify({"history": [], "error": str(e)}), 500
 
 
@@ -101,7 +112,7 @@ def clear_history():
         removed = service.history_store.clear(session_id)
         return jsonify({"message": "Historial limpiado", "removed": removed})
     except Exception as e:
-        print(f"❌ Error limpiando historial: {e}")
+        log.exception("❌ Error limpiando historial", error=str(e))
         return jsonify({"message": "Error limpiando historial", "error": str(e)}), 500
 
 
@@ -128,13 +139,26 @@ def health():
         })
         
     except Exception as e:
-        print(f"❌ Error en health check: {e}")
+        log.exception("❌ Error en health check", error=str(e))
         return jsonify({
             "status": "error",
             "details": {"error": str(e)}
         }), 500
 
 
+@chat_bp.route("/api/chat/latency", methods=["GET"])
+def latency():
+    """
+    Histogramas de latencia por etapa (ms) acumulados en este proceso
+    
+    Retorna:
+    {
+        "stages": {"retrieval": {"count": int, "p50_ms": float, "p95_ms": float, ...}, ...}
+    }
+    """
+    return jsonify({"stages": latency_snapshot()})
+
+
 @chat_bp.route("/api/chat/test-google-ai", methods=["GET"])
 def test_google_ai():
     """
@@ -160,7 +184,7 @@ def test_google_ai():
         })
         
     except Exception as e:
-        print(f"❌ Error en test de Google AI: {e}")
+        log.exception("❌ Error en test de Google AI", error=str(e))
         return jsonify({
             "status": "error",
             "message": f"Error en prueba de conexión: {str(e)}"
@@ -189,13 +213,86 @@ def reload_documents():
         })
         
     except Exception as e:
-        print(f"❌ Error recargando documentos: {e}")
+        log.exception("❌ Error recargando documentos", error=str(e))
         return jsonify({
             "message": "Error recargando documentos",
             "error": str(e)
         }), 500
 
 
+@chat_bp.route("/api/chat/memory/import", methods=["POST"])
+def import_question_bank_route():
+    """
+    Importa bancos de preguntas oficiales como entradas fijadas de la memoria semántica
+    
+    Acepta form-data con `file` (DOCX/PDF/CSV/JSONL) o JSON:
+    {
+        "filenames": ["BANCO DE PREGUNTAS 027 DE 2023.docx"]  // opcional, dentro de KNOWLEDGE_DIR
+    }
+    Sin archivos ni nombres importa los bancos encontrados en KNOWLEDGE_DIR.
+    
+    Retorna:
+    {
+        "results": [{"file": "string", "pairs": int, "imported": int, "replaced": int}],
+        "pinned": int
+    }
+    """
+    import os
+    import tempfile
+    from config import KNOWLEDGE_DIR, QUESTION_BANK_PREFIX
+    from services.qa_importer import SUPPORTED_EXTENSIONS, find_question_banks, import_question_bank
+
+    try:
+        service = init_chat_service()
+        results = []
+
+        if 'file' in request.files:
+            file = request.files['file']
+            # El nombre original identifica el banco igual que al importarlo desde
+            # KNOWLEDGE_DIR; en disco solo se usa un temporal con la misma extensión
+            source = os.path.basename((file.filename or '').replace('\\', '/'))
+            ext = os.path.splitext(source)[1].lower()
+            if ext not in SUPPORTED_EXTENSIONS:
+                return jsonify({
+                    "error": f"Tipo de archivo no soportado. Use: {', '.join(SUPPORTED_EXTENSIONS)}"
+                }), 400
+            tmp_dir = tempfile.mkdtemp()
+            temp_path = os.path.join(tmp_dir, f"banco{ext}")
+            try:
+                file.save(temp_path)
+                results.append(import_question_bank(service.semantic_memory, temp_path, source=source))
+            finally:
+                try:
+                    os.unlink(temp_path)
+                    os.rmdir(tmp_dir)
+                except OSError:
+                    pass
+        else:
+            data = request.get_json(silent=True) or {}
+            filenames = data.get("filenames") or []
+            if filenames:
+                # Solo se permiten archivos del directorio de conocimiento
+                paths = [os.path.join(KNOWLEDGE_DIR, os.path.basename(name)) for name in filenames]
+            else:
+                paths = find_question_banks(KNOWLEDGE_DIR, QUESTION_BANK_PREFIX)
+            missing = [os.path.basename(p) for p in paths if not os.path.isfile(p)]
+            if missing:
+                return jsonify({"error": f"Archivos no encontrados: {', '.join(missing)}"}), 404
+            for path in paths:
+                results.append(import_question_bank(service.semantic_memory, path))
+
+        return jsonify({
+            "results": results,
+            "pinned": service.semantic_memory.stats()["pinned"]
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log.exception("❌ Error importando banco de preguntas", error=str(e))
+        return jsonify({"error": f"Error interno: {str(e)}"}), 500
+
+
 @chat_bp.route("/api/chat/analyze-image", methods=["POST"])
 def chat_analyze_image():
     """
@@ -261,7 +358,7 @@ def chat_analyze_image():
                     service.history_store.append(session_id, "user", question_for_history)
                     service.history_store.append(session_id, "assistant", result['chat_response'])
                 except Exception as e:
-                    print(f"⚠️ Error guardando en historial: {e}")
+                    log.warning("⚠️ Error guardando en historial", error=str(e))
             
             return jsonify(result)
             
@@ -273,7 +370,7 @@ def chat_analyze_image():
                 pass
         
     except Exception as e:
-        print(f"❌ Error en análisis de imagen: {e}")
+        log.exception("❌ Error en análisis de imagen", error=str(e))
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 
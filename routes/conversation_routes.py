@@ -2,27 +2,85 @@
 Rutas API para gestión de conversaciones
 """
 from flask import Blueprint, request, jsonify
-from services.conversation_manager import ConversationManager
+from services.conversation_manager import shared_conversation_manager
 
 # Crear blueprint para las rutas de conversaciones
 conversations_bp = Blueprint('conversations', __name__, url_prefix='/api/conversations')
 
-# Instancia del gestor de conversaciones
-conversation_manager = ConversationManager()
+# Gestor de conversaciones del proceso (el mismo que usa /api/chat para registrar turnos)
+conversation_manager = shared_conversation_manager()
+
+# Tamaño máximo de página del listado
+MAX_PAGE_SIZE = 200
 
 @conversations_bp.route('/', methods=['GET'])
 def get_conversations():
     """
-    Obtiene todas las conversaciones
+    Lista las conversaciones (solo metadatos, sin mensajes) paginadas por cursor
+    
+    Query params:
+      - limit: tamaño de página (por defecto 50, máximo 200)
+      - cursor: valor de `next_cursor` de la página anterior
+      - fields: campos separados por coma (id, title, created_at, updated_at,
+        first_message_preview, message_count); por defecto todos
     """
     try:
-        limit = request.args.get('limit', 50, type=int)
-        conversations = conversation_manager.get_all_conversations(limit=limit)
+        limit = min(max(1, request.args.get('limit', 50, type=int)), MAX_PAGE_SIZE)
+        fields = request.args.get('fields')
+        conversations, next_cursor = conversation_manager.list_conversations(
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            fields=fields.split(',') if fields else None,
+        )
         
         return jsonify({
             "success": True,
-            "conversations": conversations
+            "conversations": conversations,
+            "next_cursor": next_cursor
         }), 200
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@conversations_bp.route('/search', methods=['GET'])
+def search_conversations():
+    """
+    Busca conversaciones por el contenido de sus mensajes, de la más a la menos relevante
+    
+    Query params:
+      - q: texto a buscar (sin distinguir mayúsculas ni tildes)
+      - limit: tamaño de página (por defecto 20, máximo 200)
+      - offset: resultados a omitir (usar `next_offset` de la página anterior)
+    """
+    try:
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({
+                "success": False,
+                "error": "El parámetro q es requerido"
+            }), 400
+        limit = min(max(1, request.args.get('limit', 20, type=int)), MAX_PAGE_SIZE)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        results, total = conversation_manager.search(query, limit=limit, offset=offset)
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "total": total,
+            "next_offset": offset + limit if offset + limit < total else None
+        }), 200
+    except RuntimeError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             "success": False,
@@ -90,7 +148,7 @@ def add_message(conversation_id):
         success = conversation_manager.add_message(conversation_id, message_type, content)
         
         if success:
-            # Obtener la conversación actualizada
+            # Obtener la conversación actualizada (desde la caché en memoria)
             conversation = conversation_manager.get_conversation(conversation_id)
             return jsonify({
                 "success": True,
@@ -0,0 +1,32 @@
+"""
+Ruta de métricas en formato de texto de Prometheus
+"""
+from flask import Blueprint, Response
+from services.metrics import collect_all, render_text, start_multiprocess_writer
+
+# Crear blueprint para la ruta de métricas
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Expone contadores, medidores e histogramas (combinados entre workers si
+    METRICS_MULTIPROC_DIR está definido)
+    """
+    return Response(
+        render_text(collect_all()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def register_metrics_routes(app):
+    """
+    Registra la ruta /metrics en la aplicación Flask
+    
+    Args:
+        app: Instancia de la aplicación Flask
+    """
+    start_multiprocess_writer()
+    app.register_blueprint(metrics_bp)
+    print("✅ Ruta de métricas registrada")
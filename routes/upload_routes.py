@@ -2,6 +2,7 @@
 Rutas para gestión de subida y procesamiento de archivos (movidas desde file_manager.py)
 """
 import os
+from time import perf_counter
 from flask import request, jsonify
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
@@ -9,6 +10,29 @@ from utils import FileValidator, PathManager, HashManager
 from rag.document_processor import DocumentProcessor
 from rag.embedding_manager import EmbeddingManager
 from config import KNOWLEDGE_DIR
+from services import metrics
+
+_upload_processing = metrics.histogram(
+    "aluna_upload_processing_duration_seconds",
+    "Duración del procesamiento de documentos y regeneración de embeddings (segundos)",
+    ("outcome",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+
+def _notify_chat_service(documents, embedding_data):
+    """Propaga el nuevo índice al servicio de chat (si ya está inicializado).
+
+    Returns:
+        Respuestas de memoria invalidadas, o None si el servicio no está activo.
+    """
+    from routes import chat_routes
+
+    service = chat_routes.chat_service
+    if service is None:
+        # Se sincronizará al inicializarse
+        return None
+    return service.apply_knowledge_update(documents, embedding_data)
 
 
 class FileUploadManager:
@@ -78,6 +102,12 @@ class FileUploadManager:
         Returns:
             Tupla (éxito, mensaje, estadísticas)
         """
+        started = perf_counter()
+        ok, message, stats = self._process_and_update_embeddings()
+        _upload_processing.observe(perf_counter() - started, outcome="ok" if ok else "error")
+        return ok, message, stats
+
+    def _process_and_update_embeddings(self) -> tuple[bool, str, dict]:
         try:
             # Cargar documentos
             documents = self.doc_processor.load_documents()
@@ -94,9 +124,14 @@ class FileUploadManager:
             stats = {
                 "total_documents": len(documents),
                 "embeddings_generated": len(embedding_data.embeddings),
-                "files_processed": [doc.filename for doc in documents]
+                "files_processed": [doc.filename for doc in documents],
+                "index_version": embedding_data.meta.get("index_version", ""),
             }
 
+            invalidated = _notify_chat_service(documents, embedding_data)
+            if invalidated is not None:
+                stats["memory_invalidated"] = invalidated
+
             return True, "Embeddings actualizados exitosamente", stats
 
         except Exception as e:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del motor de palabras clave frente a los recorridos anteriores
+
+Uso:
+    python -m scripts.benchmark_keyword_matching [repeticiones]
+
+Compara por pregunta el costo de las comprobaciones que hacían por separado
+GeneralKnowledgeEngine, PromptBuilder y SafetyProtocol (un `in` por palabra clave
+y un `search` por patrón) con una pasada del autómata compartido, para preguntas
+nuevas y repetidas (caché), y la comprobación de marcas de respuesta negativa del
+motor (lista corta: un `in` por marca) frente a la expresión combinada.
+"""
+import re
+import sys
+from time import perf_counter
+
+from config import DEPENDENCIAS, NEGATIVE_ANSWER_MARKERS, UNIVERSIDAD_KEYWORDS
+from services.general_knowledge import GeneralKnowledgeEngine
+from services.keyword_matcher import KeywordMatcher, shared_matcher
+from services.prompt_builder import PromptBuilder  # noqa: F401 (registra sus reglas)
+from services.safety_protocol import SafetyProtocol, _default_levels
+from services.text_normalization import fold_text
+
+QUESTIONS = [
+    "¿Cómo es el proceso de matrícula para estudiantes de primer semestre?",
+    "¿Qué es la teoría de la relatividad y quién la propuso?",
+    "Necesito información sobre becas y apoyo psicológico en la universidad",
+    "cuéntame la historia del imperio inca y sus batallas más importantes",
+    "¿Dónde queda la oficina de pagos de la facultad de ingeniería?",
+    "Me siento muy solo y no tengo ganas de nada últimamente",
+    "who is the current president of the united states",
+    "¿Cuál es el horario de la biblioteca central los fines de semana?",
+]
+ANSWER = (
+    "La matrícula se realiza en línea cada semestre según el calendario académico; "
+    "revisa tu correo institucional para conocer las fechas exactas."
+)
+
+
+def legacy_question(question: str, safety_patterns) -> None:
+    """Recorridos previos sobre la pregunta: un escaneo por palabra clave o patrón."""
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    any(kw in q for kw in UNIVERSIDAD_KEYWORDS)
+    for keywords in GeneralKnowledgeEngine.CATEGORY_KEYWORDS.values():
+        [kw for kw in keywords if kw in q]
+    any(prefix in q for prefix in GeneralKnowledgeEngine.GENERAL_PREFIXES)
+    any(connector in q for connector in GeneralKnowledgeEngine.GENERAL_CONNECTORS)
+    any(kw in q for kw in UNIVERSIDAD_KEYWORDS)
+    next((dep for kw, dep in DEPENDENCIAS.items() if kw in q), None)
+    for patterns in safety_patterns:
+        [p.search(question) for p in patterns]
+
+
+def engine_question(matcher: KeywordMatcher, safety: SafetyProtocol, question: str) -> None:
+    """Seguridad y clasificadores comparten una pasada del autómata."""
+    safety.evaluate(question)
+    matches = matcher.scan(question)
+    matches.has("university")
+    matches.by_payload("general.category")
+    matches.has("general.prefix")
+    matches.has("general.connector")
+    matches.first("department")
+
+
+def legacy_answer(answer: str) -> None:
+    lowered = answer.lower()
+    any(marker in lowered for marker in NEGATIVE_ANSWER_MARKERS)
+
+
+def timeit(fn, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            fn(question)
+    return (perf_counter() - start) / (repeat * len(QUESTIONS)) * 1e6
+
+
+def report(title: str, results: dict) -> None:
+    print(f"\n{title}")
+    baseline = next(iter(results.values()))
+    for name, micros in results.items():
+        print(f"📊 {name:<24} {micros:8.2f} µs  (x{baseline / micros:.2f})")
+
+
+def main(repeat: int) -> None:
+    print("⏱️ Benchmark de coincidencia de palabras clave")
+    print(f"   {len(QUESTIONS)} preguntas x {repeat} repeticiones")
+    print("-" * 50)
+
+    safety_patterns = [
+        [re.compile(p, re.IGNORECASE) for p in data["patterns"]] for data in _default_levels().values()
+    ]
+    shared = shared_matcher()
+    shared.register("answer.negative", NEGATIVE_ANSWER_MARKERS)
+    safety = SafetyProtocol()
+    combined = re.compile("|".join(re.escape(fold_text(marker)) for marker in NEGATIVE_ANSWER_MARKERS))
+
+    # Copia del motor sin caché entre solicitudes: cada pregunta llega "nueva"
+    # (la pasada sí se comparte entre los componentes de la misma solicitud)
+    cold = KeywordMatcher(cache_size=1)
+    for name, rules in shared._rule_sets.items():
+        cold.register(name, {keyword: payload for keyword, payload, _ in rules}, whole_word=rules[0][2] if rules else False)
+    cold_safety = SafetyProtocol()
+    cold_safety._matcher._cache_size = 1
+    cold_safety._compile()
+
+    report("Pregunta (seguridad + clasificadores)", {
+        "recorridos anteriores": timeit(lambda q: legacy_question(q, safety_patterns), repeat),
+        "autómata (nueva)": timeit(lambda q: engine_question(cold, cold_safety, q), repeat),
+        "autómata (repetida)": timeit(lambda q: engine_question(shared, safety, q), repeat),
+    })
+    report("Respuesta (marcas negativas)", {
+        "recorridos anteriores": timeit(lambda q: legacy_answer(f"{ANSWER} {q}"), repeat),
+        "motor (lista corta)": timeit(lambda q: shared.search("answer.negative", f"{ANSWER} {q}"), repeat),
+        "expresión combinada": timeit(lambda q: combined.search(fold_text(f"{ANSWER} {q}")), repeat),
+    })
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark del protocolo de seguridad: recorrido patrón a patrón frente al autómata
+
+Uso:
+    python -m scripts.benchmark_safety_protocol [repeticiones]
+
+Genera variantes de cada frase de crisis (tildes, letras alargadas, mayúsculas y
+puntuación) y mensajes de consulta universitaria sin riesgo, y compara la
+exhaustividad y el costo por mensaje de la evaluación anterior (un `re.search` por
+patrón sobre el texto original) con `SafetyProtocol.evaluate`.
+"""
+import re
+import sys
+from time import perf_counter
+from typing import List
+
+from services.safety_protocol import SafetyProtocol, _default_levels
+
+ACCENTED = str.maketrans({"a": "á", "e": "é", "i": "í", "o": "ó", "u": "ú"})
+SAFE_MESSAGES = [
+    "¿Cómo es el proceso de matrícula para estudiantes de primer semestre?",
+    "¿Dónde queda la oficina de pagos de la facultad de ingeniería?",
+    "No puedo masticar bien desde la cirugía, ¿hay atención odontológica?",
+    "¿Cuál es el horario de la biblioteca central los fines de semana?",
+    "Necesito información sobre becas y apoyo psicológico en la universidad",
+    "Quiero vivir en la residencia estudiantil el próximo semestre",
+]
+
+
+def variants(phrase: str) -> List[str]:
+    """Formas en que un estudiante podría escribir la frase."""
+    words = phrase.split()
+    stretched = " ".join(word + word[-1] * 3 if len(word) > 2 else word for word in words)
+    return [
+        phrase,
+        f"Últimamente siento que {phrase}.",
+        phrase.translate(ACCENTED),
+        stretched,
+        f"¡¡{phrase.upper()}!!",
+        phrase.replace(" ", "  ").replace("a", "á", 1),
+    ]
+
+
+def legacy_evaluate(levels, message: str) -> str:
+    """Evaluación anterior: un `search` por patrón y por nivel sobre el texto original."""
+    for level, data in sorted(levels.items(), key=lambda item: item[1].get("priority", 999)):
+        for pattern in data["patterns"]:
+            if re.search(pattern, message, re.IGNORECASE):
+                return level
+    return ""
+
+
+def main(repeat: int) -> None:
+    levels = _default_levels()
+    corpus = []
+    for level, data in levels.items():
+        for pattern in data["patterns"]:
+            phrase = pattern[2:-2]  # r"\bfrase\b"
+            corpus.extend((message, level) for message in variants(phrase))
+    corpus.extend((message, "") for message in SAFE_MESSAGES)
+    safety = SafetyProtocol()
+
+    print("⏱️ Benchmark del protocolo de seguridad")
+    print(f"   {len(corpus)} mensajes x {repeat} repeticiones")
+    print("-" * 50)
+
+    def new_evaluate(message: str) -> str:
+        return safety.evaluate(message).severity
+
+    for name, evaluate in (("patrón a patrón", lambda m: legacy_evaluate(levels, m)), ("autómata", new_evaluate)):
+        hits = sum(1 for message, level in corpus if level and evaluate(message) == level)
+        false_alarms = sum(1 for message, level in corpus if not level and evaluate(message))
+        positives = sum(1 for _, level in corpus if level)
+
+        # Mensajes distintos en cada repetición: se mide sin la caché de textos
+        start = perf_counter()
+        for iteration in range(repeat):
+            for message, _ in corpus:
+                evaluate(f"{message} {iteration}")
+        micros = (perf_counter() - start) / (repeat * len(corpus)) * 1e6
+
+        print(f"📊 {name:<16} {micros:8.2f} µs/mensaje  "
+              f"exhaustividad {hits}/{positives} ({hits / positives:.0%})  falsas alarmas {false_alarms}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
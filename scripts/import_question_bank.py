@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Script para importar bancos de preguntas oficiales a la memoria semántica
+
+Uso:
+    python -m scripts.import_question_bank [archivo1.docx archivo2.csv ...]
+
+Sin argumentos importa los bancos de KNOWLEDGE_DIR cuyo nombre empieza por
+QUESTION_BANK_PREFIX. Las entradas quedan fijadas: no se desalojan ni vencen, y
+reimportar un archivo reemplaza sus entradas anteriores.
+
+Escribe directamente en los archivos de memoria; con el servidor en ejecución use
+POST /api/chat/memory/import para que la memoria en uso se actualice.
+"""
+import os
+import sys
+from config import KNOWLEDGE_DIR, QUESTION_BANK_PREFIX, MEMORY_SNAPSHOT_FILE
+from services.memory_manager import SemanticMemory
+from services.qa_importer import find_question_banks, import_question_bank
+
+
+def main(paths):
+    """Función principal para importar bancos de preguntas"""
+    print("🚀 Iniciando importación de bancos de preguntas...")
+    if not paths:
+        paths = find_question_banks(KNOWLEDGE_DIR, QUESTION_BANK_PREFIX)
+        print(f"📁 Directorio de documentos: {KNOWLEDGE_DIR}")
+    print(f"💾 Memoria semántica: {MEMORY_SNAPSHOT_FILE}")
+    print("-" * 50)
+
+    if not paths:
+        print("⚠️ No se encontraron bancos de preguntas para importar")
+        return False
+
+    memory = SemanticMemory()
+    total = 0
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"❌ Error: El archivo {path} no existe")
+            return False
+        result = import_question_bank(memory, path)
+        total += result["imported"]
+        print(f"   - {result['file']}: {result['pairs']} pares, "
+              f"{result['imported']} importados, {result['replaced']} reemplazados")
+
+    memory.compact(wait=True)
+    print("-" * 50)
+    print(f"✅ Total de entradas fijadas importadas: {total}")
+    print(f"📊 Entradas fijadas en memoria: {memory.stats()['pinned']}")
+    return total > 0
+
+
+if __name__ == "__main__":
+    try:
+        success = main(sys.argv[1:])
+        if success:
+            print("\n🎉 ¡Proceso completado exitosamente!")
+        else:
+            print("\n❌ El proceso falló")
+            sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
+        sys.exit(1)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Script para migrar el historial, las conversaciones y la memoria semántica desde los
+archivos actuales a la base SQLite del backend `sqlite`
+
+Uso:
+    python -m scripts.migrate_storage [--db data/aluna.db] [--only history,conversations,memory] [--replace]
+
+Lee las rutas configuradas (HISTORY_FILE, CONVERSATIONS_DIR y MEMORY_*) con los
+almacenes de archivos, que al abrirse actualizan los formatos anteriores igual que al
+iniciar el servidor: el historial JSONL pasa a segmentos, conversations.json se
+reparte en un archivo por conversación (el original queda como .migrated) y la
+memoria en pickle se convierte en snapshot. El contenido no cambia. Cada almacén se
+copia en una sola transacción; si la tabla destino ya tiene datos se omite, salvo
+con --replace, que la vacía dentro de esa misma transacción: si la copia falla, la
+base queda como estaba.
+
+Detenga el servidor antes de migrar y luego configure STORAGE_BACKEND=sqlite.
+"""
+import argparse
+import sqlite3
+import sys
+from typing import Callable, Optional
+
+from config import (
+    CONVERSATIONS_DIR,
+    HISTORY_FILE,
+    MEMORY_COMPACT_EVERY,
+    MEMORY_FILE,
+    MEMORY_LOG_FILE,
+    MEMORY_SNAPSHOT_FILE,
+    STORAGE_SQLITE_PATH,
+)
+from services.conversation_store import FileConversationStore
+from services.history_store import HistoryStore
+from services.memory_store import MemoryLogStore
+from services.sqlite_storage import SQLiteConversationStore, SQLiteDatabase, SQLiteMemoryStore
+
+# Almacén -> tablas que ocupa en la base (la última indica si ya tiene datos)
+TABLES = {
+    "history": ("history",),
+    "conversations": ("conversation_search", "conversation_search_docs", "conversation_messages", "conversations"),
+    "memory": ("memory_entries",),
+}
+
+
+def _copy(db: SQLiteDatabase, name: str, replace: bool, write: Callable[[sqlite3.Connection], int]) -> Optional[int]:
+    """Copia un almacén en una sola transacción: comprueba el destino, lo vacía con
+    --replace y escribe con `write(conn)`. None si se omitió porque ya tenía datos."""
+    with db.transaction() as conn:
+        if conn.execute(f"SELECT EXISTS (SELECT 1 FROM {TABLES[name][-1]})").fetchone()[0]:
+            if not replace:
+                return None
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in TABLES[name]:
+                if table in existing:
+                    conn.execute(f"DELETE FROM {table}")
+        return write(conn)
+
+
+def migrate_history(db: SQLiteDatabase, history_file: str = HISTORY_FILE, replace: bool = False) -> Optional[int]:
+    source = HistoryStore(history_file, compact_interval=0)
+    rows = []
+    for session_id in source.sessions():
+        for turn in source.get_recent(session_id, limit=0):
+            rows.append((session_id, turn.role, turn.content, turn.timestamp))
+    source.close()
+    # Orden global por fecha para que los ids reflejen el orden de escritura
+    rows.sort(key=lambda row: row[3])
+
+    def write(conn: sqlite3.Connection) -> int:
+        conn.executemany("INSERT INTO history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    return _copy(db, "history", replace, write)
+
+
+def migrate_conversations(
+    db: SQLiteDatabase, conversations_dir: str = CONVERSATIONS_DIR, replace: bool = False
+) -> Optional[int]:
+    conversations = FileConversationStore(conversations_dir).list(limit=0)
+    target = SQLiteConversationStore(db)
+
+    def write(conn: sqlite3.Connection) -> int:
+        target.save_conversations(conversations, conn)
+        return len(conversations)
+
+    return _copy(db, "conversations", replace, write)
+
+
+def migrate_memory(
+    db: SQLiteDatabase,
+    snapshot_path: str = MEMORY_SNAPSHOT_FILE,
+    log_path: str = MEMORY_LOG_FILE,
+    legacy_path: str = MEMORY_FILE,
+    replace: bool = False,
+) -> Optional[int]:
+    source = MemoryLogStore(
+        snapshot_path=snapshot_path,
+        log_path=log_path,
+        legacy_path=legacy_path,
+        compact_every=MEMORY_COMPACT_EVERY,
+    )
+    entries = source.load()
+    source.close()
+    target = SQLiteMemoryStore(db)
+
+    def write(conn: sqlite3.Connection) -> int:
+        target.save_entries(entries, conn)
+        return len(entries)
+
+    return _copy(db, "memory", replace, write)
+
+
+def main(argv=None) -> bool:
+    """Función principal de la migración"""
+    parser = argparse.ArgumentParser(description="Migra los almacenes de archivos a SQLite")
+    parser.add_argument("--db", default=STORAGE_SQLITE_PATH, help="Ruta de la base SQLite destino")
+    parser.add_argument("--only", default=",".join(TABLES), help="Almacenes a migrar, separados por coma")
+    parser.add_argument("--replace", action="store_true", help="Vaciar las tablas destino antes de copiar")
+    parser.add_argument("--history-file", default=HISTORY_FILE)
+    parser.add_argument("--conversations-dir", default=CONVERSATIONS_DIR)
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in TABLES]
+    if unknown:
+        print(f"❌ Almacenes desconocidos: {', '.join(unknown)} (use {', '.join(TABLES)})")
+        return False
+
+    print("🚀 Iniciando migración a SQLite...")
+    print(f"🗄️ Base destino: {args.db}")
+    print("-" * 50)
+    db = SQLiteDatabase(args.db)
+    try:
+        migrations = {
+            "history": lambda: migrate_history(db, args.history_file, replace=args.replace),
+            "conversations": lambda: migrate_conversations(db, args.conversations_dir, replace=args.replace),
+            "memory": lambda: migrate_memory(db, replace=args.replace),
+        }
+        for name in selected:
+            copied = migrations[name]()
+            if copied is None:
+                print(f"   ⏭️ {name}: la base ya tiene datos (use --replace para sobrescribir)")
+            else:
+                print(f"   ✓ {name}: {copied} registros copiados")
+        db.checkpoint()
+    finally:
+        db.close()
+    print("-" * 50)
+    print("✅ Migración completada. Configure STORAGE_BACKEND=sqlite para usar la base.")
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        if not main(sys.argv[1:]):
+            sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Error durante la migración: {e}")
+        sys.exit(1)
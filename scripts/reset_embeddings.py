@@ -2,7 +2,8 @@
 Módulo para reiniciar embeddings y datos relacionados.
 
 Dos usos:
-1) Como ruta Flask: expone POST /api/reset_embeddings para borrar archivos de embeddings y memoria.
+1) Como ruta Flask: expone POST /api/reset_embeddings para borrar los embeddings y vaciar la memoria
+   semántica del servicio en ejecución.
    Usar: from scripts.reset_embeddings import registrar_ruta_reset; registrar_ruta_reset(app)
 2) Como script CLI: ejecuta una petición POST a esa ruta en localhost.
 """
@@ -37,18 +38,30 @@ def registrar_ruta_reset(app) -> None:
     """Registra la ruta Flask para reiniciar embeddings/memoria.
 
     Ruta: POST /api/reset_embeddings
-    Respuesta: { removed: {embeddings: bool, memory: bool}, files: {embeddings: str, memory: str} }
+    Respuesta: { removed: {embeddings: bool, memory: bool}, cleared_entries: int,
+                 files: {embeddings: str, memory: str} }
+
+    La memoria se vacía a través del servicio vivo (`SemanticMemory.clear`), que
+    reinicia su almacenamiento bajo el lock de escritura; borrar los archivos por
+    debajo dejaría al registro abierto escribiendo en un archivo eliminado.
     """
     @app.route("/api/reset_embeddings", methods=["POST"])
     def reset_embeddings_route():  # type: ignore
         removed_embeddings = _safe_remove(EMBEDDINGS_FILE)
-        removed_memory = _safe_remove(MEMORY_FILE)
+        # Importación diferida: el uso CLI no necesita cargar el servicio
+        from routes.chat_routes import init_chat_service
+
+        cleared_entries = init_chat_service().semantic_memory.clear()
+        # El pickle del formato anterior ya no lo tiene abierto nadie
+        removed_legacy = _safe_remove(MEMORY_FILE)
+        removed_memory = cleared_entries > 0 or removed_legacy
 
         result: Dict[str, Any] = {
             "removed": {
                 "embeddings": removed_embeddings,
                 "memory": removed_memory,
             },
+            "cleared_entries": cleared_entries,
             "files": {
                 "embeddings": EMBEDDINGS_FILE or "",
                 "memory": MEMORY_FILE or "",
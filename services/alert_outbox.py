@@ -0,0 +1,385 @@
+"""
+Outbox durable para las alertas de alto riesgo del protocolo de seguridad.
+
+- `enqueue(payload)` anexa la alerta a un registro JSONL (con fsync) y retorna de
+  inmediato: la respuesta de crisis nunca espera la entrega.
+- Un hilo de fondo entrega las alertas pendientes al webhook configurado (POST JSON
+  con cabecera `Idempotency-Key`) con reintentos de espera exponencial, y anexa cada
+  cambio de estado al mismo registro: pending -> delivered | failed.
+- Al iniciar, el despachador reaplica el registro, lo compacta (una línea por alerta
+  vigente) y reanuda las entregas pendientes.
+- Con varios workers sobre el mismo archivo, un bloqueo de archivo elige un único
+  despachador; los demás procesos solo anexan y el despachador lee lo nuevo del
+  registro. Sin `fcntl` (Windows) se asume un solo proceso por archivo.
+"""
+from __future__ import annotations
+import json
+import os
+import random
+import threading
+import urllib.request
+import uuid
+from collections import OrderedDict
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from config import (
+    SAFETY_ALERT_WEBHOOK_URL,
+    SAFETY_ALERT_WEBHOOK_TOKEN,
+    SAFETY_ALERT_OUTBOX_FILE,
+    SAFETY_ALERT_TIMEOUT,
+    SAFETY_ALERT_MAX_ATTEMPTS,
+    SAFETY_ALERT_RETRY_BASE_SECONDS,
+    SAFETY_ALERT_RETRY_MAX_SECONDS,
+    SAFETY_ALERT_RETENTION_DAYS,
+)
+from services import metrics
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.alerts")
+
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+STATUS_FAILED = "failed"
+
+# Espera máxima entre lecturas del registro (alertas anexadas por otros procesos)
+_POLL_SECONDS = 1.0
+# Cada cuánto reintenta un proceso en espera tomar el rol de despachador
+_STANDBY_SECONDS = 5.0
+_STATUS_FIELDS = ("status", "attempts", "next_attempt_at", "last_error", "updated_at")
+
+_alerts_total = metrics.counter(
+    "aluna_safety_alerts", "Alertas de seguridad por evento (enqueued, delivered, retry, failed)", ("outcome",)
+)
+_delivery_duration = metrics.histogram(
+    "aluna_safety_alert_delivery_duration_seconds", "Duración de cada intento de entrega al webhook"
+)
+
+
+class _FileLock:
+    """Bloqueo exclusivo entre procesos sobre un archivo auxiliar (sin efecto sin fcntl)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "_FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class AlertOutbox:
+    """Cola durable de alertas con entrega asíncrona a un webhook."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        webhook_url: Optional[str] = None,
+        token: Optional[str] = None,
+        *,
+        timeout: float = SAFETY_ALERT_TIMEOUT,
+        max_attempts: int = SAFETY_ALERT_MAX_ATTEMPTS,
+        retry_base: float = SAFETY_ALERT_RETRY_BASE_SECONDS,
+        retry_max: float = SAFETY_ALERT_RETRY_MAX_SECONDS,
+        retention_days: float = SAFETY_ALERT_RETENTION_DAYS,
+    ):
+        self.path = path or SAFETY_ALERT_OUTBOX_FILE
+        self.webhook_url = SAFETY_ALERT_WEBHOOK_URL if webhook_url is None else webhook_url
+        self.token = SAFETY_ALERT_WEBHOOK_TOKEN if token is None else token
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.retention_days = retention_days
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._alerts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._write_lock = _FileLock(self.path + ".lock")
+        self._dispatch_lock = _FileLock(self.path + ".dispatcher")
+        self._dispatching = False
+        self._thread: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            self._catch_up_locked()
+        metrics.register_collector("alert_outbox", self._metric_families)
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        """Registra la alerta de forma durable y despierta al despachador."""
+        alert_id = uuid.uuid4().hex
+        record = {"op": "enqueue", "id": alert_id, "created_at": time(), "payload": payload}
+        with self._lock:
+            self._append_locked(record)
+            self._catch_up_locked()
+        _alerts_total.inc(outcome="enqueued")
+        self._wake.set()
+        return alert_id
+
+    def status(self, alert_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de entrega de una alerta (sin su contenido)."""
+        with self._lock:
+            self._catch_up_locked()
+            alert = self._alerts.get(alert_id)
+            if alert is None:
+                return None
+            return {"id": alert_id, "created_at": alert["created_at"], **{k: alert[k] for k in _STATUS_FIELDS}}
+
+    def start(self) -> bool:
+        """Inicia el hilo despachador; sin webhook las alertas solo quedan registradas."""
+        if not self.webhook_url:
+            log.warning("⚠️ SAFETY_ALERT_WEBHOOK_URL no configurado: las alertas solo se registran", path=self.path)
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="safety-alert-dispatcher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._dispatching:
+            self._dispatch_lock.release()
+            self._dispatching = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {STATUS_PENDING: 0, STATUS_DELIVERED: 0, STATUS_FAILED: 0}
+            oldest_pending: Optional[float] = None
+            for alert in self._alerts.values():
+                counts[alert["status"]] = counts.get(alert["status"], 0) + 1
+                if alert["status"] == STATUS_PENDING:
+                    oldest_pending = min(oldest_pending or alert["created_at"], alert["created_at"])
+            return {
+                "webhook_configured": bool(self.webhook_url),
+                "dispatching": self._dispatching,
+                "oldest_pending_age": round(time() - oldest_pending, 1) if oldest_pending else 0.0,
+                "file": self.path,
+                **counts,
+            }
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+    def _append_locked(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._write_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _catch_up_locked(self) -> None:
+        """Aplica las líneas completas anexadas desde la última lectura (propias o de otros procesos)."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                # El archivo fue compactado por el despachador: reconstruir desde cero
+                self._alerts.clear()
+                self._offset = 0
+                self._inode = st.st_ino
+            if st.st_size <= self._offset:
+                return
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except Exception:
+                continue
+        self._offset += end
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op, alert_id = record.get("op"), record.get("id")
+        if not alert_id:
+            return
+        if op == "enqueue":
+            created_at = float(record.get("created_at", time()))
+            self._alerts.setdefault(alert_id, {
+                "id": alert_id,
+                "created_at": created_at,
+                "payload": record.get("payload") or {},
+                "status": STATUS_PENDING,
+                "attempts": 0,
+                "next_attempt_at": created_at,
+                "last_error": "",
+                "updated_at": created_at,
+            })
+        elif op == "status" and alert_id in self._alerts:
+            self._alerts[alert_id].update({k: record[k] for k in _STATUS_FIELDS if k in record})
+        elif op == "alert":
+            # Línea compactada con el estado completo
+            self._alerts[alert_id] = {k: v for k, v in record.items() if k != "op"}
+
+    def _compact(self) -> None:
+        """Reescribe el registro con una línea por alerta vigente."""
+        cutoff = time() - self.retention_days * 86400
+        with self._lock:
+            with self._write_lock:
+                self._catch_up_locked()
+                keep = [
+                    alert for alert in self._alerts.values()
+                    if alert["status"] == STATUS_PENDING or alert["updated_at"] >= cutoff
+                ]
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for alert in keep:
+                        f.write(json.dumps({"op": "alert", **alert}, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._alerts = OrderedDict((alert["id"], alert) for alert in keep)
+                st = os.stat(self.path)
+                self._inode, self._offset = st.st_ino, st.st_size
+
+    # ------------------------------------------------------------------
+    # Despacho
+    # ------------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self._dispatching:
+                    if not self._dispatch_lock.acquire(blocking=False):
+                        # Otro proceso despacha; reintentar por si termina
+                        self._stop.wait(_STANDBY_SECONDS)
+                        continue
+                    self._dispatching = True
+                    self._compact()
+                    log.info("📮 Despachador de alertas activo", path=self.path, pending=self.stats()[STATUS_PENDING])
+
+                self._wake.clear()
+                with self._lock:
+                    self._catch_up_locked()
+                    due, wait = self._due_locked(time())
+                for alert in due:
+                    if self._stop.is_set():
+                        break
+                    self._deliver(alert)
+                if not due:
+                    self._wake.wait(wait)
+            except Exception as e:
+                log.error("❌ Error en el despachador de alertas", error=str(e))
+                self._stop.wait(_POLL_SECONDS)
+
+    def _due_locked(self, now: float) -> Tuple[List[Dict[str, Any]], float]:
+        due: List[Dict[str, Any]] = []
+        wait = _POLL_SECONDS
+        for alert in self._alerts.values():
+            if alert["status"] != STATUS_PENDING:
+                continue
+            delay = float(alert["next_attempt_at"] or 0) - now
+            if delay <= 0:
+                due.append(dict(alert))
+            else:
+                wait = min(wait, delay)
+        return due, wait
+
+    def _deliver(self, alert: Dict[str, Any]) -> None:
+        attempts = int(alert["attempts"]) + 1
+        started = perf_counter()
+        try:
+            self._post(alert, attempts)
+            status, next_attempt_at, error, outcome = STATUS_DELIVERED, None, "", "delivered"
+        except Exception as e:
+            error = str(e)[:300]
+            if attempts >= self.max_attempts:
+                status, next_attempt_at, outcome = STATUS_FAILED, None, "failed"
+            else:
+                status, next_attempt_at, outcome = STATUS_PENDING, time() + self._backoff(attempts), "retry"
+        _delivery_duration.observe(perf_counter() - started)
+        _alerts_total.inc(outcome=outcome)
+
+        record = {
+            "op": "status",
+            "id": alert["id"],
+            "status": status,
+            "attempts": attempts,
+            "next_attempt_at": next_attempt_at,
+            "last_error": error,
+            "updated_at": time(),
+        }
+        with self._lock:
+            self._append_locked(record)
+            self._catch_up_locked()
+
+        if outcome == "delivered":
+            log.info("📨 Alerta de seguridad entregada", alert_id=alert["id"], attempts=attempts)
+        elif outcome == "retry":
+            log.warning("⚠️ Entrega de alerta fallida, se reintentará", alert_id=alert["id"], attempts=attempts, error=error)
+        else:
+            log.error("❌ Alerta de seguridad no entregada tras agotar reintentos", alert_id=alert["id"], attempts=attempts, error=error)
+
+    def _backoff(self, attempts: int) -> float:
+        """Espera exponencial con variación aleatoria de ±20% para no sincronizar reintentos."""
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _post(self, alert: Dict[str, Any], attempt: int) -> None:
+        body = {"alert_id": alert["id"], "created_at": alert["created_at"], "attempt": attempt, **alert["payload"]}
+        headers = {"Content-Type": "application/json; charset=utf-8", "Idempotency-Key": alert["id"]}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers=headers,
+            method="POST",
+        )
+        # urlopen lanza HTTPError para respuestas 4xx/5xx
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def _metric_families(self) -> List[Dict[str, Any]]:
+        stats = self.stats()
+        return [
+            metrics.gauge_family(
+                "aluna_safety_alerts_outstanding",
+                "Alertas de seguridad pendientes o fallidas en el outbox",
+                {(("status", STATUS_PENDING),): stats[STATUS_PENDING], (("status", STATUS_FAILED),): stats[STATUS_FAILED]},
+                mode="max",
+            ),
+        ]
@@ -2,18 +2,65 @@
 Servicio principal de chat que coordina todos los componentes
 """
 import re
-from typing import List, Set, Tuple
-from models import ChatRequest, ChatResponse, Document, GeneralKnowledgeResult, SafetyProtocolResult
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set, Tuple
+from models import ChatRequest, ChatResponse, ChatTurn, Document, GeneralKnowledgeResult, SafetyProtocolResult
 from rag.document_processor import DocumentProcessor
 from rag.context_search import ContextSearchService
+from rag.embedding_manager import compute_document_id, live_knowledge_ids
 from api.google_ai_client import GoogleAIClient
 from services.prompt_builder import PromptBuilder
-from services.history_store import HistoryStore
+from services.storage_backend import shared_backend
+from services.conversation_manager import shared_conversation_manager
 from services.general_knowledge import GeneralKnowledgeEngine
 from services.safety_protocol import SafetyProtocol
-from config import WELCOME_TEXT, BOT_NAME, BOT_CONTEXT, ANSWER_MODE, HYBRID_MIN_SIMILARITY, HISTORY_MAX_TURNS
+from services.alert_outbox import AlertOutbox
+from services.request_coalescer import RequestCoalescer, coalescing_key
+from services.pipeline import ChatPipeline, PipelineRun
+from services.tracing import current_trace
+from services import metrics
+from services.structured_logging import get_logger
+from services.keyword_matcher import shared_matcher
+from config import (
+    WELCOME_TEXT,
+    BOT_NAME,
+    BOT_CONTEXT,
+    ANSWER_MODE,
+    HYBRID_MIN_SIMILARITY,
+    HISTORY_MAX_TURNS,
+    CHAT_COALESCING_ENABLED,
+    CHAT_COALESCING_TIMEOUT,
+    CHAT_PIPELINE_ENABLED,
+    CHAT_PIPELINE_WORKERS,
+    NEGATIVE_ANSWER_MARKERS,
+)
 from services.memory_manager import SemanticMemory
 
+log = get_logger("aluna.chat")
+
+_keywords = shared_matcher()
+_keywords.register("answer.negative", NEGATIVE_ANSWER_MARKERS)
+
+_chat_requests = metrics.counter(
+    "aluna_chat_requests", "Solicitudes de chat respondidas por origen de la respuesta", ("source", "coalesced")
+)
+_retrieval_similarity = metrics.histogram(
+    "aluna_retrieval_best_similarity",
+    "Mejor similitud coseno del contexto recuperado",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+
+@dataclass
+class _AnswerOutcome:
+    """Resultado compartible del cálculo de una respuesta."""
+    final_response: str
+    # "memory" cuando se respondió desde memoria semántica, "llm" si se llamó al modelo
+    source: str
+
 
 class ChatService:
     """Servicio principal que coordina el flujo de chat"""
@@ -29,21 +76,40 @@ class ChatService:
     
     def __init__(self):
         """Inicializa el servicio de chat con todos sus componentes"""
-        print("🚀 Inicializando servicio de chat...")
+        log.info("🚀 Inicializando servicio de chat...")
         
         self.document_processor = DocumentProcessor()
         self.context_search = ContextSearchService()
         self.google_ai_client = GoogleAIClient()
         self.prompt_builder = PromptBuilder()
-        self.semantic_memory = SemanticMemory()
-        self.history_store = HistoryStore()
+        # Historial y memoria se persisten en el backend configurado (STORAGE_BACKEND)
+        self.storage = shared_backend()
+        self.semantic_memory = SemanticMemory(store=self.storage.memory_store())
+        self.history_store = self.storage.history_store()
+        # Conversaciones del sidebar: el chat registra en ellas ambos turnos y lee su historial
+        self.conversations = shared_conversation_manager()
         self.general_knowledge = GeneralKnowledgeEngine()
         self.safety_protocol = SafetyProtocol()
+        # Las alertas de alto riesgo se entregan en segundo plano desde un outbox durable
+        self.alert_outbox = AlertOutbox()
+        self.alert_outbox.start()
+        self.request_coalescer = RequestCoalescer(timeout=CHAT_COALESCING_TIMEOUT)
+        self._coalescing_lock = threading.Lock()
+        self._llm_calls_saved = 0
+        self.pipeline = ChatPipeline(max_workers=CHAT_PIPELINE_WORKERS, enabled=CHAT_PIPELINE_ENABLED)
         
         # Cargar documentos al inicializar
         self.documents = self.document_processor.load_documents()
+        self.knowledge_version = self._compute_knowledge_version(self.documents)
+        self.sync_knowledge_index()
+        
+        metrics.register_collector("chat_service", self._metric_families)
         
-        print(f"✅ Servicio de chat inicializado con {len(self.documents)} documentos y {self.semantic_memory.stats()['entries']} memorias")
+        log.info(
+            "✅ Servicio de chat inicializado",
+            documents=len(self.documents),
+            memories=self.semantic_memory.stats()["entries"],
+        )
     
     def reload_documents(self) -> int:
         """
@@ -52,10 +118,61 @@ class ChatService:
         Returns:
             Número de documentos cargados
         """
-        print("🔄 Recargando documentos...")
+        log.info("🔄 Recargando documentos...")
         self.documents = self.document_processor.load_documents()
-        print(f"✅ Documentos recargados: {len(self.documents)}")
+        self.knowledge_version = self._compute_knowledge_version(self.documents)
+        self.sync_knowledge_index()
+        log.info("✅ Documentos recargados", documents=len(self.documents))
         return len(self.documents)
+
+    def apply_knowledge_update(self, documents: List[Document], embedding_data=None) -> int:
+        """Adopta documentos e índice ya procesados (p. ej. tras /api/upload).
+
+        Returns:
+            Número de respuestas de memoria invalidadas.
+        """
+        self.documents = documents
+        self.knowledge_version = self._compute_knowledge_version(self.documents)
+        return self.sync_knowledge_index(embedding_data)
+
+    def sync_knowledge_index(self, embedding_data=None) -> int:
+        """Invalida en memoria semántica solo las respuestas cuyos fragmentos cambiaron.
+
+        Args:
+            embedding_data: Índice vigente; si no se indica se obtiene (o regenera)
+                a partir de los documentos cargados.
+
+        Returns:
+            Número de respuestas de memoria invalidadas.
+        """
+        try:
+            if embedding_data is None:
+                if not self.documents:
+                    return 0
+                embedding_data = self.context_search.embedding_manager.get_or_generate_embeddings(self.documents)
+            if not embedding_data:
+                return 0
+            live_ids = live_knowledge_ids(self.documents, embedding_data)
+            index_version = embedding_data.meta.get("index_version", "")
+            return self.semantic_memory.invalidate_stale(live_ids, index_version)
+        except Exception as e:
+            log.warning("⚠️ No se pudo sincronizar la memoria con el índice de conocimiento", error=str(e))
+            return 0
+
+    @staticmethod
+    def _compute_knowledge_version(documents: List[Document]) -> str:
+        """Huella del conocimiento cargado; cambia cuando cambia algún documento."""
+        digest = hashlib.md5()
+        for document in sorted(documents, key=lambda d: d.filename):
+            digest.update(document.filename.encode("utf-8"))
+            digest.update(DocumentProcessor.calculate_content_hash(document.content).encode("ascii"))
+        return digest.hexdigest()[:12]
+
+    def _coalescing_key(self, question: str, history: List[ChatTurn]) -> str:
+        """Clave de coalescencia: versión del conocimiento + pregunta canónica + historial."""
+        if not CHAT_COALESCING_ENABLED:
+            return ""
+        return coalescing_key(self.knowledge_version, question, history)
     
     def process_chat_request(self, chat_request: ChatRequest) -> ChatResponse:
         """
@@ -72,71 +189,157 @@ class ChatService:
         if not question:
             return ChatResponse(answer="Hermano/hermana, no has compartido tu inquietud. ¿En qué puedo ayudarte?")
         
-        print(f"💬 {BOT_NAME} reflexionando sobre: {question[:50]}...")
+        log.debug(f"💬 {BOT_NAME} reflexionando", question=question[:50])
+
+        run = self.pipeline.start()
+        try:
+            return self._run_pipeline(chat_request, run)
+        except Exception:
+            # Sin respuesta, la pregunta del usuario igual queda registrada
+            self._record_question(chat_request)
+            raise
+        finally:
+            self._log_stage_timings(run.finish())
+
+    def _run_pipeline(self, chat_request: ChatRequest, run: PipelineRun) -> ChatResponse:
+        """Flujo de la solicitud sobre las etapas concurrentes de `run`."""
+        question = chat_request.question
+        session_id = getattr(chat_request, "session_id", None)
+        conversation_id = getattr(chat_request, "conversation_id", None)
+
+        # Etapas independientes en paralelo: seguridad e historial
+        run.submit("safety", lambda: self.safety_protocol.evaluate(question))
+        if conversation_id:
+            run.submit("history", lambda: self.conversations.recent_turns(conversation_id, limit=HISTORY_MAX_TURNS))
+        elif session_id:
+            run.submit("history", lambda: self.history_store.get_recent(session_id, limit=HISTORY_MAX_TURNS))
 
         # Protocolo de seguridad
-        safety_result = self.safety_protocol.evaluate(question)
+        safety_result = run.result("safety")
         if safety_result.triggered:
+            run.cancel("history")
             crisis_reply = self._format_safety_response(safety_result)
-            print(
-                "🛡️ Protocolo de crisis activado "
-                f"(nivel={safety_result.label or safety_result.severity or 'desconocido'},"
-                f" coincidencias={safety_result.matched_terms})"
+            log.warning(
+                "🛡️ Protocolo de crisis activado",
+                level=safety_result.label or safety_result.severity or "desconocido",
+                matches=safety_result.matched_terms,
             )
 
             if safety_result.alert_required:
                 self._notify_safety_alert(chat_request, safety_result)
 
-            if getattr(chat_request, "session_id", None):
-                try:
-                    self.history_store.append(chat_request.session_id, "user", question)
-                    self.history_store.append(chat_request.session_id, "assistant", crisis_reply)
-                except Exception as e:
-                    print(f"⚠️ No se pudo registrar historial en protocolo de seguridad: {e}")
+            self._record_turn(chat_request, crisis_reply, source="safety")
 
+            _chat_requests.inc(source="safety", coalesced="false")
             return ChatResponse(answer=crisis_reply)
 
-        # Cargar historial reciente si hay session_id
-        recent_history = []
-        if getattr(chat_request, "session_id", None):
-            try:
-                recent_history = self.history_store.get_recent(chat_request.session_id, limit=HISTORY_MAX_TURNS)
-            except Exception as e:
-                print(f"⚠️ Error cargando historial: {e}")
+        # 0-5. Calcular la respuesta; preguntas idénticas concurrentes con el mismo
+        # historial comparten un solo cálculo (el prompt incluye el historial de cada uno)
+        recent_history = self._recent_history(run)
+        outcome, shared = self.request_coalescer.run(
+            self._coalescing_key(question, recent_history),
+            lambda: self._answer_question(question, run, recent_history),
+        )
+        if shared:
+            if outcome.source == "llm":
+                with self._coalescing_lock:
+                    self._llm_calls_saved += 1
+            log.debug("🔗 Respuesta compartida con una pregunta idéntica en curso", source=outcome.source)
+        final_response = outcome.final_response
+        _chat_requests.inc(source=outcome.source, coalesced=str(shared).lower())
+        trace = current_trace()
+        if trace is not None:
+            trace.attrs.update(answer_source=outcome.source, coalesced=shared)
+
+        # 6. Registrar el turno (conversación o historial de la sesión)
+        self._record_turn(chat_request, final_response, source=outcome.source)
         
-        # 0. Intentar responder desde memoria semántica (cache inteligente)
+        return ChatResponse(answer=final_response)
+
+    def _record_turn(self, chat_request: ChatRequest, answer: str, source: str) -> None:
+        """Registra pregunta y respuesta en la conversación indicada (una sola escritura)
+        o, sin conversación, en el historial de la sesión."""
+        question = chat_request.question
+        conversation_id = getattr(chat_request, "conversation_id", None)
+        session_id = getattr(chat_request, "session_id", None)
         try:
-            hit = self.semantic_memory.find_best(question)
+            if conversation_id:
+                # El sidebar muestra todos los turnos, también los respondidos desde memoria
+                if not self.conversations.add_turn(conversation_id, question, answer):
+                    log.warning("⚠️ Conversación no encontrada; el turno no se registró", conversation_id=conversation_id)
+            elif session_id and source != "memory":
+                # Las respuestas desde memoria no se registran en el historial de la sesión
+                self.history_store.append(session_id, "user", question)
+                self.history_store.append(session_id, "assistant", answer)
         except Exception as e:
-            print(f"⚠️ Error buscando en memoria semántica: {e}")
+            log.warning("⚠️ No se pudo registrar historial", error=str(e), source=source)
+
+    def _record_question(self, chat_request: ChatRequest) -> None:
+        """Registra solo la pregunta cuando no se pudo calcular la respuesta."""
+        question = chat_request.question
+        conversation_id = getattr(chat_request, "conversation_id", None)
+        session_id = getattr(chat_request, "session_id", None)
+        try:
+            if conversation_id:
+                self.conversations.add_message(conversation_id, "user", question)
+            elif session_id:
+                self.history_store.append(session_id, "user", question)
+        except Exception as e:
+            log.warning("⚠️ No se pudo registrar la pregunta", error=str(e))
+
+    @staticmethod
+    def _recent_history(run: PipelineRun) -> List[ChatTurn]:
+        """Historial cargado por la etapa `history` (vacío si no hay sesión o falló)."""
+        if not run.has("history"):
+            return []
+        try:
+            return run.result("history")
+        except Exception as e:
+            log.warning("⚠️ Error cargando historial", error=str(e))
+            return []
+
+    @staticmethod
+    def _log_stage_timings(timings: Dict[str, Dict[str, Any]]) -> None:
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        fields: Dict[str, Any] = {}
+        for name, entry in timings.items():
+            if "duration_ms" in entry:
+                fields[f"{name}_ms"] = round(entry["duration_ms"])
+            elif entry.get("cancelled"):
+                fields[name] = "cancelada"
+        if fields:
+            log.debug("⏱️ Etapas", **fields)
+
+    def _answer_question(self, question: str, run: PipelineRun, recent_history: List[ChatTurn]) -> _AnswerOutcome:
+        """Calcula la respuesta (memoria, RAG y modelo) sin efectos por sesión."""
+        # 0. Consultar memoria semántica mientras la recuperación de contexto arranca
+        # de forma especulativa (se cancela si la memoria acierta)
+        documents = self.documents
+        run.submit("memory", lambda: self.semantic_memory.find_best(question))
+        run.submit("retrieval", lambda: self.context_search.search_context(question, documents), speculative=True)
+        try:
+            hit = run.result("memory")
+        except Exception as e:
+            log.warning("⚠️ Error buscando en memoria semántica", error=str(e))
             hit = None
 
         if hit:
             entry, score = hit
             # Evitar devolver respuestas negativas antiguas aprendidas por memoria
-            ans_lower = entry.answer.strip().lower() if entry.answer else ""
-            negative_markers = [
-                "no tengo información suficiente",
-                "no puedo responder",
-                "no puedo proporcionar",
-                "no pude generar una respuesta",
-                "no dispongo de las regulaciones",
-                "no está en mi contexto",
-                "te aconsejo consultar",
-                "consulta el reglamento",
-                "consulta con la oficina",
-            ]
-            if any(m in ans_lower for m in negative_markers):
-                print(f"🧠 Memoria con respuesta negativa detectada (sim={score:.3f}); continuar con RAG")
+            if _keywords.search("answer.negative", entry.answer or ""):
+                log.debug("🧠 Memoria con respuesta negativa detectada; continuar con RAG", sim=score)
             else:
-                print(f"🧠 Respuesta desde memoria (sim={score:.3f})")
-                return ChatResponse(answer=f"🏔️ {entry.answer.strip()}")
+                log.debug("🧠 Respuesta desde memoria", sim=score)
+                run.cancel("retrieval")
+                return _AnswerOutcome(final_response=f"🏔️ {entry.answer.strip()}", source="memory")
 
         # 1. Buscar contexto relevante
-        search_result = self.context_search.search_context(question, self.documents)
+        search_result = run.result("retrieval")
 
         # Decidir modo de respuesta
         best_sim = getattr(search_result, "best_similarity", 0.0) or 0.0
+        _retrieval_similarity.observe(best_sim)
         mode = (ANSWER_MODE or "hybrid").lower()
         allow_general_knowledge = False
         context_text = search_result.context or ""
@@ -144,8 +347,12 @@ class ChatService:
 
         keyword_evidence = False
         keyword_terms: List[str] = []
+        # Fragmentos/documentos que fundamentan la respuesta (para invalidar la memoria)
+        source_ids: List[str] = list(search_result.chunk_ids)
         if (not has_context) or best_sim < HYBRID_MIN_SIMILARITY:
-            keyword_snippets, keyword_terms = self._keyword_context_fallback(question)
+            keyword_snippets, keyword_terms, keyword_sources = run.run_inline(
+                "keyword_fallback", lambda: self._keyword_context_fallback(question)
+            )
             if keyword_snippets:
                 keyword_evidence = True
                 snippet_header = "Coincidencias por palabras clave:\n"
@@ -155,6 +362,7 @@ class ChatService:
                     context_text = f"{snippet_header}{keyword_snippets}"
                 has_context = True
                 best_sim = max(best_sim, HYBRID_MIN_SIMILARITY * 0.95)
+                source_ids.extend(keyword_sources)
         if not keyword_evidence:
             keyword_terms = []
 
@@ -162,10 +370,9 @@ class ChatService:
 
         context_reliable = (has_context and best_sim >= HYBRID_MIN_SIMILARITY) or keyword_evidence
 
-        general_result = self.general_knowledge.classify(
-            question,
-            best_similarity=best_sim,
-            has_context=has_context,
+        general_result = run.run_inline(
+            "general_knowledge",
+            lambda: self.general_knowledge.classify(question, best_similarity=best_sim, has_context=has_context),
         )
         prompt_general_result = general_result if general_result.is_general else None
 
@@ -174,24 +381,29 @@ class ChatService:
             has_context = False
             context_text = ""
             context_reliable = False
-            print("🧭 Modo de respuesta: model_only (sin contexto)")
+            source_ids = []
+            log.debug("🧭 Modo de respuesta: model_only (sin contexto)")
         elif mode == "hybrid":
             if context_reliable:
-                print(f"🧭 Modo de respuesta: hybrid (best_sim={best_sim:.3f}; usar contexto recuperado)")
+                log.debug("🧭 Modo de respuesta: hybrid (usar contexto recuperado)", best_sim=best_sim)
                 allow_general_knowledge = False
             else:
                 allow_general_knowledge = True
-                print(f"🧭 Modo de respuesta: hybrid (best_sim={best_sim:.3f} < {HYBRID_MIN_SIMILARITY:.2f}; complementar con modelo generativo sin descartar fragmentos recuperados)")
+                log.debug(
+                    "🧭 Modo de respuesta: hybrid (complementar con modelo generativo sin descartar fragmentos recuperados)",
+                    best_sim=best_sim,
+                    min_sim=HYBRID_MIN_SIMILARITY,
+                )
         else:
-            print("🧭 Modo de respuesta: rag_only (usar solo contexto)")
+            log.debug("🧭 Modo de respuesta: rag_only (usar solo contexto)")
             if not context_reliable:
-                print("⚠️ No se encontró contexto con similitud suficiente, pero se mantendrá modo RAG puro")
+                log.debug("⚠️ No se encontró contexto con similitud suficiente, pero se mantendrá modo RAG puro", best_sim=best_sim)
 
         if context_reliable and general_result.is_general:
-            print(f"🌐 Clasificación general detectada ({general_result.category}), pero se prioriza contexto embebido (sim={best_sim:.3f})")
+            log.debug("🌐 Clasificación general detectada, pero se prioriza contexto embebido", category=general_result.category, sim=best_sim)
         elif allow_general_knowledge:
             if not general_result.is_general:
-                print("🌐 Clasificación general: fallback por ausencia de contexto")
+                log.debug("🌐 Clasificación general: fallback por ausencia de contexto")
                 prompt_general_result = GeneralKnowledgeResult(
                     is_general=True,
                     category=general_result.category or "general",
@@ -199,12 +411,12 @@ class ChatService:
                     reason=(general_result.reason or "sin señales claras") + " + fallback sin contexto",
                 )
             else:
-                print(f"🌐 Clasificación general: {general_result.category} (conf={general_result.confidence:.2f})")
+                log.debug("🌐 Clasificación general", category=general_result.category, confidence=general_result.confidence)
         else:
-            print(f"🌐 Clasificación general: {general_result.reason}")
+            log.debug("🌐 Clasificación general", reason=general_result.reason)
 
         # 2. Construir prompt con contexto ancestral y bandera híbrida
-        prompt = self.prompt_builder.build_complete_prompt(
+        prompt = run.run_inline("prompt_build", lambda: self.prompt_builder.build_complete_prompt(
             question=question,
             context=context_text,
             has_context=has_context,
@@ -214,10 +426,10 @@ class ChatService:
             general_knowledge_result=prompt_general_result if allow_general_knowledge else None,
             keyword_evidence=keyword_evidence,
             reasoning_notes=reasoning_notes,
-        )
+        ))
         
         # 3. Generar respuesta con Google AI Studio
-        raw_response = self.google_ai_client.generate_response(prompt)
+        raw_response = run.run_inline("generation", lambda: self.google_ai_client.generate_response(prompt))
 
         # Manejo de posibles bloqueos por filtros de seguridad
         blocked_markers = [
@@ -226,7 +438,7 @@ class ChatService:
             "no puedo proporcionar esa información"
         ]
         if any(marker in raw_response.lower() for marker in blocked_markers):
-            print("⚠️ Se detectó bloqueo por filtros de seguridad. Intentando alternativa segura...")
+            log.warning("⚠️ Se detectó bloqueo por filtros de seguridad. Intentando alternativa segura...")
             # Alternativa: respuesta neutra basada en el contexto disponible
             if search_result and search_result.has_relevant_content and search_result.context:
                 safe_answer = (
@@ -243,23 +455,20 @@ class ChatService:
         # 4. Formatear respuesta final con identidad de ORIGEN
         final_response = f"🏔️ {raw_response.strip()}"
         
-        print(f"✅ {BOT_NAME} ha compartido su sabiduría")
+        log.debug(f"✅ {BOT_NAME} ha compartido su sabiduría")
 
         # 5. Almacenar en memoria semántica (aprendizaje continuo)
         try:
-            self.semantic_memory.add(question=question, answer=raw_response)
+            run.run_inline("memory_add", lambda: self.semantic_memory.add(
+                question=question,
+                answer=raw_response,
+                chunk_ids=source_ids,
+                index_version=search_result.index_version,
+            ))
         except Exception as e:
-            print(f"⚠️ No se pudo guardar en memoria semántica: {e}")
-
-        # 6. Registrar historial si hay session_id
-        if getattr(chat_request, "session_id", None):
-            try:
-                self.history_store.append(chat_request.session_id, "user", question)
-                self.history_store.append(chat_request.session_id, "assistant", final_response)
-            except Exception as e:
-                print(f"⚠️ No se pudo registrar historial: {e}")
-        
-        return ChatResponse(answer=final_response)
+            log.warning("⚠️ No se pudo guardar en memoria semántica", error=str(e))
+
+        return _AnswerOutcome(final_response=final_response, source="llm")
 
     def _format_safety_response(self, safety_result: SafetyProtocolResult) -> str:
         """Estructura el mensaje cuando se activa el protocolo de seguridad."""
@@ -284,22 +493,38 @@ class ChatService:
         return f"🏔️ {body}"
 
     def _notify_safety_alert(self, chat_request: ChatRequest, safety_result: SafetyProtocolResult) -> None:
-        """Registra y permite escalar alertas de alto riesgo a un equipo humano."""
+        """Encola la alerta de alto riesgo para escalarla a un equipo humano sin bloquear la respuesta."""
 
         try:
             session_id = getattr(chat_request, "session_id", None) or "sin_session"
-            print(
-                f"🚨 Notificacion de alerta enviada (nivel={safety_result.label or safety_result.severity}, "
-                f"session={session_id}, coincidencias={safety_result.matched_terms})"
+            alert_id = self.alert_outbox.enqueue({
+                "session_id": session_id,
+                "conversation_id": getattr(chat_request, "conversation_id", None),
+                "severity": safety_result.severity,
+                "label": safety_result.label,
+                "matched_terms": safety_result.matched_terms,
+                "level_matches": safety_result.level_matches,
+                "question": chat_request.question,
+            })
+            log.warning(
+                "🚨 Alerta de seguridad encolada",
+                alert_id=alert_id,
+                level=safety_result.label or safety_result.severity,
+                session=session_id,
+                matches=safety_result.matched_terms,
             )
         except Exception as exc:
-            print(f"⚠️ Error al notificar protocolo de seguridad: {exc}")
+            log.error("⚠️ Error al notificar protocolo de seguridad", error=str(exc))
 
-    def _keyword_context_fallback(self, question: str, max_snippets: int = 3, window: int = 220) -> Tuple[str, List[str]]:
-        """Busca coincidencias textuales para reforzar el contexto cuando el RAG es débil."""
+    def _keyword_context_fallback(self, question: str, max_snippets: int = 3, window: int = 220) -> Tuple[str, List[str], List[str]]:
+        """Busca coincidencias textuales para reforzar el contexto cuando el RAG es débil.
+
+        Returns:
+            Tupla (fragmentos, términos clave, ids de los documentos citados)
+        """
 
         if not question:
-            return "", []
+            return "", [], []
 
         lower_question = question.lower().strip()
         normalized_question = re.sub(r"[¿¡?!]", " ", lower_question)
@@ -357,9 +582,10 @@ class ChatService:
         key_terms.update(tokens)
 
         if not candidates:
-            return "", list(key_terms)
+            return "", list(key_terms), []
 
         snippets: List[str] = []
+        source_ids: List[str] = []
         for document in self.documents:
             content = document.content
             content_lower = content.lower()
@@ -372,6 +598,7 @@ class ChatService:
                     snippet = content[start:end]
                     snippet = re.sub(r"\s+", " ", snippet).strip()
                     snippets.append(f"{document.filename}: {snippet}")
+                    source_ids.append(compute_document_id(document.filename, content))
                     found = True
                     break
             if not found and tokens:
@@ -384,11 +611,12 @@ class ChatService:
                         snippet = content[start:end]
                         snippet = re.sub(r"\s+", " ", snippet).strip()
                         snippets.append(f"{document.filename}: {snippet}")
+                        source_ids.append(compute_document_id(document.filename, content))
                         found = True
             if len(snippets) >= max_snippets:
                 break
 
-        return "\n".join(snippets[:max_snippets]), list(key_terms)
+        return "\n".join(snippets[:max_snippets]), list(key_terms), source_ids[:max_snippets]
 
     def _build_reasoning_notes(self, question: str, context_text: str, keyword_terms: List[str]) -> str:
         """Destila pistas breves para guiar el razonamiento del modelo."""
@@ -452,8 +680,36 @@ class ChatService:
             "google_ai_configured": self.google_ai_client.is_configured(),
             "embedding_service": "OK",
             "context_search": "OK",
-            "prompt_builder": "OK"
+            "prompt_builder": "OK",
+            "knowledge_version": self.knowledge_version,
+            "coalescing": self.coalescing_stats(),
+            "pipeline": self.pipeline.stats(),
+            "safety_alerts": self.alert_outbox.stats(),
+            "storage": self.storage.stats(),
         }
+
+    def _metric_families(self) -> List[dict]:
+        """Medidores de colas y coalescencia para /metrics."""
+        coalescing = self.coalescing_stats()
+        queued = self.pipeline.stats()["queued"]
+        return [
+            metrics.gauge_family("aluna_chat_coalescing_in_flight", "Preguntas únicas en cálculo", {(): coalescing["in_flight"]}),
+            metrics.counter_family(
+                "aluna_chat_coalesced_requests", "Solicitudes que compartieron un cálculo en curso", {(): coalescing["coalesced"]}
+            ),
+            metrics.counter_family(
+                "aluna_chat_llm_calls_saved", "Llamadas al modelo evitadas por coalescencia", {(): coalescing["llm_calls_saved"]}
+            ),
+            metrics.gauge_family("aluna_chat_pipeline_queue_depth", "Etapas en espera de un hilo del pipeline", {(): queued}),
+        ]
+
+    def coalescing_stats(self) -> dict:
+        """Métricas de coalescencia de preguntas idénticas en vuelo."""
+        stats = self.request_coalescer.stats()
+        with self._coalescing_lock:
+            stats["llm_calls_saved"] = self._llm_calls_saved
+        stats["enabled"] = CHAT_COALESCING_ENABLED
+        return stats
     
     def process_simple_question(self, question: str) -> str:
         """
@@ -483,5 +739,5 @@ class ChatService:
                 status["google_ai_configured"]
             )
         except Exception as e:
-            print(f"❌ Error en health check: {e}")
+            log.error("❌ Error en health check", error=str(e))
             return False
\ No newline at end of file
@@ -0,0 +1,346 @@
+"""
+Caché write-behind de conversaciones para ConversationManager.
+
+Envuelve cualquier almacén de conversaciones (misma interfaz, ver
+services.conversation_store):
+- Las conversaciones usadas recientemente viven en memoria (LRU); las lecturas, incluida
+  la que sigue a una escritura, se sirven desde allí.
+- Las escrituras modifican la copia en memoria, marcan la conversación como sucia y
+  acumulan las operaciones pendientes (mensajes nuevos, campos cambiados, limpieza).
+- Un hilo escribe las pendientes cada `flush_interval` segundos (la ventana de
+  durabilidad) y al cerrar el proceso. Con `flush_interval` <= 0 se escribe en cada cambio.
+- Los borrados y `save` se escriben de inmediato; los listados escriben antes las
+  pendientes para que el índice de metadatos refleje todos los cambios.
+- Con almacenes compartidos entre procesos (`shared`, p. ej. SQLite con varios
+  workers) una copia limpia se revalida antes de usarla: si `updated_at` o
+  `message_count` de la fila de metadatos no coinciden, se descarta y se vuelve a leer.
+- Si el almacén busca sobre su propio índice (`full_text_search`), las búsquedas
+  escriben antes las pendientes de este proceso.
+"""
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CONVERSATIONS_CACHE_MAX, CONVERSATIONS_FLUSH_SECONDS
+from services import metrics
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.conversations.cache")
+
+_lookups = metrics.counter(
+    "aluna_conversation_cache_lookups", "Lecturas de conversaciones en la caché write-behind", ("outcome",)
+)
+_flushes = metrics.counter(
+    "aluna_conversation_cache_flushes", "Conversaciones escritas por la caché write-behind", ("outcome",)
+)
+
+
+def _copy(conversation: Dict) -> Dict:
+    # Los mensajes no se modifican una vez agregados: basta con copiar la lista
+    return dict(conversation, messages=list(conversation.get("messages") or []))
+
+
+class _CachedConversation:
+    """Conversación en memoria y operaciones aún no escritas en el almacén."""
+
+    __slots__ = ("conversation", "messages", "updates", "cleared", "created")
+
+    def __init__(self, conversation: Dict, created: bool = False):
+        self.conversation = conversation
+        self.messages: List[Dict] = []
+        self.updates: Dict[str, Any] = {}
+        self.cleared = False
+        self.created = created  # aún no existe en el almacén
+
+    def take_pending(self) -> Tuple[List[Dict], Dict[str, Any], bool, bool]:
+        pending = (self.messages, self.updates, self.cleared, self.created)
+        self.messages, self.updates, self.cleared, self.created = [], {}, False, False
+        return pending
+
+    def restore_pending(self, messages: List[Dict], updates: Dict[str, Any], cleared: bool, created: bool) -> None:
+        """Devuelve operaciones no escritas delante de las que llegaron mientras tanto."""
+        if not self.cleared:
+            self.messages = messages + self.messages
+        self.updates = {**updates, **self.updates}
+        self.cleared = self.cleared or cleared
+        self.created = self.created or created
+
+
+class WriteBehindConversationStore:
+    """Almacén de conversaciones con caché en memoria y escritura diferida."""
+
+    def __init__(
+        self,
+        store,
+        max_conversations: int = CONVERSATIONS_CACHE_MAX,
+        flush_interval: float = CONVERSATIONS_FLUSH_SECONDS,
+    ):
+        """
+        Args:
+            store: Almacén persistente envuelto.
+            max_conversations: Conversaciones limpias que se conservan en memoria (LRU).
+            flush_interval: Segundos máximos que un cambio espera antes de escribirse.
+        """
+        self.store = store
+        self.backend = getattr(store, "backend", "")
+        self.shared = bool(getattr(store, "shared", False))
+        self.full_text_search = bool(getattr(store, "full_text_search", False))
+        # Otros procesos pueden cambiar las conversaciones: revalidar las copias limpias
+        self.revalidate = self.shared
+        self.max_conversations = max(1, int(max_conversations))
+        self.flush_interval = float(flush_interval)
+        self._entries: "OrderedDict[str, _CachedConversation]" = OrderedDict()
+        self._dirty: "OrderedDict[str, None]" = OrderedDict()
+        # Conversaciones cuya escritura está en curso: no se expulsan ni se revalidan
+        # hasta que termine, o una lectura del almacén vería la fila sin sus cambios
+        self._flushing: set = set()
+        self._lock = threading.Lock()
+        # Serializa las escrituras al almacén (escrituras diferidas, borrados y `save`)
+        self._flush_lock = threading.Lock()
+        # Cambia con cada borrado: una carga que empezó antes no debe repoblar la caché
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._flushed = 0
+        self._wake = threading.Event()
+        atexit.register(self.flush)
+        if self.flush_interval > 0:
+            threading.Thread(target=self._flush_loop, name="conversation-flusher", daemon=True).start()
+
+    # ----------------------
+    # Caché
+    # ----------------------
+    def _insert_locked(self, conversation_id: str, entry: _CachedConversation) -> None:
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        self._evict_locked(keep=conversation_id)
+
+    def _evict_locked(self, keep: Optional[str] = None) -> None:
+        excess = len(self._entries) - self.max_conversations
+        if excess <= 0:
+            return
+        # Solo se expulsan conversaciones limpias; las sucias esperan al próximo flush
+        victims = []
+        for candidate in self._entries:
+            if len(victims) >= excess:
+                break
+            if candidate not in self._dirty and candidate not in self._flushing and candidate != keep:
+                victims.append(candidate)
+        for candidate in victims:
+            del self._entries[candidate]
+
+    def _load(self, conversation_id: str) -> bool:
+        """Carga la conversación en la caché; False si no existe."""
+        with self._lock:
+            if conversation_id in self._entries:
+                return True
+            generation = self._generation
+        conversation = self.store.get(conversation_id)
+        if conversation is None:
+            return False
+        with self._lock:
+            if conversation_id not in self._entries and generation == self._generation:
+                self._insert_locked(conversation_id, _CachedConversation(conversation))
+        return True
+
+    def _revalidate(self, conversation_id: str) -> None:
+        """Descarta la copia limpia si otro proceso cambió la conversación en el almacén."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None or conversation_id in self._dirty or conversation_id in self._flushing:
+                return
+            updated_at = entry.conversation.get("updated_at")
+            message_count = len(entry.conversation.get("messages") or [])
+        meta = self.store.get_metadata(conversation_id)
+        if meta is not None and meta.get("updated_at") == updated_at and meta.get("message_count") == message_count:
+            return
+        with self._lock:
+            if (
+                self._entries.get(conversation_id) is entry
+                and conversation_id not in self._dirty
+                and conversation_id not in self._flushing
+            ):
+                del self._entries[conversation_id]
+                self._stale += 1
+        _lookups.inc(outcome="stale")
+
+    def _mutate(self, conversation_id: str, apply) -> bool:
+        """Aplica `apply(entry)` en memoria y marca la conversación como sucia."""
+        if self.revalidate:
+            self._revalidate(conversation_id)
+        while True:
+            with self._lock:
+                entry = self._entries.get(conversation_id)
+                if entry is not None:
+                    apply(entry)
+                    self._entries.move_to_end(conversation_id)
+                    self._dirty[conversation_id] = None
+                    break
+            if not self._load(conversation_id):
+                return False
+        if self.flush_interval <= 0:
+            self.flush()
+        return True
+
+    # ----------------------
+    # Escritura diferida
+    # ----------------------
+    def flush(self) -> int:
+        """Escribe todas las operaciones pendientes. Retorna las conversaciones escritas."""
+        with self._flush_lock:
+            with self._lock:
+                batch = []
+                for conversation_id in self._dirty:
+                    entry = self._entries[conversation_id]
+                    batch.append((conversation_id, entry, _copy(entry.conversation), entry.take_pending()))
+                    self._flushing.add(conversation_id)
+                self._dirty.clear()
+            for conversation_id, entry, snapshot, pending in batch:
+                failed = False
+                try:
+                    self._write(conversation_id, snapshot, *pending)
+                    _flushes.inc(outcome="ok")
+                except Exception as e:
+                    failed = True
+                    _flushes.inc(outcome="error")
+                    log.error("❌ Error escribiendo conversación", conversation_id=conversation_id, error=str(e))
+                with self._lock:
+                    self._flushing.discard(conversation_id)
+                    if failed and self._entries.get(conversation_id) is entry:
+                        entry.restore_pending(*pending)
+                        self._dirty[conversation_id] = None
+            with self._lock:
+                self._flushed += len(batch)
+                self._evict_locked()
+            return len(batch)
+
+    def _write(
+        self, conversation_id: str, snapshot: Dict, messages: List[Dict], updates: Dict[str, Any],
+        cleared: bool, created: bool,
+    ) -> None:
+        if created:
+            self.store.save(snapshot)
+            return
+        if cleared:
+            self.store.clear_messages(conversation_id, {} if messages else updates)
+        if messages:
+            # Todos los mensajes pendientes y los campos cambiados en una sola escritura
+            self.store.append_messages(conversation_id, messages, updates)
+        elif updates and not cleared:
+            self.store.update(conversation_id, updates)
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("❌ Error en la escritura diferida de conversaciones", error=str(e))
+
+    # ----------------------
+    # Operaciones (misma interfaz que el almacén envuelto)
+    # ----------------------
+    def create(self, conversation: Dict) -> None:
+        with self._lock:
+            self._insert_locked(conversation["id"], _CachedConversation(_copy(conversation), created=True))
+            self._dirty[conversation["id"]] = None
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        if self.revalidate:
+            self._revalidate(conversation_id)
+        while True:
+            with self._lock:
+                entry = self._entries.get(conversation_id)
+                if entry is not None:
+                    self._entries.move_to_end(conversation_id)
+                    self._hits += 1
+                    _lookups.inc(outcome="hit")
+                    return _copy(entry.conversation)
+                self._misses += 1
+            _lookups.inc(outcome="miss")
+            if not self._load(conversation_id):
+                return None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        self.flush()
+        return self.store.list(limit=limit)
+
+    def list_metadata(self, limit: int = 50, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        self.flush()
+        return self.store.list_metadata(limit=limit, after=after)
+
+    def get_metadata(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        return self.store.get_metadata(conversation_id)
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Tuple[str, float]], int]:
+        self.flush()
+        return self.store.search(query, limit=limit, offset=offset)
+
+    def append_messages(self, conversation_id: str, messages: List[Dict], updates: Dict[str, Any]) -> bool:
+        def apply(entry: _CachedConversation):
+            entry.conversation["messages"].extend(messages)
+            entry.conversation.update(updates)
+            entry.messages.extend(messages)
+            entry.updates.update(updates)
+        return self._mutate(conversation_id, apply)
+
+    def append_message(self, conversation_id: str, message: Dict, updates: Dict[str, Any]) -> bool:
+        return self.append_messages(conversation_id, [message], updates)
+
+    def update(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        def apply(entry: _CachedConversation):
+            entry.conversation.update(updates)
+            entry.updates.update(updates)
+        return self._mutate(conversation_id, apply)
+
+    def clear_messages(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        def apply(entry: _CachedConversation):
+            entry.conversation["messages"] = []
+            entry.conversation.update(updates)
+            entry.messages = []
+            entry.updates.update(updates)
+            entry.cleared = True
+        return self._mutate(conversation_id, apply)
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._flush_lock:
+            with self._lock:
+                entry = self._entries.pop(conversation_id, None)
+                self._dirty.pop(conversation_id, None)
+                self._generation += 1
+            # Una conversación creada y aún no escrita solo existía en memoria
+            return self.store.delete(conversation_id) or entry is not None
+
+    def save(self, conversation: Dict) -> None:
+        with self._flush_lock:
+            with self._lock:
+                self._entries.pop(conversation["id"], None)
+                self._dirty.pop(conversation["id"], None)
+                self._generation += 1
+            self.store.save(conversation)
+
+    def close(self) -> None:
+        self.flush()
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cache = {
+                "cached": len(self._entries),
+                "dirty": len(self._dirty),
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "revalidate": self.revalidate,
+                "flushed": self._flushed,
+                "flush_interval_seconds": self.flush_interval,
+            }
+        return {**self.store.stats(), "cache": cache}
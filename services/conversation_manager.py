@@ -2,48 +2,67 @@
 Gestor de conversaciones para ORIGEN
 Maneja la creación, guardado y recuperación de conversaciones
 """
-import json
-import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
+import threading
 import uuid
 
+from config import CONVERSATIONS_CACHE_MAX, CONVERSATIONS_FLUSH_SECONDS, CONVERSATIONS_SEARCH_ENABLED
+from models import ChatTurn
+from services.conversation_cache import WriteBehindConversationStore
+from services.conversation_search import ConversationSearchIndex, best_message, snippet, tokenize
+from services.conversation_store import FileConversationStore, decode_cursor, encode_cursor, validate_fields
+from services.storage_backend import shared_backend
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.conversations")
+
+
 class ConversationManager:
     """Gestiona las conversaciones del usuario"""
     
-    def __init__(self, storage_path: str = "conversations"):
+    def __init__(
+        self,
+        storage_path: str = "conversations",
+        store=None,
+        cache_size: int = CONVERSATIONS_CACHE_MAX,
+        flush_interval: float = CONVERSATIONS_FLUSH_SECONDS,
+        search: bool = CONVERSATIONS_SEARCH_ENABLED,
+    ):
         """
         Inicializa el gestor de conversaciones
         
         Args:
             storage_path: Ruta donde se guardarán las conversaciones
+            store: Almacén de conversaciones (por defecto, archivos en storage_path)
+            cache_size: Conversaciones en la caché write-behind (0 = sin caché)
+            flush_interval: Segundos máximos que un cambio espera en memoria antes de escribirse
+            search: Activar la búsqueda de texto completo sobre los mensajes. Con almacenes
+                compartidos entre procesos el índice vive en el almacén (FTS5 en SQLite);
+                si el almacén no lo ofrece, la búsqueda queda desactivada en lugar de
+                responder con el índice parcial de un solo worker
         """
         self.storage_path = storage_path
-        os.makedirs(storage_path, exist_ok=True)
-        self.conversations_file = os.path.join(storage_path, "conversations.json")
-        self._ensure_storage()
-    
-    def _ensure_storage(self):
-        """Asegura que existe el archivo de almacenamiento"""
-        if not os.path.exists(self.conversations_file):
-            self._save_conversations([])
-    
-    def _load_conversations(self) -> List[Dict]:
-        """Carga todas las conversaciones"""
-        try:
-            with open(self.conversations_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error cargando conversaciones: {e}")
-            return []
-    
-    def _save_conversations(self, conversations: List[Dict]):
-        """Guarda todas las conversaciones"""
-        try:
-            with open(self.conversations_file, 'w', encoding='utf-8') as f:
-                json.dump(conversations, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error guardando conversaciones: {e}")
+        store = store or FileConversationStore(storage_path)
+        if cache_size > 0:
+            store = WriteBehindConversationStore(store, max_conversations=cache_size, flush_interval=flush_interval)
+        self.store = store
+        self.search_index: Optional[ConversationSearchIndex] = None
+        # El almacén mantiene el índice en la misma transacción que los mensajes
+        self.search_in_store = bool(search and getattr(store, "full_text_search", False))
+        self._search_disabled = "La búsqueda de conversaciones está desactivada (CONVERSATIONS_SEARCH_ENABLED)"
+        if search and not self.search_in_store:
+            if getattr(store, "shared", False):
+                # Un índice por proceso solo vería las escrituras de este worker
+                self._search_disabled = (
+                    "La búsqueda de conversaciones no está disponible: el backend compartido no tiene índice FTS5"
+                )
+                log.warning("⚠️ Búsqueda de conversaciones desactivada", backend=getattr(store, "backend", ""))
+            else:
+                # Se construye antes de aceptar escrituras; después se mantiene en cada cambio
+                self.search_index = ConversationSearchIndex()
+                for conv in self.store.list(limit=0):
+                    self.search_index.add(conv["id"], (m.get("content", "") for m in conv["messages"]))
     
     def create_conversation(self) -> Dict:
         """
@@ -61,9 +80,7 @@ class ConversationManager:
             "first_message_preview": ""
         }
         
-        conversations = self._load_conversations()
-        conversations.insert(0, conversation)  # Insertar al inicio
-        self._save_conversations(conversations)
+        self.store.create(conversation)
         
         return conversation
     
@@ -77,11 +94,7 @@ class ConversationManager:
         Returns:
             Dict con los datos de la conversación o None si no existe
         """
-        conversations = self._load_conversations()
-        for conv in conversations:
-            if conv["id"] == conversation_id:
-                return conv
-        return None
+        return self.store.get(conversation_id)
     
     def get_all_conversations(self, limit: int = 50) -> List[Dict]:
         """
@@ -93,10 +106,32 @@ class ConversationManager:
         Returns:
             Lista de conversaciones ordenadas por fecha de actualización
         """
-        conversations = self._load_conversations()
-        # Ordenar por fecha de actualización (más reciente primero)
-        conversations.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-        return conversations[:limit]
+        return self.store.list(limit=limit)
+    
+    def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None, fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Lista los metadatos de las conversaciones para el sidebar, sin mensajes
+        
+        Args:
+            limit: Tamaño de la página
+            cursor: Cursor devuelto por la página anterior (None = primera página)
+            fields: Campos a incluir (por defecto todos los del índice; el id siempre se incluye)
+            
+        Returns:
+            (conversaciones ordenadas por fecha de actualización, cursor de la siguiente página o None)
+            
+        Raises:
+            ValueError: Si el cursor o los campos no son válidos
+        """
+        fields = validate_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+        limit = max(1, int(limit))
+        # Un elemento extra indica si hay otra página
+        metas = self.store.list_metadata(limit=limit + 1, after=after)
+        next_cursor = encode_cursor(metas[limit - 1]) if len(metas) > limit else None
+        return [{name: meta.get(name) for name in fields} for meta in metas[:limit]], next_cursor
     
     def add_message(self, conversation_id: str, message_type: str, content: str) -> bool:
         """
@@ -110,27 +145,117 @@ class ConversationManager:
         Returns:
             True si se agregó correctamente, False en caso contrario
         """
-        conversations = self._load_conversations()
-        
-        for conv in conversations:
-            if conv["id"] == conversation_id:
-                message = {
-                    "type": message_type,
-                    "content": content,
-                    "timestamp": datetime.now().isoformat()
-                }
-                conv["messages"].append(message)
-                conv["updated_at"] = datetime.now().isoformat()
-                
-                # Si es el primer mensaje del usuario, generar título
-                if message_type == "user" and len([m for m in conv["messages"] if m["type"] == "user"]) == 1:
-                    conv["title"] = self._generate_title(content)
-                    conv["first_message_preview"] = content[:100]
-                
-                self._save_conversations(conversations)
-                return True
-        
-        return False
+        return self._append(conversation_id, [(message_type, content)])
+    
+    def add_turn(self, conversation_id: str, question: str, answer: str) -> bool:
+        """
+        Agrega la pregunta del usuario y la respuesta de ORIGEN en una sola escritura
+        
+        Args:
+            conversation_id: ID de la conversación
+            question: Mensaje del usuario
+            answer: Respuesta generada
+            
+        Returns:
+            True si se agregaron, False si la conversación no existe
+        """
+        return self._append(conversation_id, [("user", question), ("ai", answer)])
+    
+    def recent_turns(self, conversation_id: str, limit: int = 8) -> List[ChatTurn]:
+        """
+        Últimos mensajes de una conversación como turnos de historial para el prompt
+        
+        Args:
+            conversation_id: ID de la conversación
+            limit: Número máximo de turnos (todos si es <= 0)
+            
+        Returns:
+            Lista de turnos en orden cronológico (vacía si la conversación no existe)
+        """
+        conv = self.store.get(conversation_id)
+        if conv is None:
+            return []
+        messages = conv["messages"][-limit:] if limit and limit > 0 else conv["messages"]
+        turns = []
+        for m in messages:
+            try:
+                timestamp = datetime.fromisoformat(m.get("timestamp", "")).timestamp()
+            except ValueError:
+                timestamp = 0.0
+            role = "assistant" if m["type"] == "ai" else m["type"]
+            turns.append(ChatTurn(role=role, content=m["content"], timestamp=timestamp))
+        return turns
+    
+    def _append(self, conversation_id: str, entries: List[Tuple[str, str]]) -> bool:
+        """Agrega mensajes (tipo, contenido) y actualiza título y vista previa si corresponde."""
+        conv = self.store.get(conversation_id)
+        if conv is None:
+            return False
+        
+        now = datetime.now().isoformat()
+        messages = [{"type": message_type, "content": content, "timestamp": now} for message_type, content in entries]
+        updates = {"updated_at": now}
+        
+        # Si es el primer mensaje del usuario, generar título
+        if not any(m["type"] == "user" for m in conv["messages"]):
+            first = next((content for message_type, content in entries if message_type == "user"), None)
+            if first is not None:
+                updates["title"] = self._generate_title(first)
+                updates["first_message_preview"] = first[:100]
+        
+        if not self.store.append_messages(conversation_id, messages, updates):
+            return False
+        if self.search_index is not None:
+            self.search_index.add(conversation_id, (content for _, content in entries))
+        return True
+    
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        Busca conversaciones por el contenido de sus mensajes
+        
+        Args:
+            query: Texto a buscar (sin distinguir mayúsculas ni tildes)
+            limit: Tamaño de la página
+            offset: Resultados a omitir (paginación)
+            
+        Returns:
+            (resultados ordenados por relevancia, total de conversaciones encontradas)
+            
+        Raises:
+            RuntimeError: Si la búsqueda está desactivada o el backend no la ofrece
+        """
+        limit, offset = max(1, int(limit)), max(0, int(offset))
+        if self.search_in_store:
+            ranked, total = self.store.search(query, limit=limit, offset=offset)
+        elif self.search_index is not None:
+            ranked, total = self.search_index.search(query, limit=limit, offset=offset)
+        else:
+            raise RuntimeError(self._search_disabled)
+        terms = tokenize(query)
+        results = []
+        for conversation_id, score in ranked:
+            conv = self.store.get(conversation_id)
+            if conv is None:
+                continue
+            message = best_message(conv["messages"], query) or {}
+            results.append({
+                "id": conversation_id,
+                "title": conv["title"],
+                "updated_at": conv["updated_at"],
+                "score": round(score, 4),
+                "message": {
+                    "type": message.get("type"),
+                    "timestamp": message.get("timestamp"),
+                    "snippet": snippet(message.get("content", ""), terms),
+                },
+            })
+        return results, total
+    
+    def flush(self) -> None:
+        """Escribe en el almacén los cambios que aún estén solo en memoria"""
+        flush = getattr(self.store, "flush", None)
+        if flush is not None:
+            flush()
     
     def _generate_title(self, first_message: str) -> str:
         """
@@ -170,16 +295,10 @@ class ConversationManager:
         Returns:
             True si se actualizó correctamente, False en caso contrario
         """
-        conversations = self._load_conversations()
-        
-        for conv in conversations:
-            if conv["id"] == conversation_id:
-                conv["title"] = title
-                conv["updated_at"] = datetime.now().isoformat()
-                self._save_conversations(conversations)
-                return True
-        
-        return False
+        return self.store.update(conversation_id, {
+            "title": title,
+            "updated_at": datetime.now().isoformat()
+        })
     
     def delete_conversation(self, conversation_id: str) -> bool:
         """
@@ -191,16 +310,10 @@ class ConversationManager:
         Returns:
             True si se eliminó correctamente, False en caso contrario
         """
-        conversations = self._load_conversations()
-        original_length = len(conversations)
-        
-        conversations = [c for c in conversations if c["id"] != conversation_id]
-        
-        if len(conversations) < original_length:
-            self._save_conversations(conversations)
-            return True
-        
-        return False
+        deleted = self.store.delete(conversation_id)
+        if deleted and self.search_index is not None:
+            self.search_index.remove(conversation_id)
+        return deleted
     
     def clear_conversation(self, conversation_id: str) -> bool:
         """
@@ -212,15 +325,25 @@ class ConversationManager:
         Returns:
             True si se limpió correctamente, False en caso contrario
         """
-        conversations = self._load_conversations()
-        
-        for conv in conversations:
-            if conv["id"] == conversation_id:
-                conv["messages"] = []
-                conv["title"] = "Nueva conversación"
-                conv["first_message_preview"] = ""
-                conv["updated_at"] = datetime.now().isoformat()
-                self._save_conversations(conversations)
-                return True
-        
-        return False
+        cleared = self.store.clear_messages(conversation_id, {
+            "title": "Nueva conversación",
+            "first_message_preview": "",
+            "updated_at": datetime.now().isoformat()
+        })
+        if cleared and self.search_index is not None:
+            self.search_index.remove(conversation_id)
+        return cleared
+
+
+_shared: Optional[ConversationManager] = None
+_shared_lock = threading.Lock()
+
+
+def shared_conversation_manager() -> ConversationManager:
+    """Gestor del proceso sobre el backend configurado, compartido por el chat y el sidebar
+    (una sola caché write-behind por proceso)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ConversationManager(store=shared_backend().conversation_store())
+        return _shared
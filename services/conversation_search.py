@@ -0,0 +1,133 @@
+"""
+Búsqueda de texto completo sobre las conversaciones guardadas.
+
+Índice invertido en memoria: cada conversación es un documento (el texto de todos sus
+mensajes) y cada término normalizado (minúsculas, sin tildes ni signos) apunta a las
+conversaciones que lo contienen con su frecuencia. ConversationManager lo construye una
+vez al iniciar y lo mantiene al agregar mensajes y al limpiar o eliminar conversaciones,
+así que una búsqueda solo recorre las listas de los términos consultados.
+
+El ranking es BM25; el fragmento mostrado se elige después, solo para la página
+pedida. Este índice es del proceso, así que solo se usa con almacenes locales; con
+almacenes compartidos entre workers (SQLite) la búsqueda usa la tabla FTS5 de la base,
+indexada con los mismos términos de `tokenize`.
+"""
+import math
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.text_normalization import canonical_question, fold_text
+
+# Palabras sin valor para buscar (ya normalizadas, sin tildes)
+_STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuando", "de", "del", "donde", "el", "ella",
+    "en", "era", "es", "esa", "ese", "eso", "esta", "estaba", "este", "esto", "fue", "ha",
+    "hay", "la", "las", "le", "les", "lo", "los", "me", "mi", "mis", "mas", "muy", "no",
+    "o", "para", "pero", "por", "porque", "que", "quien", "se", "si", "sin", "sobre", "son",
+    "su", "sus", "te", "tu", "tus", "un", "una", "uno", "y", "ya", "yo",
+}
+
+# Parámetros habituales de BM25
+_K1 = 1.2
+_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos indexables de un texto (normalizados, sin palabras vacías)."""
+    return [t for t in canonical_question(text).split() if len(t) > 1 and t not in _STOPWORDS]
+
+
+def snippet(content: str, terms: Iterable[str], width: int = 160) -> str:
+    """Fragmento de `content` alrededor del primer término encontrado."""
+    folded = fold_text(content)
+    positions = [folded.find(term) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    text = " ".join(content.split())
+    if len(text) <= width:
+        return text
+    # fold_text conserva la longitud en texto latino, así que la posición sirve en el original
+    start = max(0, min(positions) - width // 4) if positions else 0
+    end = min(len(text), start + width)
+    return ("…" if start > 0 else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+class ConversationSearchIndex:
+    """Índice invertido incremental de los mensajes por conversación."""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, conversation_id: str, texts: Iterable[str]) -> None:
+        """Agrega el texto de mensajes nuevos de la conversación."""
+        terms = Counter()
+        for text in texts:
+            terms.update(tokenize(text))
+        if not terms:
+            return
+        with self._lock:
+            doc_terms = self._doc_terms.setdefault(conversation_id, Counter())
+            for term, count in terms.items():
+                doc_terms[term] += count
+                postings = self._postings.setdefault(term, {})
+                postings[conversation_id] = postings.get(conversation_id, 0) + count
+            added = sum(terms.values())
+            self._doc_lengths[conversation_id] = self._doc_lengths.get(conversation_id, 0) + added
+            self._total_length += added
+
+    def remove(self, conversation_id: str) -> None:
+        """Quita la conversación del índice (al eliminarla o limpiar sus mensajes)."""
+        with self._lock:
+            doc_terms = self._doc_terms.pop(conversation_id, None)
+            if doc_terms is None:
+                return
+            for term in doc_terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(conversation_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._doc_lengths.pop(conversation_id, 0)
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Tuple[str, float]], int]:
+        """Conversaciones que contienen algún término de la consulta, por relevancia.
+
+        Returns:
+            (página de (conversation_id, puntaje), total de conversaciones encontradas)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores: Dict[str, float] = {}
+        with self._lock:
+            docs = len(self._doc_lengths)
+            if not terms or not docs:
+                return [], 0
+            avg_length = self._total_length / docs
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for conversation_id, tf in postings.items():
+                    norm = _K1 * (1 - _B + _B * self._doc_lengths[conversation_id] / avg_length)
+                    scores[conversation_id] = scores.get(conversation_id, 0.0) + idf * tf * (_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[offset:offset + limit], len(ranked)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"conversations": len(self._doc_terms), "terms": len(self._postings), "tokens": self._total_length}
+
+
+def best_message(messages: List[Dict], query: str) -> Optional[Dict]:
+    """Mensaje de la conversación con más términos de la consulta (el más reciente si empatan)."""
+    terms = set(tokenize(query))
+    best, best_hits = None, 0
+    for message in messages:
+        hits = len(terms.intersection(tokenize(message.get("content", ""))))
+        if hits and hits >= best_hits:
+            best, best_hits = message, hits
+    return best
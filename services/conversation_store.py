@@ -0,0 +1,407 @@
+"""
+Almacenes de conversaciones del sidebar (ORIGEN).
+
+ConversationManager decide el contenido (títulos, vistas previas, fechas) y delega la
+persistencia en un almacén con operaciones por conversación:
+
+    create(conv)                          -> None
+    get(conversation_id)                  -> Optional[Dict]   (con mensajes)
+    list(limit)                           -> List[Dict]       (más reciente primero)
+    list_metadata(limit, after)           -> List[Dict]       (solo campos del sidebar, ver abajo)
+    get_metadata(conversation_id)         -> Optional[Dict]   (campos del sidebar de una conversación)
+    append_messages(id, messages, updates) -> bool            (todos o ninguno)
+    append_message(id, message, updates)  -> bool
+    update(id, updates)                   -> bool
+    clear_messages(id, updates)           -> bool
+    delete(id)                            -> bool
+    save(conv)                            -> None             (reemplaza el registro completo)
+    stats()                               -> Dict
+
+`list_metadata` lee solo el índice de metadatos, ordenado por (updated_at, id)
+descendente, y devuelve las conversaciones estrictamente anteriores a la clave `after`
+(paginación por cursor). Su costo no depende de la cantidad de mensajes.
+
+El atributo `shared` indica si otros procesos pueden escribir el mismo almacén; en ese
+caso la caché write-behind revalida sus copias con `get_metadata` antes de usarlas.
+
+Este módulo contiene el almacén en archivos; la implementación SQLite está en
+services.sqlite_storage.
+"""
+import base64
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import CONVERSATIONS_INDEX_COMPACT_EVERY
+from services import metrics
+from services.tracing import traced
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.conversations")
+
+INDEX_VERSION = 1
+
+# Franjas de locks por conversación (las de franjas distintas no se bloquean)
+_LOCK_STRIPES = 16
+# Los ids generados son uuid4; cualquier otro se guarda con el hash como nombre de archivo
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+# Campos del índice de metadatos y cuáles se pueden actualizar
+_META_FIELDS = ("id", "title", "created_at", "updated_at", "first_message_preview", "message_count")
+_UPDATABLE_FIELDS = ("title", "created_at", "updated_at", "first_message_preview")
+# Campos que se pueden pedir en el listado del sidebar
+LIST_FIELDS = _META_FIELDS
+
+_store_ops = metrics.counter(
+    "aluna_conversation_store_operations", "Lecturas/escrituras del almacén de conversaciones", ("op", "outcome")
+)
+_conversations_stored = metrics.gauge(
+    "aluna_conversations_stored", "Conversaciones en el índice de metadatos"
+)
+
+
+def encode_cursor(meta: Dict[str, Any]) -> str:
+    """Cursor opaco que apunta justo después de la conversación dada."""
+    key = json.dumps([meta.get("updated_at", ""), meta["id"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Clave (updated_at, id) de un cursor; ValueError si no es válido."""
+    try:
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(updated_at, str) or not isinstance(conversation_id, str):
+            raise TypeError
+        return updated_at, conversation_id
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def validate_fields(fields: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """Proyección pedida (siempre incluye el id); ValueError si hay campos desconocidos."""
+    if not fields:
+        return LIST_FIELDS
+    fields = [name.strip() for name in fields if name.strip()]
+    unknown = [name for name in fields if name not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)} (usa {', '.join(LIST_FIELDS)})")
+    return ("id",) + tuple(name for name in LIST_FIELDS if name != "id" and name in fields)
+
+
+class FileConversationStore:
+    """Un archivo de mensajes de solo-anexado por conversación + índice compacto de metadatos.
+
+    - `messages/<id>.jsonl`: un mensaje por línea; agregar un mensaje es anexar una línea.
+    - `index.json` + `index.log`: snapshot de los campos del sidebar y registro de cambios
+      posteriores. El índice vive en memoria; el registro se reescribe en un snapshot
+      nuevo cada `compact_every` cambios.
+
+    Cada operación toca solo la conversación involucrada y el registro del índice. Un
+    solo proceso escritor por directorio (como el resto del backend `files`).
+    """
+
+    backend = "files"
+    shared = False
+
+    def __init__(self, storage_path: str = "conversations", compact_every: int = CONVERSATIONS_INDEX_COMPACT_EVERY):
+        """
+        Args:
+            storage_path: Directorio de las conversaciones.
+            compact_every: Cambios del registro del índice tras los que se reescribe el snapshot.
+        """
+        self.storage_path = storage_path
+        self.messages_dir = os.path.join(storage_path, "messages")
+        self.index_file = os.path.join(storage_path, "index.json")
+        self.index_log = os.path.join(storage_path, "index.log")
+        # Archivo único de versiones anteriores, migrado al iniciar
+        self.legacy_file = os.path.join(storage_path, "conversations.json")
+        self.compact_every = max(1, int(compact_every))
+        os.makedirs(self.messages_dir, exist_ok=True)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._index_lock = threading.Lock()
+        self._log_file = None
+        self._log_records = 0
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._load_index()
+        # Claves (updated_at, id) ordenadas de forma ascendente para el listado
+        self._order: List[Tuple[str, str]] = sorted(
+            (meta.get("updated_at", ""), conversation_id) for conversation_id, meta in self._index.items()
+        )
+
+    # ----------------------
+    # Índice de metadatos
+    # ----------------------
+    def _load_index(self) -> None:
+        has_index = os.path.exists(self.index_file) or os.path.exists(self.index_log)
+        if not has_index and os.path.exists(self.legacy_file):
+            self._migrate_legacy()
+            return
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._index = {meta["id"]: meta for meta in data.get("conversations", [])}
+                _store_ops.inc(op="load", outcome="ok")
+            except Exception as e:
+                _store_ops.inc(op="load", outcome="error")
+                log.error("❌ Error cargando índice de conversaciones", error=str(e))
+        if os.path.exists(self.index_log):
+            with open(self.index_log, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except Exception:
+                        # Línea truncada (p. ej. caída a mitad de escritura): se ignora
+                        continue
+                    self._log_records += 1
+                    conversation_id = record.pop("id", None)
+                    if record.pop("op", None) == "del":
+                        self._index.pop(conversation_id, None)
+                    elif conversation_id is not None:
+                        self._index.setdefault(conversation_id, {"id": conversation_id}).update(record)
+        _conversations_stored.set(len(self._index))
+        if self._log_records >= self.compact_every:
+            with self._index_lock:
+                self._write_index_locked()
+
+    def _migrate_legacy(self) -> None:
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                conversations = json.load(f)
+        except Exception as e:
+            log.error("❌ Error cargando conversaciones heredadas", error=str(e), path=self.legacy_file)
+            return
+        for conv in conversations:
+            messages = conv.get("messages") or []
+            self._write_messages(conv["id"], messages)
+            self._index[conv["id"]] = self._meta_from(conv, len(messages))
+        with self._index_lock:
+            self._write_index_locked()
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        log.info("📦 Conversaciones migradas a archivos por conversación", conversations=len(conversations))
+
+    @traced("conversations.index_compact")
+    def _write_index_locked(self) -> None:
+        """Reescribe el snapshot del índice y vacía su registro (con `_index_lock` tomado)."""
+        try:
+            tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": INDEX_VERSION, "conversations": list(self._index.values())},
+                    f, ensure_ascii=False, separators=(",", ":"),
+                )
+            os.replace(tmp_path, self.index_file)
+            # Reaplicar el registro sobre el snapshot nuevo es idempotente, así que una
+            # caída antes de borrarlo no pierde ni duplica cambios
+            self._close_log_locked()
+            if os.path.exists(self.index_log):
+                os.remove(self.index_log)
+            self._log_records = 0
+            _store_ops.inc(op="index_compact", outcome="ok")
+        except Exception as e:
+            _store_ops.inc(op="index_compact", outcome="error")
+            log.error("❌ Error guardando índice de conversaciones", error=str(e))
+
+    def _append_index_locked(self, record: Dict[str, Any]) -> None:
+        if self._log_file is None:
+            self._log_file = open(self.index_log, "a", encoding="utf-8")
+        self._log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log_file.flush()
+        self._log_records += 1
+        _conversations_stored.set(len(self._index))
+        if self._log_records >= self.compact_every:
+            self._write_index_locked()
+
+    def _set_meta(self, conversation_id: str, fields: Dict[str, Any], create: bool = False) -> bool:
+        """Actualiza los metadatos en memoria y anexa el cambio al registro del índice."""
+        with self._index_lock:
+            meta = self._index.get(conversation_id)
+            if meta is None:
+                if not create:
+                    return False
+                meta = self._index[conversation_id] = {"id": conversation_id}
+            else:
+                self._unorder_locked(meta)
+            meta.update(fields)
+            bisect.insort(self._order, (meta.get("updated_at", ""), conversation_id))
+            self._append_index_locked({"op": "put", "id": conversation_id, **fields})
+            return True
+
+    def _unorder_locked(self, meta: Dict[str, Any]) -> None:
+        key = (meta.get("updated_at", ""), meta["id"])
+        pos = bisect.bisect_left(self._order, key)
+        if pos < len(self._order) and self._order[pos] == key:
+            del self._order[pos]
+
+    def _get_meta(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._index_lock:
+            meta = self._index.get(conversation_id)
+            return dict(meta) if meta is not None else None
+
+    @staticmethod
+    def _meta_from(conversation: Dict, message_count: int) -> Dict[str, Any]:
+        return {
+            "id": conversation["id"],
+            "title": conversation.get("title", ""),
+            "created_at": conversation.get("created_at", ""),
+            "updated_at": conversation.get("updated_at", ""),
+            "first_message_preview": conversation.get("first_message_preview", ""),
+            "message_count": message_count,
+        }
+
+    # ----------------------
+    # Mensajes por conversación
+    # ----------------------
+    def _lock_for(self, conversation_id: str) -> threading.Lock:
+        return self._locks[hash(conversation_id) % len(self._locks)]
+
+    def _messages_path(self, conversation_id: str) -> str:
+        name = conversation_id if _SAFE_ID.match(conversation_id) else hashlib.sha1(conversation_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.messages_dir, name + ".jsonl")
+
+    @traced("conversations.read_messages")
+    def _read_messages(self, conversation_id: str) -> List[Dict]:
+        messages = []
+        try:
+            with open(self._messages_path(conversation_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        messages.append(json.loads(line))
+                    except Exception:
+                        continue
+        except FileNotFoundError:
+            pass
+        return messages
+
+    def _write_messages(self, conversation_id: str, messages: List[Dict]) -> None:
+        path = self._messages_path(conversation_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _record(meta: Dict[str, Any], messages: List[Dict]) -> Dict:
+        return {
+            "id": meta["id"],
+            "title": meta.get("title", ""),
+            "created_at": meta.get("created_at", ""),
+            "updated_at": meta.get("updated_at", ""),
+            "messages": messages,
+            "first_message_preview": meta.get("first_message_preview", ""),
+        }
+
+    # ----------------------
+    # Operaciones
+    # ----------------------
+    def create(self, conversation: Dict) -> None:
+        self.save(conversation)
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        with self._lock_for(conversation_id):
+            meta = self._get_meta(conversation_id)
+            if meta is None:
+                return None
+            return self._record(meta, self._read_messages(conversation_id))
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        return [self._record(meta, self._read_messages(meta["id"])) for meta in self.list_metadata(limit)]
+
+    def get_metadata(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self._get_meta(conversation_id)
+
+    def list_metadata(self, limit: int = 50, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        """Metadatos del sidebar, más reciente primero (todos si `limit` <= 0)."""
+        with self._index_lock:
+            end = bisect.bisect_left(self._order, tuple(after)) if after else len(self._order)
+            start = max(0, end - limit) if limit and limit > 0 else 0
+            return [dict(self._index[conversation_id]) for _, conversation_id in reversed(self._order[start:end])]
+
+    @traced("conversations.append")
+    def append_messages(self, conversation_id: str, messages: List[Dict], updates: Dict[str, Any]) -> bool:
+        with self._lock_for(conversation_id):
+            meta = self._get_meta(conversation_id)
+            if meta is None:
+                return False
+            try:
+                # Una sola escritura para todos los mensajes (p. ej. pregunta y respuesta)
+                with open(self._messages_path(conversation_id), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages))
+                _store_ops.inc(op="append", outcome="ok")
+            except Exception as e:
+                _store_ops.inc(op="append", outcome="error")
+                log.error("❌ Error guardando mensajes", conversation_id=conversation_id, error=str(e))
+                return False
+            fields = {k: v for k, v in updates.items() if k in _UPDATABLE_FIELDS}
+            fields["message_count"] = int(meta.get("message_count", 0)) + len(messages)
+            return self._set_meta(conversation_id, fields)
+
+    def append_message(self, conversation_id: str, message: Dict, updates: Dict[str, Any]) -> bool:
+        return self.append_messages(conversation_id, [message], updates)
+
+    def update(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        fields = {k: v for k, v in updates.items() if k in _UPDATABLE_FIELDS}
+        with self._lock_for(conversation_id):
+            return self._set_meta(conversation_id, fields)
+
+    def clear_messages(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        with self._lock_for(conversation_id):
+            if self._get_meta(conversation_id) is None:
+                return False
+            try:
+                os.remove(self._messages_path(conversation_id))
+            except FileNotFoundError:
+                pass
+            fields = {k: v for k, v in updates.items() if k in _UPDATABLE_FIELDS}
+            fields["message_count"] = 0
+            return self._set_meta(conversation_id, fields)
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock_for(conversation_id):
+            with self._index_lock:
+                meta = self._index.pop(conversation_id, None)
+                if meta is None:
+                    return False
+                self._unorder_locked(meta)
+                self._append_index_locked({"op": "del", "id": conversation_id})
+            # Primero el índice: una caída a mitad deja como mucho un archivo huérfano
+            try:
+                os.remove(self._messages_path(conversation_id))
+            except FileNotFoundError:
+                pass
+            return True
+
+    def save(self, conversation: Dict) -> None:
+        messages = conversation.get("messages") or []
+        with self._lock_for(conversation["id"]):
+            self._write_messages(conversation["id"], messages)
+            self._set_meta(conversation["id"], self._meta_from(conversation, len(messages)), create=True)
+
+    def _close_log_locked(self) -> None:
+        if self._log_file is not None:
+            try:
+                self._log_file.close()
+            finally:
+                self._log_file = None
+
+    def close(self) -> None:
+        with self._index_lock:
+            self._close_log_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            index_bytes = os.path.getsize(self.index_file)
+        except OSError:
+            index_bytes = 0
+        with self._index_lock:
+            return {
+                "backend": self.backend,
+                "directory": self.storage_path,
+                "conversations": len(self._index),
+                "index_bytes": index_bytes,
+                "index_log_records": self._log_records,
+            }
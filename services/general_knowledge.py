@@ -3,10 +3,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from typing import Dict, List
-import re
 
 from config import UNIVERSIDAD_KEYWORDS
 from models import GeneralKnowledgeResult
+from services.keyword_matcher import KeywordMatches, shared_matcher
 
 
 @dataclass
@@ -76,15 +76,13 @@ class GeneralKnowledgeEngine:
     BASE_ACTIVATION = 1.2
 
     def __init__(self) -> None:
-        self._university_keywords = tuple(kw.lower() for kw in UNIVERSIDAD_KEYWORDS)
+        self._keywords = shared_matcher()
 
-    def _contains_university_term(self, question_lower: str) -> bool:
-        return any(keyword in question_lower for keyword in self._university_keywords)
-
-    def _collect_category_signal(self, question_lower: str) -> _CategorySignals | None:
+    def _collect_category_signal(self, keyword_matches: KeywordMatches) -> _CategorySignals | None:
         best_signal = None
-        for category, keywords in self.CATEGORY_KEYWORDS.items():
-            matches = [kw for kw in keywords if kw in question_lower]
+        found = keyword_matches.by_payload("general.category")
+        for category in self.CATEGORY_KEYWORDS:
+            matches = found.get(category)
             if matches:
                 weight = 0.8 + 0.15 * min(len(matches), 3)
                 if not best_signal or weight > best_signal.weight:
@@ -105,24 +103,26 @@ class GeneralKnowledgeEngine:
         if not question:
             return GeneralKnowledgeResult(is_general=False, reason="pregunta vacía")
 
-        normalized = re.sub(r"\s+", " ", question.strip().lower())
+        # Una sola pasada del motor compartido (memorizada para los demás clasificadores)
+        keyword_matches = self._keywords.scan(question)
+        normalized = keyword_matches.text
 
-        if self._contains_university_term(normalized):
+        if keyword_matches.has("university"):
             return GeneralKnowledgeResult(is_general=False, reason="coincidencias con palabra clave institucional")
 
         score = 0.0
         reasons: List[str] = []
-        category_signal = self._collect_category_signal(normalized)
+        category_signal = self._collect_category_signal(keyword_matches)
 
         if category_signal:
             score += category_signal.weight
             reasons.append(f"palabras clave de {category_signal.category}: {', '.join(category_signal.matches[:3])}")
 
-        if any(prefix in normalized for prefix in self.GENERAL_PREFIXES):
+        if keyword_matches.has("general.prefix"):
             score += 0.8
             reasons.append("prefijo interrogativo general")
 
-        if any(connector in normalized for connector in self.GENERAL_CONNECTORS):
+        if keyword_matches.has("general.connector"):
             score += 0.4
             reasons.append("solicitud de explicación")
 
@@ -144,3 +144,17 @@ class GeneralKnowledgeEngine:
             confidence=confidence if is_general else 0.0,
             reason=reason_text,
         )
+
+
+_matcher = shared_matcher()
+_matcher.register("university", UNIVERSIDAD_KEYWORDS)
+_matcher.register("general.prefix", GeneralKnowledgeEngine.GENERAL_PREFIXES)
+_matcher.register("general.connector", GeneralKnowledgeEngine.GENERAL_CONNECTORS)
+_matcher.register(
+    "general.category",
+    {
+        keyword: category
+        for category, keywords in GeneralKnowledgeEngine.CATEGORY_KEYWORDS.items()
+        for keyword in keywords
+    },
+)
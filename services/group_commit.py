@@ -0,0 +1,54 @@
+"""
+Confirmación agrupada (group commit) de escrituras concurrentes.
+
+El primer hilo en llegar se convierte en líder y confirma en una sola llamada todo
+lo encolado hasta ese momento; los demás esperan el resultado de su elemento.
+Mientras el líder escribe se acumula el siguiente lote, así que bajo carga cada
+escritura física (write, fsync, transacción) cubre varias solicitudes.
+"""
+from __future__ import annotations
+import threading
+from typing import Any, Callable, List
+
+
+class GroupCommit:
+    """Serializa confirmaciones agrupando los elementos que llegan mientras tanto.
+
+    `commit` recibe la lista de elementos del lote y retorna un resultado por
+    elemento (en el mismo orden); si lanza una excepción, todos los elementos del
+    lote la reciben.
+    """
+
+    def __init__(self, commit: Callable[[List[Any]], List[Any]]):
+        self._commit = commit
+        self._cond = threading.Condition()
+        self._pending: List[List[Any]] = []  # [item, resultado, error, listo]
+        self._leader_active = False
+
+    def submit(self, item: Any) -> Any:
+        ticket = [item, None, None, False]
+        with self._cond:
+            self._pending.append(ticket)
+            while self._leader_active and not ticket[3]:
+                self._cond.wait()
+            if not ticket[3]:
+                self._leader_active = True
+                batch, self._pending = self._pending, []
+            else:
+                batch = None
+        if batch is not None:
+            try:
+                for t, result in zip(batch, self._commit([t[0] for t in batch])):
+                    t[1] = result
+            except Exception as e:
+                for t in batch:
+                    t[2] = e
+            finally:
+                with self._cond:
+                    for t in batch:
+                        t[3] = True
+                    self._leader_active = False
+                    self._cond.notify_all()
+        if ticket[2] is not None:
+            raise ticket[2]
+        return ticket[1]
@@ -1,109 +1,895 @@
 """
-Almacenamiento persistente de historial de chat basado en JSONL por sesión.
+Almacenamiento persistente de historial de chat en un registro JSONL segmentado.
 Cada línea: {"session_id": str, "role": "user"|"assistant", "content": str, "timestamp": float}
+Borrado de una sesión (lápida): {"session_id": str, "op": "clear", "timestamp": float}
+
+- El registro se divide en segmentos (`<historial>.segments/000001.jsonl`, ...). Solo el
+  último (activo) recibe escrituras y se rota al superar HISTORY_SEGMENT_MAX_MB o
+  HISTORY_SEGMENT_MAX_HOURS. Un archivo JSONL único de versiones anteriores se adopta
+  como primer segmento.
+- Un índice lateral (`<historial>.idx`) guarda, por sesión, la posición (segmento, bytes)
+  de cada línea, de modo que cargar una sesión lee solo sus líneas. Se guarda
+  periódicamente y al iniciar solo se indexa lo escrito después; si los segmentos no
+  coinciden con lo guardado, se reconstruye recorriéndolos.
+- `clear` anexa una lápida y actualiza el índice: O(1) para la solicitud. Un
+  compactador en segundo plano reescribe solo los segmentos cerrados afectados,
+  comprime con zstd los segmentos fríos (si `zstandard` está instalado) y elimina los
+  que superan HISTORY_RETENTION_DAYS. Las posiciones se refieren al contenido sin
+  comprimir, así que comprimir no cambia el índice.
+- En memoria solo se guardan los últimos HISTORY_CACHE_TURNS turnos de cada sesión, en
+  una caché LRU acotada por sesiones y bytes. Pedir más turnos (o todo, `limit=0`) lee
+  del disco sin poblar la caché.
+- Las escrituras pasan por una confirmación agrupada: los turnos de solicitudes
+  concurrentes se escriben con una sola llamada sobre un descriptor abierto de forma
+  permanente y se sincronizan a disco según HISTORY_FSYNC (always | interval | never).
+  `append` retorna cuando su línea está escrita (y sincronizada, con `always`).
+- La caché se reparte en HISTORY_LOCK_STRIPES franjas por sesión; leer del disco no
+  retiene ningún lock global.
+- Un solo proceso debe escribir en un mismo directorio de segmentos.
 """
 from __future__ import annotations
 import os
 import json
+import atexit
+import hashlib
+import itertools
 import threading
+from array import array
+from collections import OrderedDict, deque
 from time import time
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
 
-from config import HISTORY_DIR, HISTORY_FILE
+from config import (
+    HISTORY_FILE,
+    HISTORY_CACHE_MAX_SESSIONS,
+    HISTORY_CACHE_MAX_MB,
+    HISTORY_CACHE_TURNS,
+    HISTORY_LOCK_STRIPES,
+    HISTORY_FSYNC,
+    HISTORY_FSYNC_INTERVAL_SECONDS,
+    HISTORY_INDEX_SAVE_EVERY,
+    HISTORY_SEGMENT_MAX_MB,
+    HISTORY_SEGMENT_MAX_HOURS,
+    HISTORY_COMPACT_INTERVAL_SECONDS,
+    HISTORY_COMPRESS_COLD,
+    HISTORY_COMPRESS_AFTER_HOURS,
+    HISTORY_RETENTION_DAYS,
+)
 from models import ChatTurn
+from services import metrics
+from services.group_commit import GroupCommit
+from services.tracing import traced
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.history")
+
+INDEX_VERSION = 2
+FSYNC_POLICIES = ("always", "interval", "never")
+# Bytes iniciales del segmento activo cuya huella detecta si fue reemplazado
+_HEAD_BYTES = 1024
+# Una posición del índice empaqueta (segmento << 40) | bytes dentro del segmento
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+# Costo aproximado en memoria de un turno además de su contenido
+_TURN_OVERHEAD_BYTES = 200
+_SEGMENT_SUFFIX = ".jsonl"
+_COMPRESSED_SUFFIX = ".jsonl.zst"
+
+_appends = metrics.counter("aluna_history_appends", "Turnos agregados al historial")
+_cache_lookups = metrics.counter(
+    "aluna_history_cache_lookups", "Consultas de historial reciente por resultado de caché", ("result",)
+)
+_commit_batch = metrics.histogram(
+    "aluna_history_commit_batch_lines", "Líneas escritas por cada confirmación agrupada del historial",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+_fsyncs = metrics.counter("aluna_history_fsyncs", "Sincronizaciones a disco del segmento activo")
+_cache_evictions = metrics.counter(
+    "aluna_history_cache_evictions", "Sesiones expulsadas de la caché de historial"
+)
+_index_rebuilds = metrics.counter(
+    "aluna_history_index_rebuilds", "Reconstrucciones completas del índice de historial por motivo", ("reason",)
+)
+_compactions = metrics.counter(
+    "aluna_history_segment_operations", "Operaciones del compactador sobre segmentos cerrados", ("action",)
+)
+
+
+def _pack(segment: int, offset: int) -> int:
+    return (segment << _OFFSET_BITS) | offset
+
+
+def _segment_of(key: int) -> int:
+    return key >> _OFFSET_BITS
+
+
+def _turn_from_record(rec: Dict[str, Any]) -> ChatTurn:
+    return ChatTurn(
+        role=rec.get("role", "user"),
+        content=rec.get("content", ""),
+        timestamp=float(rec.get("timestamp", time())),
+    )
+
+
+def _turn_bytes(turn: ChatTurn) -> int:
+    return len(turn.content) + _TURN_OVERHEAD_BYTES
+
+
+class _CachedSession:
+    """Últimos turnos de una sesión, su tamaño aproximado en bytes y la última
+    posición del registro que reflejan (para no duplicar turnos ya leídos del disco)."""
+
+    __slots__ = ("turns", "size", "last_key", "epoch")
+
+    def __init__(self, turns: List[ChatTurn], maxlen: int, last_key: int, epoch: int):
+        self.turns: deque = deque(turns, maxlen=maxlen)
+        self.size = sum(_turn_bytes(t) for t in self.turns)
+        self.last_key = last_key
+        self.epoch = epoch
+
+    def append(self, turn: ChatTurn, key: int) -> int:
+        """Agrega un turno y retorna la variación de tamaño."""
+        delta = _turn_bytes(turn)
+        if len(self.turns) == self.turns.maxlen:
+            delta -= _turn_bytes(self.turns[0])
+        self.turns.append(turn)
+        self.size += delta
+        self.last_key = key
+        return delta
+
+    def reset(self, key: int) -> int:
+        """Vacía la sesión (lápida) y retorna la variación de tamaño."""
+        delta = -self.size
+        self.turns.clear()
+        self.size = 0
+        self.last_key = key
+        return delta
+
+
+class _CacheShard:
+    """Franja de la caché: sus sesiones comparten un lock y un orden LRU propios."""
+
+    __slots__ = ("lock", "entries", "bytes", "hits", "misses", "evictions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
 
 class HistoryStore:
-    """Gestor de historial de chat persistente y en memoria (caché simple)."""
+    """Gestor de historial de chat persistente con caché LRU de turnos recientes."""
 
-    def __init__(self, history_file: Optional[str] = None):
+    def __init__(
+        self,
+        history_file: Optional[str] = None,
+        index_file: Optional[str] = None,
+        *,
+        segment_max_bytes: int = int(HISTORY_SEGMENT_MAX_MB * 1024 * 1024),
+        segment_max_age: float = HISTORY_SEGMENT_MAX_HOURS * 3600,
+        compact_interval: float = HISTORY_COMPACT_INTERVAL_SECONDS,
+        compress_cold: bool = HISTORY_COMPRESS_COLD,
+        compress_after: float = HISTORY_COMPRESS_AFTER_HOURS * 3600,
+        retention_days: float = HISTORY_RETENTION_DAYS,
+        cache_max_sessions: int = HISTORY_CACHE_MAX_SESSIONS,
+        cache_max_bytes: int = int(HISTORY_CACHE_MAX_MB * 1024 * 1024),
+        cache_turns: int = HISTORY_CACHE_TURNS,
+        lock_stripes: int = HISTORY_LOCK_STRIPES,
+        fsync: str = HISTORY_FSYNC,
+        fsync_interval: float = HISTORY_FSYNC_INTERVAL_SECONDS,
+    ):
         self.history_file = history_file or HISTORY_FILE
+        self.segment_dir = os.path.splitext(self.history_file)[0] + ".segments"
+        self.index_file = index_file or self.history_file + ".idx"
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.compact_interval = compact_interval
+        self.compress_cold = compress_cold and ZSTD_AVAILABLE
+        self.compress_after = compress_after
+        self.retention_days = retention_days
+        self.cache_max_sessions = max(1, cache_max_sessions)
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_turns = max(1, cache_turns)
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {fsync!r} (usa {', '.join(FSYNC_POLICIES)})")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        # Protege el índice de posiciones y el segmento activo; solo se retiene para
+        # operaciones en memoria y la escritura de cada lote, nunca para leer del disco
         self._lock = threading.Lock()
-        self._index: Dict[str, List[ChatTurn]] = {}
+        self._save_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        # Caché de turnos recientes repartida en franjas por sesión, cada una con su lock
+        self._shards = [_CacheShard() for _ in range(max(1, lock_stripes))]
+        # Se incrementa cuando el índice cambia por fuera de las escrituras de este proceso;
+        # las entradas de caché de una época anterior se consideran vencidas
+        self._cache_epoch = 0
+        self._writer = GroupCommit(self._commit_batch)
+        self._handle = None
+        self._last_fsync = time()
+        self._sync_timer: Optional[threading.Timer] = None
+        # session_id -> posiciones empaquetadas de sus líneas, en orden de escritura
+        self._offsets: Dict[str, array] = {}
+        # session_id -> posición de su última lápida aún presente en disco
+        self._tombstones: Dict[str, int] = {}
+        # Segmentos con líneas de sesiones borradas pendientes de compactar
+        self._dirty: Set[int] = set()
+        self._segments: Dict[int, str] = {}
+        self._active = 1
+        self._active_started = time()
+        # Posición del segmento activo hasta la que llega el índice
+        self._indexed_upto = 0
+        self._appends_since_save = 0
+        self._decompressed: Tuple[Any, bytes] = (None, b"")
+        self._wake = threading.Event()
+
         self._ensure_paths()
+        self._load_offsets()
+        atexit.register(self.close)
+        metrics.register_collector("history_store", self._metric_families)
+
+        self._compactor: Optional[threading.Thread] = None
+        if self.compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="history-compactor", daemon=True)
+            self._compactor.start()
         # Carga perezosa bajo demanda para sesiones; no precarga completa para no bloquear.
 
+    # ------------------------------------------------------------------
+    # Segmentos
+    # ------------------------------------------------------------------
+    def _segment_path(self, segment: int, compressed: bool = False) -> str:
+        suffix = _COMPRESSED_SUFFIX if compressed else _SEGMENT_SUFFIX
+        return os.path.join(self.segment_dir, f"{segment:06d}{suffix}")
+
+    def _list_segments(self) -> Dict[int, str]:
+        segments: Dict[int, str] = {}
+        for name in os.listdir(self.segment_dir):
+            stem, _, _ = name.partition(".")
+            if stem.isdigit() and (name.endswith(_SEGMENT_SUFFIX) or name.endswith(_COMPRESSED_SUFFIX)):
+                segments[int(stem)] = os.path.join(self.segment_dir, name)
+        return segments
+
     def _ensure_paths(self):
-        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-        # Crear archivo si no existe
-        if not os.path.exists(self.history_file):
-            with open(self.history_file, "w", encoding="utf-8") as f:
-                pass
+        os.makedirs(self.segment_dir, exist_ok=True)
+        segments = self._list_segments()
+        # Adoptar el archivo único de versiones anteriores como el segmento siguiente;
+        # uno vacío (p. ej. el que se versiona en el repositorio) se deja en su lugar
+        if os.path.exists(self.history_file) and os.path.getsize(self.history_file) > 0:
+            segment = max(segments, default=0) + 1
+            os.replace(self.history_file, self._segment_path(segment))
+            segments[segment] = self._segment_path(segment)
+            log.info("📦 Historial anterior adoptado como segmento", segment=segment)
+        if not segments:
+            open(self._segment_path(1), "ab").close()
+            segments[1] = self._segment_path(1)
+        self._segments = segments
+        self._active = max(segments)
+        if self._segments[self._active].endswith(_COMPRESSED_SUFFIX):
+            # El último segmento está comprimido: abrir uno nuevo para escribir
+            self._active += 1
+            open(self._segment_path(self._active), "ab").close()
+            self._segments[self._active] = self._segment_path(self._active)
+        self._active_started = self._first_timestamp(self._segments[self._active])
 
+    def _first_timestamp(self, path: str) -> float:
+        try:
+            with open(path, "rb") as f:
+                return float(json.loads(f.readline()).get("timestamp", time()))
+        except Exception:
+            return time()
+
+    def _segment_data(self, segment: int, path: Optional[str] = None) -> bytes:
+        """Contenido sin comprimir de un segmento completo."""
+        path = path or self._segments[segment]
+        with open(path, "rb") as f:
+            data = f.read()
+        if path.endswith(_COMPRESSED_SUFFIX):
+            if zstandard is None:
+                raise RuntimeError(f"Se requiere 'zstandard' para leer {path}")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+    def _rotate_if_needed_locked(self) -> None:
+        now = time()
+        size = self._indexed_upto
+        if size <= 0 or (size < self.segment_max_bytes and now - self._active_started < self.segment_max_age):
+            return
+        self._close_handle_locked()
+        self._active += 1
+        path = self._segment_path(self._active)
+        open(path, "ab").close()
+        self._segments[self._active] = path
+        self._active_started = now
+        self._indexed_upto = 0
+        self._wake.set()
+
+    def _close_handle_locked(self) -> None:
+        if self._handle is None:
+            return
+        if self.fsync != "never":
+            os.fsync(self._handle.fileno())
+        self._handle.close()
+        self._handle = None
+
+    def _sync_pending(self) -> None:
+        self._sync_timer = None
+        with self._lock:
+            handle = self._handle
+        if handle is None:
+            return
+        try:
+            os.fsync(handle.fileno())
+        except (OSError, ValueError):
+            return  # el segmento se rotó y ya se sincronizó al cerrarlo
+        self._last_fsync = time()
+        _fsyncs.inc()
+
+    def _commit_batch(self, items: List[Tuple[str, bytes, Optional[ChatTurn]]]) -> List[int]:
+        """Escribe un lote de líneas con una sola llamada, actualiza el índice y la caché.
+
+        Cada elemento es (session_id, línea, turno) y `turno` es None para una lápida.
+        Retorna por elemento la posición empaquetada (turnos) o los turnos borrados (lápidas).
+        """
+        data = b"".join(line for _, line, _ in items)
+        with self._lock:
+            self._rotate_if_needed_locked()
+            if self._handle is None:
+                # Sin búfer: cada write llega al kernel y sobrevive a una caída del proceso
+                self._handle = open(self._segments[self._active], "ab", buffering=0)
+            handle = self._handle
+            view = memoryview(data)
+            while view:
+                view = view[handle.write(view):]
+            # En modo anexado la posición final es la del fin de esta escritura
+            end = handle.tell()
+            position = end - len(data)
+            if position != self._indexed_upto:
+                # Líneas que no pasaron por este índice (p. ej. escritura interrumpida)
+                self._scan_segment_locked(self._active, self._indexed_upto, position)
+            self._indexed_upto = end
+            self._appends_since_save += len(items)
+            results: List[int] = []
+            keys: List[int] = []
+            for session_id, line, turn in items:
+                key = _pack(self._active, position)
+                position += len(line)
+                keys.append(key)
+                if turn is None:
+                    results.append(self._apply_clear_locked(session_id, key))
+                else:
+                    self._offsets.setdefault(session_id, array("q")).append(key)
+                    results.append(key)
+            epoch = self._cache_epoch
+
+        now = time()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(handle.fileno())
+            self._last_fsync = now
+            _fsyncs.inc()
+        elif self.fsync == "interval" and self._sync_timer is None:
+            # Si no llegan más lotes, sincronizar igual al cumplirse el intervalo
+            self._sync_timer = threading.Timer(self.fsync_interval, self._sync_pending)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+        _commit_batch.observe(len(items))
+
+        # Solo se actualizan las sesiones ya cacheadas; el resto carga su cola al leerla
+        for (session_id, _, turn), key in zip(items, keys):
+            shard = self._shard(session_id)
+            with shard.lock:
+                cached = shard.entries.get(session_id)
+                if cached is None or cached.epoch != epoch or key <= cached.last_key:
+                    continue
+                shard.bytes += cached.reset(key) if turn is None else cached.append(turn, key)
+                shard.entries.move_to_end(session_id)
+                self._evict_shard_locked(shard)
+        return results
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    @traced("history.append")
     def append(self, session_id: str, role: str, content: str, timestamp: Optional[float] = None) -> None:
         if not session_id or not role or content is None:
             return
         ts = float(timestamp if timestamp is not None else time())
         turn = {"session_id": session_id, "role": role, "content": content, "timestamp": ts}
-        line = json.dumps(turn, ensure_ascii=False)
-        with self._lock:
-            with open(self.history_file, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
-            # cache en memoria
-            lst = self._index.setdefault(session_id, [])
-            lst.append(ChatTurn(role=role, content=content, timestamp=ts))
-
-    def _load_session_from_disk(self, session_id: str) -> List[ChatTurn]:
-        turns: List[ChatTurn] = []
-        try:
-            with open(self.history_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    if not line.strip():
-                        continue
-                    try:
-                        rec = json.loads(line)
-                        if rec.get("session_id") == session_id:
-                            turns.append(ChatTurn(
-                                role=rec.get("role", "user"),
-                                content=rec.get("content", ""),
-                                timestamp=float(rec.get("timestamp", time()))
-                            ))
-                    except Exception:
-                        continue
-        except FileNotFoundError:
-            pass
-        return turns
+        data = (json.dumps(turn, ensure_ascii=False) + "\n").encode("utf-8")
+        self._writer.submit((session_id, data, ChatTurn(role=role, content=content, timestamp=ts)))
+        _appends.inc()
+        if self._appends_since_save >= HISTORY_INDEX_SAVE_EVERY:
+            threading.Thread(target=self.save_index, name="history-index-save", daemon=True).start()
 
+    @traced("history.get_recent")
     def get_recent(self, session_id: Optional[str], limit: int = 8) -> List[ChatTurn]:
+        """Últimos `limit` turnos de la sesión (todos si `limit` <= 0).
+
+        Hasta HISTORY_CACHE_TURNS turnos se sirven desde la caché; más allá se leen del disco.
+        """
         if not session_id:
             return []
-        with self._lock:
-            if session_id not in self._index:
-                self._index[session_id] = self._load_session_from_disk(session_id)
-            turns = self._index.get(session_id, [])
-            return turns[-limit:] if limit and limit > 0 else list(turns)
+        if not limit or limit <= 0 or limit > self.cache_turns:
+            _cache_lookups.inc(result="disk")
+            return self._load_session_from_disk(session_id)[0]
 
+        shard = self._shard(session_id)
+        with shard.lock:
+            cached = shard.entries.get(session_id)
+            if cached is not None and cached.epoch == self._cache_epoch:
+                shard.hits += 1
+                shard.entries.move_to_end(session_id)
+                _cache_lookups.inc(result="hit")
+                return list(cached.turns)[-limit:]
+            shard.misses += 1
+        _cache_lookups.inc(result="miss")
+
+        # La lectura del disco ocurre sin locks; solo se cachea si ninguna escritura de la
+        # sesión se confirmó mientras tanto (si no, se repite con el índice actualizado)
+        for _ in range(3):
+            turns, last_key, epoch = self._load_session_from_disk(session_id, self.cache_turns)
+            with shard.lock:
+                with self._lock:
+                    fresh = epoch == self._cache_epoch and last_key == self._last_key_locked(session_id)
+                if fresh:
+                    previous = shard.entries.pop(session_id, None)
+                    if previous is not None:
+                        shard.bytes -= previous.size
+                    cached = _CachedSession(turns, self.cache_turns, last_key, epoch)
+                    shard.entries[session_id] = cached
+                    shard.bytes += cached.size
+                    self._evict_shard_locked(shard, keep=session_id)
+                    break
+        return turns[-limit:]
+
+    @traced("history.clear")
     def clear(self, session_id: Optional[str]) -> int:
-        """Borra historial de una sesión (en memoria y reescribiendo archivo sin esa sesión).
+        """Borra el historial de una sesión anexando una lápida; el compactador
+        elimina sus líneas de los segmentos en segundo plano.
         Retorna número de turnos eliminados.
         """
         if not session_id:
             return 0
+        tombstone = {"session_id": session_id, "op": "clear", "timestamp": time()}
+        data = (json.dumps(tombstone, ensure_ascii=False) + "\n").encode("utf-8")
+        removed = self._writer.submit((session_id, data, None))
+        self._wake.set()
+        return removed
+
+    def sessions(self) -> List[str]:
+        """Sesiones con turnos en disco (en orden de primera aparición en el índice)."""
+        with self._lock:
+            return [sid for sid, keys in self._offsets.items() if keys]
+
+    def close(self) -> None:
+        """Sincroniza y cierra el segmento activo y guarda el índice."""
+        try:
+            with self._lock:
+                self._close_handle_locked()
+        except Exception as e:
+            log.warning("⚠️ No se pudo cerrar el segmento de historial", error=str(e))
+        self.save_index()
+
+    # ------------------------------------------------------------------
+    # Caché de turnos recientes
+    # ------------------------------------------------------------------
+    def _shard(self, session_id: str) -> _CacheShard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def _evict_shard_locked(self, shard: _CacheShard, keep: Optional[str] = None) -> None:
+        """Expulsa las sesiones menos usadas de la franja hasta respetar su parte de los límites."""
+        max_sessions = max(1, -(-self.cache_max_sessions // len(self._shards)))
+        max_bytes = self.cache_max_bytes / len(self._shards)
+        while shard.entries and (len(shard.entries) > max_sessions or shard.bytes > max_bytes):
+            session_id = next(iter(shard.entries))
+            if session_id == keep:
+                break  # la sesión recién cargada se conserva aunque exceda el límite de bytes
+            shard.bytes -= shard.entries.pop(session_id).size
+            shard.evictions += 1
+            _cache_evictions.inc()
+
+    def _last_key_locked(self, session_id: str) -> int:
+        """Última posición escrita para la sesión (turno o lápida), 0 si no hay ninguna."""
+        keys = self._offsets.get(session_id)
+        return max(keys[-1] if keys else 0, self._tombstones.get(session_id, 0))
+
+    def compact(self) -> Dict[str, int]:
+        """Ejecuta una pasada del compactador (también la ejecuta el hilo de fondo)."""
+        with self._compact_lock:
+            summary = {"rewritten": 0, "compressed": 0, "expired": 0}
+            summary["expired"] = self._expire_segments()
+            summary["rewritten"] = self._rewrite_dirty_segments()
+            summary["compressed"] = self._compress_cold_segments()
+            if any(summary.values()):
+                self.save_index()
+                log.info("🧹 Segmentos de historial compactados", **summary)
+            return summary
+
+    # ------------------------------------------------------------------
+    # Índice de posiciones
+    # ------------------------------------------------------------------
+    def _apply_clear_locked(self, session_id: str, key: int) -> int:
+        offsets = self._offsets.pop(session_id, None)
+        if offsets:
+            self._dirty.update(_segment_of(k) for k in offsets)
+        self._tombstones[session_id] = key
+        self._dirty.add(_segment_of(key))
+        return len(offsets or ())
+
+    def _index_line(self, segment: int, position: int, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            rec = json.loads(line)
+        except Exception:
+            return
+        session_id = rec.get("session_id")
+        if not session_id:
+            return
+        key = _pack(segment, position)
+        if rec.get("op") == "clear":
+            self._apply_clear_locked(session_id, key)
+        else:
+            self._offsets.setdefault(session_id, array("q")).append(key)
+
+    def _scan_segment_locked(self, segment: int, start: int = 0, end: Optional[int] = None) -> int:
+        """Indexa las líneas completas de [start, end) de un segmento y retorna la posición alcanzada."""
+        position = start
+        path = self._segments[segment]
+        if path.endswith(_COMPRESSED_SUFFIX):
+            lines = self._segment_data(segment)[start:end].splitlines(keepends=True)
+        else:
+            f = open(path, "rb")
+            f.seek(start)
+            lines = f
+        try:
+            for line in lines:
+                if (end is not None and position >= end) or not line.endswith(b"\n"):
+                    # Fin del tramo o línea a medio escribir (se indexará en la próxima lectura)
+                    break
+                self._index_line(segment, position, line)
+                position += len(line)
+        finally:
+            if not isinstance(lines, list):
+                lines.close()
+        if position > start:
+            # Líneas que no escribió este proceso: la caché puede haber quedado desactualizada
+            self._cache_epoch += 1
+        return position
+
+    def _rebuild_locked(self, reason: str) -> None:
+        _index_rebuilds.inc(reason=reason)
+        self._offsets, self._tombstones, self._dirty = {}, {}, set()
+        for segment in sorted(self._segments):
+            position = self._scan_segment_locked(segment)
+        self._indexed_upto = position
+        log.info("🗂️ Índice de historial reconstruido", reason=reason, sessions=len(self._offsets),
+                 segments=len(self._segments))
+
+    def _head_digest(self, length: int) -> str:
+        try:
+            with open(self._segments[self._active], "rb") as f:
+                return hashlib.md5(f.read(length)).hexdigest()
+        except FileNotFoundError:
+            return ""
+
+    def _closed_segment_sizes(self) -> Dict[str, int]:
+        return {
+            os.path.basename(path): os.path.getsize(path)
+            for segment, path in self._segments.items() if segment != self._active
+        }
+
+    def _load_offsets(self) -> None:
+        """Carga el índice guardado e indexa solo lo escrito después; si no sirve, lo reconstruye."""
         with self._lock:
-            removed = len(self._index.get(session_id, []))
-            self._index.pop(session_id, None)
-            # Reescribir archivo filtrando sesión
             try:
-                tmp_path = self.history_file + ".tmp"
-                with open(self.history_file, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
-                    for line in src:
-                        if not line.strip():
-                            continue
-                        try:
-                            rec = json.loads(line)
-                            if rec.get("session_id") != session_id:
-                                dst.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                        except Exception:
-                            # Conservar líneas corruptas por seguridad
-                            dst.write(line)
-                os.replace(tmp_path, self.history_file)
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
             except FileNotFoundError:
+                self._rebuild_locked("missing")
+                return
+            except Exception:
+                self._rebuild_locked("corrupt")
+                return
+
+            upto = int(saved.get("indexed_upto", 0))
+            head_len = int(saved.get("head_len", 0))
+            try:
+                size = os.path.getsize(self._segments[self._active])
+            except OSError:
+                size = 0
+            if (
+                saved.get("version") != INDEX_VERSION
+                or saved.get("active") != self._active
+                or saved.get("segments") != self._closed_segment_sizes()
+                or size < upto
+                or self._head_digest(head_len) != saved.get("head_md5")
+            ):
+                self._rebuild_locked("stale")
+                return
+            self._offsets = {sid: array("q", keys) for sid, keys in (saved.get("sessions") or {}).items()}
+            self._tombstones = dict(saved.get("tombstones") or {})
+            self._dirty = set(saved.get("dirty") or [])
+            self._indexed_upto = self._scan_segment_locked(self._active, upto)
+
+    def save_index(self) -> None:
+        """Guarda el índice de posiciones de forma atómica."""
+        if not self._save_lock.acquire(blocking=False):
+            return  # ya hay un guardado en curso
+        try:
+            with self._lock:
+                payload = {
+                    "version": INDEX_VERSION,
+                    "active": self._active,
+                    "indexed_upto": self._indexed_upto,
+                    "head_len": min(self._indexed_upto, _HEAD_BYTES),
+                    "head_md5": self._head_digest(min(self._indexed_upto, _HEAD_BYTES)),
+                    "segments": self._closed_segment_sizes(),
+                    "sessions": {sid: keys.tolist() for sid, keys in self._offsets.items()},
+                    "tombstones": dict(self._tombstones),
+                    "dirty": sorted(self._dirty),
+                }
+                self._appends_since_save = 0
+            tmp_path = f"{self.index_file}.{os.getpid()}.{id(self)}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_file)
+        except Exception as e:
+            log.warning("⚠️ No se pudo guardar el índice de historial", error=str(e))
+        finally:
+            self._save_lock.release()
+
+    def _load_session_from_disk(self, session_id: str, tail: int = 0) -> Tuple[List[ChatTurn], int, int]:
+        """Lee solo las líneas de la sesión (las últimas `tail` si es > 0) usando el índice.
+
+        Retorna los turnos junto con la última posición de la sesión y la época de caché
+        con las que se leyeron.
+        """
+        for _ in range(2):
+            with self._lock:
+                # Incorporar líneas del segmento activo que aún no estén indexadas
+                self._indexed_upto = self._scan_segment_locked(self._active, self._indexed_upto)
+                keys = self._session_keys_locked(session_id, tail)
+                segments = {s: self._segments.get(s) for s in {_segment_of(k) for k in keys}}
+                version = (self._last_key_locked(session_id), self._cache_epoch)
+            turns = self._read_offsets(session_id, keys, segments)
+            if turns is not None:
+                return (turns, *version)
+            # Posiblemente el compactador reescribió un segmento durante la lectura
+        with self._lock:
+            turns = self._read_offsets(session_id, self._session_keys_locked(session_id, tail), self._segments)
+            if turns is None:
+                # El índice no corresponde a los segmentos: reconstruir y reintentar una vez
+                self._rebuild_locked("mismatch")
+                turns = self._read_offsets(session_id, self._session_keys_locked(session_id, tail), self._segments) or []
+            return turns, self._last_key_locked(session_id), self._cache_epoch
+
+    def _session_keys_locked(self, session_id: str, tail: int = 0) -> array:
+        keys = self._offsets.get(session_id)
+        if not keys:
+            return array("q")
+        return keys[-tail:] if tail > 0 else array("q", keys)
+
+    def _read_offsets(self, session_id: str, keys: array, segments: Dict[int, Optional[str]]) -> Optional[List[ChatTurn]]:
+        """Lee las líneas indicadas; retorna None si no corresponden a la sesión."""
+        if not keys:
+            return []
+        turns: List[ChatTurn] = []
+        try:
+            for segment, group in itertools.groupby(keys, key=_segment_of):
+                path = segments.get(segment)
+                if path is None:
+                    return None
+                if path.endswith(_COMPRESSED_SUFFIX):
+                    # Un segmento reescrito conserva ruta y fecha pero no el inodo
+                    ident = (path, os.stat(path).st_ino)
+                    cached_ident, data = self._decompressed
+                    if cached_ident != ident:
+                        data = self._segment_data(segment, path)
+                        self._decompressed = (ident, data)
+                    lines = [data[k & _OFFSET_MASK:data.index(b"\n", k & _OFFSET_MASK) + 1] for k in group]
+                else:
+                    with open(path, "rb") as f:
+                        lines = []
+                        for k in group:
+                            f.seek(k & _OFFSET_MASK)
+                            lines.append(f.readline())
+                for line in lines:
+                    rec = json.loads(line)
+                    if rec.get("session_id") != session_id or rec.get("op") == "clear":
+                        return None
+                    turns.append(_turn_from_record(rec))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return None
+        return turns
+
+    # ------------------------------------------------------------------
+    # Compactación
+    # ------------------------------------------------------------------
+    def _compact_loop(self) -> None:
+        while True:
+            self._wake.wait(self.compact_interval)
+            self._wake.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                log.error("❌ Error compactando historial", error=str(e))
+
+    def _rewrite_dirty_segments(self) -> int:
+        """Reescribe en orden los segmentos cerrados con líneas de sesiones borradas."""
+        rewritten = 0
+        with self._lock:
+            dirty = sorted(s for s in self._dirty if s != self._active and s in self._segments)
+        for segment in dirty:
+            with self._lock:
+                tombstones = dict(self._tombstones)
+            data = self._segment_data(segment)
+            out = bytearray()
+            new_keys: Dict[str, List[int]] = {}
+            seen: Set[str] = set()
+            position = 0
+            for line in data.splitlines(keepends=True):
+                key = _pack(segment, position)
+                position += len(line)
+                if not line.strip() or not line.endswith(b"\n"):
+                    continue
+                try:
+                    rec = json.loads(line)
+                    session_id = rec.get("session_id")
+                except Exception:
+                    out += line  # Conservar líneas corruptas por seguridad
+                    continue
+                seen.add(session_id)
+                tombstone = tombstones.get(session_id)
+                # Los segmentos anteriores ya se compactaron: se descartan las líneas
+                # previas a la última lápida y la propia lápida
+                if tombstone is not None and key <= tombstone:
+                    continue
+                if rec.get("op") == "clear":
+                    out += line
+                    continue
+                new_keys.setdefault(session_id, []).append(_pack(segment, len(out)))
+                out += line
+
+            path = self._segments[segment]
+            compressed = path.endswith(_COMPRESSED_SUFFIX)
+            tmp_path = path + ".tmp"
+            if out:
+                payload = zstandard.ZstdCompressor().compress(bytes(out)) if compressed else bytes(out)
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                # La retención se cuenta desde la última escritura original del segmento
+                mtime = os.path.getmtime(path)
+                os.utime(tmp_path, (mtime, mtime))
+            with self._lock:
+                if out:
+                    os.replace(tmp_path, path)
+                else:
+                    os.remove(self._segments[segment])
+                    del self._segments[segment]
+                changed = False
+                for session_id in seen:
+                    if self._tombstones.get(session_id) != tombstones.get(session_id):
+                        changed = True  # borrada de nuevo durante la reescritura
+                    keys = self._offsets.get(session_id)
+                    if not keys or not any(_segment_of(k) == segment for k in keys):
+                        continue
+                    merged = [k for k in keys if _segment_of(k) != segment] + new_keys.get(session_id, [])
+                    self._offsets[session_id] = array("q", sorted(merged))
+                for session_id, tombstone in tombstones.items():
+                    if _segment_of(tombstone) == segment and self._tombstones.get(session_id) == tombstone:
+                        del self._tombstones[session_id]
+                if not changed:
+                    self._dirty.discard(segment)
+                if self._decompressed[0] and self._decompressed[0][0] == path:
+                    self._decompressed = (None, b"")
+            rewritten += 1
+            _compactions.inc(action="rewrite")
+        return rewritten
+
+    def _compress_cold_segments(self) -> int:
+        if not self.compress_cold:
+            return 0
+        compressed = 0
+        cutoff = time() - self.compress_after
+        with self._lock:
+            candidates = [
+                s for s, path in self._segments.items()
+                if s != self._active and s not in self._dirty
+                and not path.endswith(_COMPRESSED_SUFFIX) and os.path.getmtime(path) < cutoff
+            ]
+        for segment in sorted(candidates):
+            plain_path = self._segment_path(segment)
+            target = self._segment_path(segment, compressed=True)
+            with open(plain_path, "rb") as f:
+                payload = zstandard.ZstdCompressor().compress(f.read())
+            with open(target + ".tmp", "wb") as f:
+                f.write(payload)
+            mtime = os.path.getmtime(plain_path)
+            os.utime(target + ".tmp", (mtime, mtime))
+            with self._lock:
+                os.replace(target + ".tmp", target)
+                os.remove(plain_path)
+                self._segments[segment] = target
+            compressed += 1
+            _compactions.inc(action="compress")
+        return compressed
+
+    def _expire_segments(self) -> int:
+        """Elimina, del más antiguo en adelante, los segmentos cerrados fuera de la retención."""
+        if self.retention_days <= 0:
+            return 0
+        expired = 0
+        cutoff = time() - self.retention_days * 86400
+        while True:
+            with self._lock:
+                closed = sorted(s for s in self._segments if s != self._active)
+                if not closed or os.path.getmtime(self._segments[closed[0]]) >= cutoff:
+                    return expired
+                segment = closed[0]
+                os.remove(self._segments.pop(segment))
+                for session_id in [sid for sid, keys in self._offsets.items() if keys and _segment_of(keys[0]) == segment]:
+                    remaining = array("q", (k for k in self._offsets[session_id] if _segment_of(k) != segment))
+                    if remaining:
+                        self._offsets[session_id] = remaining
+                    else:
+                        del self._offsets[session_id]
+                self._tombstones = {sid: k for sid, k in self._tombstones.items() if _segment_of(k) != segment}
+                self._dirty.discard(segment)
+                self._cache_epoch += 1
+            expired += 1
+            _compactions.inc(action="expire")
+
+    # ------------------------------------------------------------------
+    # Estadísticas
+    # ------------------------------------------------------------------
+    def _disk_bytes(self) -> int:
+        total = 0
+        for path in list(self._segments.values()):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
                 pass
-            return removed
+        return total
+
+    def _metric_families(self) -> List[Dict[str, Any]]:
+        stats = self.stats()
+        return [
+            metrics.gauge_family("aluna_history_sessions_cached", "Sesiones con historial en caché", {(): stats["sessions_cached"]}),
+            metrics.gauge_family("aluna_history_cache_bytes", "Bytes aproximados de la caché de historial", {(): stats["cache_bytes"]}),
+            metrics.gauge_family("aluna_history_file_bytes", "Bytes en disco de los segmentos de historial", {(): stats["size_bytes"]}, mode="max"),
+            metrics.gauge_family("aluna_history_segments", "Segmentos de historial en disco", {(): stats["segments"]}, mode="max"),
+        ]
 
     def stats(self) -> Dict[str, Any]:
-        try:
-            size = os.path.getsize(self.history_file)
-        except Exception:
-            size = 0
-        return {"sessions_cached": len(self._index), "file": self.history_file, "size_bytes": size}
+        hits = sum(shard.hits for shard in self._shards)
+        misses = sum(shard.misses for shard in self._shards)
+        return {
+            "sessions_cached": sum(len(shard.entries) for shard in self._shards),
+            "cache_bytes": sum(shard.bytes for shard in self._shards),
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "cache_evictions": sum(shard.evictions for shard in self._shards),
+            "cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "lock_stripes": len(self._shards),
+            "fsync": self.fsync,
+            "sessions_indexed": len(self._offsets),
+            "file": self.segment_dir,
+            "segments": len(self._segments),
+            "active_segment": self._active,
+            "dirty_segments": len(self._dirty),
+            "tombstones": len(self._tombstones),
+            "size_bytes": self._disk_bytes(),
+        }
@@ -0,0 +1,283 @@
+"""
+Motor compartido de coincidencia de palabras clave (Aho-Corasick).
+
+- Cada componente registra sus conjuntos de reglas (palabras clave con una carga
+  opcional, p. ej. la categoría o la dependencia) y el motor compila todas las
+  reglas en un solo autómata sobre texto normalizado (por defecto minúsculas y sin
+  tildes; cada motor puede usar su propia normalización).
+- `scan(texto)` recorre el texto una sola vez y devuelve las coincidencias de todos
+  los conjuntos; el resultado se memoriza por texto, de modo que los clasificadores
+  que consultan la misma pregunta comparten la misma pasada.
+- Las reglas pueden exigir palabra completa (límites no alfanuméricos) o aceptar
+  cualquier subcadena, equivalente al `keyword in texto` que reemplazan.
+- Para textos largos en los que solo importa si aparece alguna regla de un conjunto
+  (p. ej. las marcas de respuesta negativa) `search(conjunto, texto)` usa una
+  única expresión regular combinada de ese conjunto. Los conjuntos cortos de
+  subcadenas se comprueban con un `in` por regla sobre el texto en minúsculas (con
+  y sin tildes), sin normalizar el texto completo, que es lo que más cuesta.
+"""
+from __future__ import annotations
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from services.text_normalization import fold_text
+
+# Preguntas distintas cuyo resultado se conserva en memoria
+_SCAN_CACHE_SIZE = 1024
+# Conjuntos de subcadenas hasta este tamaño se buscan con `in` en lugar de la expresión combinada
+_PLAIN_SEARCH_MAX_RULES = 16
+
+
+class KeywordHit(NamedTuple):
+    """Coincidencia de una regla dentro del texto normalizado."""
+    rule_set: str
+    # Palabra clave tal como se declaró (las posiciones son del texto normalizado)
+    keyword: str
+    payload: Any
+    start: int
+    end: int
+    # Posición de la regla dentro de su conjunto (orden de declaración)
+    order: int
+
+
+class _Rule(NamedTuple):
+    rule_set: str
+    keyword: str
+    # Forma normalizada que recorre el autómata
+    folded: str
+    payload: Any
+    whole_word: bool
+    order: int
+
+
+class KeywordMatches:
+    """Coincidencias de un texto agrupadas por conjunto de reglas."""
+
+    __slots__ = ("text", "_by_set")
+
+    def __init__(self, text: str, hits: List[KeywordHit]):
+        self.text = text
+        by_set: Dict[str, List[KeywordHit]] = {}
+        for hit in hits:
+            by_set.setdefault(hit.rule_set, []).append(hit)
+        self._by_set = {name: tuple(items) for name, items in by_set.items()}
+
+    def has(self, rule_set: str) -> bool:
+        return rule_set in self._by_set
+
+    def get(self, rule_set: str) -> Tuple[KeywordHit, ...]:
+        """Coincidencias del conjunto en orden de aparición en el texto."""
+        return self._by_set.get(rule_set, ())
+
+    def first(self, rule_set: str) -> Optional[KeywordHit]:
+        """Coincidencia de la regla declarada primero (no la primera en el texto)."""
+        hits = self._by_set.get(rule_set)
+        return min(hits, key=lambda hit: hit.order) if hits else None
+
+    def by_payload(self, rule_set: str) -> Dict[Any, List[str]]:
+        """Palabras clave distintas encontradas agrupadas por carga, en orden de declaración."""
+        grouped: Dict[Any, List[str]] = {}
+        for hit in sorted(self._by_set.get(rule_set, ()), key=lambda hit: hit.order):
+            keywords = grouped.setdefault(hit.payload, [])
+            if hit.keyword not in keywords:
+                keywords.append(hit.keyword)
+        return grouped
+
+    def keywords(self, rule_set: str) -> List[str]:
+        """Palabras clave distintas encontradas, en orden de declaración."""
+        seen: Dict[str, int] = {}
+        for hit in self._by_set.get(rule_set, ()):
+            seen.setdefault(hit.keyword, hit.order)
+        return sorted(seen, key=seen.get)
+
+
+class _Automaton:
+    """Autómata Aho-Corasick con la función de transición completa precalculada."""
+
+    def __init__(self, rules: List[_Rule]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for index, rule in enumerate(rules):
+            state = 0
+            for ch in rule.folded:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(index)
+
+        # Enlaces de fallo en orden BFS y transiciones completas: un estado hereda
+        # las transiciones de su estado de fallo, por lo que el recorrido no retrocede.
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            if state:
+                delta[state] = {**delta[fail[state]], **goto[state]}
+                outputs[state] = outputs[state] + outputs[fail[state]]
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(child)
+
+        self.rules = rules
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+
+    def scan(self, text: str) -> List[KeywordHit]:
+        delta, outputs, rules = self._delta, self._outputs, self.rules
+        hits: List[KeywordHit] = []
+        state = 0
+        for position, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                end = position + 1
+                for index in outputs[state]:
+                    rule = rules[index]
+                    start = end - len(rule.folded)
+                    if rule.whole_word and (
+                        (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())
+                    ):
+                        continue
+                    hits.append(KeywordHit(rule.rule_set, rule.keyword, rule.payload, start, end, rule.order))
+        return hits
+
+
+class KeywordMatcher:
+    """Conjuntos de reglas compilados en un único autómata."""
+
+    def __init__(self, cache_size: int = _SCAN_CACHE_SIZE, normalize: Callable[[str], str] = fold_text):
+        # `normalize` se aplica por igual a las palabras clave y a los textos recorridos
+        self._normalize = normalize
+        self._rule_sets: Dict[str, List[Tuple[str, Any, bool]]] = {}
+        self._lock = threading.Lock()
+        self._cache_size = cache_size
+        self._scan = None
+        self._combined: Dict[str, re.Pattern] = {}
+        self._plain: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+
+    def register(
+        self,
+        rule_set: str,
+        keywords: Union[Iterable[str], Mapping[str, Any]],
+        *,
+        whole_word: bool = False,
+    ) -> None:
+        """Registra (o reemplaza) un conjunto de reglas.
+
+        `keywords` puede ser una secuencia de palabras clave o un mapeo
+        palabra clave -> carga; el orden de declaración se conserva.
+        """
+        items = keywords.items() if isinstance(keywords, Mapping) else ((kw, None) for kw in keywords)
+        rules = [(keyword, payload, whole_word) for keyword, payload in items]
+        with self._lock:
+            self._rule_sets[rule_set] = rules
+            self._scan = None
+
+    def unregister(self, rule_set: str) -> None:
+        with self._lock:
+            if self._rule_sets.pop(rule_set, None) is not None:
+                self._scan = None
+
+    def _build(self):
+        with self._lock:
+            if self._scan is not None:
+                return self._scan
+            rules: List[_Rule] = []
+            for rule_set, entries in self._rule_sets.items():
+                seen = set()
+                for order, (keyword, payload, whole_word) in enumerate(entries):
+                    folded = self._normalize(keyword)
+                    if not folded or folded in seen:
+                        # Variantes con y sin tilde colapsan en la misma regla
+                        continue
+                    seen.add(folded)
+                    rules.append(_Rule(rule_set, keyword, folded, payload, whole_word, order))
+            automaton = _Automaton(rules)
+            combined: Dict[str, List[str]] = {}
+            for rule in sorted(rules, key=lambda rule: -len(rule.folded)):
+                pattern = re.escape(rule.folded)
+                if rule.whole_word:
+                    pattern = rf"(?<!\w){pattern}(?!\w)"
+                combined.setdefault(rule.rule_set, []).append(pattern)
+            self._combined = {name: re.compile("|".join(parts)) for name, parts in combined.items()}
+            self._plain = self._plain_rule_sets()
+
+            normalize = self._normalize
+
+            @lru_cache(maxsize=self._cache_size)
+            def scan(text: str) -> KeywordMatches:
+                folded = normalize(text)
+                return KeywordMatches(folded, automaton.scan(folded))
+
+            self._scan = scan
+            return scan
+
+    def scan(self, text: str) -> KeywordMatches:
+        """Todas las coincidencias de todos los conjuntos en una pasada."""
+        scan = self._scan or self._build()
+        return scan(text or "")
+
+    def _plain_rule_sets(self) -> Dict[str, Tuple[Tuple[str, str], ...]]:
+        """Variantes (en minúsculas y sin tildes) de los conjuntos cortos de subcadenas.
+
+        Solo con la normalización por defecto: una normalización propia define
+        coincidencias que un `in` sobre el texto en minúsculas no reproduce.
+        """
+        if self._normalize is not fold_text:
+            return {}
+        plain = {}
+        for rule_set, entries in self._rule_sets.items():
+            if len(entries) > _PLAIN_SEARCH_MAX_RULES or any(whole_word for _, _, whole_word in entries):
+                continue
+            variants: Dict[str, str] = {}
+            for keyword, _, _ in entries:
+                folded = fold_text(keyword)
+                if folded:
+                    variants.setdefault(keyword.casefold(), folded)
+                    variants.setdefault(folded, folded)
+            plain[rule_set] = tuple(variants.items())
+        return plain
+
+    def search(self, rule_set: str, text: str) -> Optional[str]:
+        """Fragmento normalizado de la primera regla del conjunto en el texto (sin caché).
+
+        En los conjuntos cortos de subcadenas la regla debe aparecer con o sin todas
+        sus tildes y con los espacios tal como se declaró.
+        """
+        if self._scan is None:
+            self._build()
+        plain = self._plain.get(rule_set)
+        if plain is not None:
+            if not text:
+                return None
+            lowered = text.casefold()
+            return next((folded for variant, folded in plain if variant in lowered), None)
+        pattern = self._combined.get(rule_set)
+        if pattern is None or not text:
+            return None
+        match = pattern.search(self._normalize(text))
+        return match.group(0) if match else None
+
+    def stats(self) -> Dict[str, Any]:
+        scan = self._scan
+        info = scan.cache_info() if scan is not None else None
+        return {
+            "rule_sets": {name: len(rules) for name, rules in self._rule_sets.items()},
+            "cache_hits": info.hits if info else 0,
+            "cache_misses": info.misses if info else 0,
+        }
+
+
+_shared = KeywordMatcher()
+
+
+def shared_matcher() -> KeywordMatcher:
+    """Motor compartido por los clasificadores de la aplicación."""
+    return _shared
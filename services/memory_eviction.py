@@ -0,0 +1,102 @@
+"""
+Políticas de desalojo para la memoria semántica.
+
+Cada política trabaja de forma vectorizada sobre las columnas de metadatos que
+mantiene SemanticMemory (created_at, last_used_at, usage_count, cost) y asigna a
+cada entrada una prioridad: la entrada con menor prioridad es la primera en salir.
+"""
+from __future__ import annotations
+from typing import Dict, Type
+
+import numpy as np
+
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.memory.eviction")
+
+
+class EvictionPolicy:
+    """Política base: define prioridad de conservación y expiración por edad."""
+
+    name = "base"
+
+    def __init__(self, ttl_seconds: float = 0.0):
+        # ttl_seconds <= 0 desactiva la expiración por edad
+        self.ttl_seconds = float(ttl_seconds or 0.0)
+
+    def priorities(self, columns: Dict[str, np.ndarray], now: float) -> np.ndarray:
+        """Prioridad de conservación por entrada (menor = se desaloja antes)."""
+        raise NotImplementedError
+
+    def expired(self, columns: Dict[str, np.ndarray], now: float) -> np.ndarray:
+        """Máscara booleana de entradas vencidas por TTL sobre `created_at`."""
+        created = columns["created_at"]
+        if self.ttl_seconds <= 0:
+            return np.zeros(created.shape[0], dtype=bool)
+        return (now - created) > self.ttl_seconds
+
+
+class LRUPolicy(EvictionPolicy):
+    """Desaloja la entrada usada hace más tiempo."""
+
+    name = "lru"
+
+    def priorities(self, columns, now):
+        return columns["last_used_at"]
+
+
+class LFUPolicy(EvictionPolicy):
+    """Desaloja la entrada menos reutilizada; desempata por recencia."""
+
+    name = "lfu"
+
+    def priorities(self, columns, now):
+        # last_used_at normalizado a (0, 1) como desempate dentro del mismo conteo
+        recency = columns["last_used_at"] / (now + 1.0)
+        return columns["usage_count"] + recency
+
+
+class TTLPolicy(EvictionPolicy):
+    """Desaloja primero las entradas más antiguas (por `created_at`)."""
+
+    name = "ttl"
+
+    def priorities(self, columns, now):
+        return columns["created_at"]
+
+
+class CostAwarePolicy(EvictionPolicy):
+    """Mezcla frecuencia, recencia y tamaño de la entrada.
+
+    El valor de conservar una entrada crece con sus reutilizaciones y decae con el
+    tiempo sin uso (vida media configurable); se divide por su costo en memoria,
+    de modo que respuestas grandes y poco usadas salen antes.
+    """
+
+    name = "cost"
+
+    def __init__(self, ttl_seconds: float = 0.0, half_life_seconds: float = 7 * 24 * 3600.0):
+        super().__init__(ttl_seconds)
+        self.half_life_seconds = max(1.0, float(half_life_seconds))
+
+    def priorities(self, columns, now):
+        idle = np.maximum(0.0, now - columns["last_used_at"])
+        decay = np.power(0.5, idle / self.half_life_seconds)
+        return (columns["usage_count"] + 1.0) * decay / np.maximum(columns["cost"], 1.0)
+
+
+EVICTION_POLICIES: Dict[str, Type[EvictionPolicy]] = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    TTLPolicy.name: TTLPolicy,
+    CostAwarePolicy.name: CostAwarePolicy,
+}
+
+
+def build_eviction_policy(name: str, ttl_seconds: float = 0.0) -> EvictionPolicy:
+    """Crea la política por nombre (lru | lfu | ttl | cost); por defecto LRU."""
+    policy_cls = EVICTION_POLICIES.get((name or "").strip().lower())
+    if policy_cls is None:
+        log.warning("⚠️ Política de desalojo desconocida, se usará LRU", policy=name)
+        policy_cls = LRUPolicy
+    return policy_cls(ttl_seconds=ttl_seconds)
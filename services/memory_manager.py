@@ -2,15 +2,51 @@
 Administrador de Memoria Semántica (cache inteligente de Q/A)
 """
 from __future__ import annotations
-import os
-import pickle
-from typing import List, Optional, Tuple
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import numpy as np
 from time import time
 
 from models import MemoryEntry
-from config import MEMORY_FILE, MEMORY_SIMILARITY_THRESHOLD, MEMORY_TOP_K
+from config import (
+    MEMORY_FILE,
+    MEMORY_SNAPSHOT_FILE,
+    MEMORY_LOG_FILE,
+    MEMORY_COMPACT_EVERY,
+    MEMORY_SIMILARITY_THRESHOLD,
+    MEMORY_TOP_K,
+    MEMORY_INITIAL_CAPACITY,
+    MEMORY_MAX_ENTRIES,
+    MEMORY_EVICTION_POLICY,
+    MEMORY_TTL_SECONDS,
+    MEMORY_EVICTION_BATCH,
+    NEGATIVE_ANSWER_MARKERS,
+)
 from rag.embedding_manager import EmbeddingManager
+from services.memory_store import MemoryLogStore
+from services.memory_eviction import EvictionPolicy, build_eviction_policy
+from services.text_normalization import canonical_question
+from services import metrics
+from services.keyword_matcher import shared_matcher
+from services.tracing import span
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.memory")
+
+_keywords = shared_matcher()
+_keywords.register("answer.negative", NEGATIVE_ANSWER_MARKERS)
+
+# Rangos de edad (segundos desde created_at) para las estadísticas de hits
+_AGE_BUCKETS: Tuple[Tuple[str, float], ...] = (
+    ("<1h", 3600.0),
+    ("<1d", 24 * 3600.0),
+    ("<7d", 7 * 24 * 3600.0),
+    ("<30d", 30 * 24 * 3600.0),
+    (">=30d", float("inf")),
+)
+
+# Número de franjas para contadores concurrentes
+_STRIPES = 16
 
 
 def _normalize(v: np.ndarray) -> np.ndarray:
@@ -21,72 +57,339 @@ def _normalize(v: np.ndarray) -> np.ndarray:
     return v / norm
 
 
+def _top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """Retorna hasta `k` pares (fila, score) ordenados por producto punto desc."""
+    n = vectors.shape[0]
+    if n == 0 or k <= 0:
+        return []
+    scores = vectors @ np.asarray(query, dtype=np.float32).reshape(-1)
+    k = min(k, n)
+    if k < n:
+        idxs = np.argpartition(scores, -k)[-k:]
+    else:
+        idxs = np.arange(n)
+    idxs = idxs[np.argsort(scores[idxs])[::-1]]
+    return [(int(i), float(scores[int(i)])) for i in idxs]
+
+
+class _StripedCounter:
+    """Contador concurrente repartido en franjas para evitar un único lock caliente."""
+
+    def __init__(self, stripes: int = _STRIPES):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._cells = [0] * stripes
+
+    def add(self, amount: int = 1) -> None:
+        stripe = threading.get_ident() % len(self._cells)
+        with self._locks[stripe]:
+            self._cells[stripe] += amount
+
+    @property
+    def value(self) -> int:
+        return sum(self._cells)
+
+
+class _EmbeddingMatrix:
+    """Matriz float32 contigua de embeddings con metadatos numéricos paralelos.
+
+    Reserva capacidad por duplicación: las inserciones escriben en filas libres al
+    final (O(1) amortizado) sin tocar las filas ya publicadas, de modo que los
+    lectores que tienen una vista `[:n]` nunca observan cambios. Las eliminaciones
+    construyen un búfer nuevo con las filas conservadas.
+    """
+
+    COLUMNS = ("created_at", "last_used_at", "usage_count", "cost", "pinned")
+
+    def __init__(self, initial_capacity: int = 64):
+        self._initial_capacity = max(1, int(initial_capacity))
+        self._data: Optional[np.ndarray] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._data is None else self._data.shape[0]
+
+    def rows(self) -> np.ndarray:
+        """Vista (sin copia) de las filas ocupadas."""
+        if self._data is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._data[:self._size]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Vistas (sin copia) de las columnas de metadatos ocupadas."""
+        if self._data is None:
+            return {name: np.zeros(0, dtype=np.float64) for name in self.COLUMNS}
+        return {name: self._columns[name][:self._size] for name in self.COLUMNS}
+
+    def _allocate(self, capacity: int, dim: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        data = np.empty((capacity, dim), dtype=np.float32)
+        columns = {name: np.empty(capacity, dtype=np.float64) for name in self.COLUMNS}
+        return data, columns
+
+    def append(self, vector: np.ndarray, values: Dict[str, float]) -> int:
+        """Agrega una fila y retorna su índice."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if self._data is None:
+            self._data, self._columns = self._allocate(self._initial_capacity, vector.shape[0])
+        elif vector.shape[0] != self._data.shape[1]:
+            raise ValueError(
+                f"Dimensión de embedding incompatible: {vector.shape[0]} != {self._data.shape[1]}"
+            )
+        if self._size == self._data.shape[0]:
+            data, columns = self._allocate(self._data.shape[0] * 2, self._data.shape[1])
+            data[:self._size] = self._data[:self._size]
+            for name in self.COLUMNS:
+                columns[name][:self._size] = self._columns[name][:self._size]
+            self._data, self._columns = data, columns
+        self._data[self._size] = vector
+        for name in self.COLUMNS:
+            self._columns[name][self._size] = values[name]
+        self._size += 1
+        return self._size - 1
+
+    def rebuild(self, keep: np.ndarray, column_values: List[Dict[str, float]]) -> None:
+        """Reemplaza el búfer por uno nuevo con las filas `keep` (en ese orden)."""
+        if self._data is None:
+            return
+        kept = self._data[:self._size][keep]
+        capacity = max(self._initial_capacity, self.capacity)
+        data, columns = self._allocate(capacity, self._data.shape[1])
+        data[:kept.shape[0]] = kept
+        for name in self.COLUMNS:
+            columns[name][:kept.shape[0]] = [values[name] for values in column_values]
+        self._data, self._columns = data, columns
+        self._size = kept.shape[0]
+
+    def clear(self) -> None:
+        self._data = None
+        self._columns = {}
+        self._size = 0
+
+
+class _MemorySnapshot:
+    """Estado inmutable publicado para los lectores.
+
+    `vectors` es una vista de solo las filas publicadas; `entries[i]` corresponde a
+    la fila i. Los lectores nunca toman locks: leen la referencia al snapshot
+    vigente y trabajan sobre él aunque un escritor publique otro mientras tanto.
+    """
+
+    __slots__ = ("entries", "vectors", "columns", "positions", "exact")
+
+    def __init__(self, entries, vectors, columns, positions, exact):
+        self.entries: Tuple[MemoryEntry, ...] = entries
+        self.vectors: np.ndarray = vectors
+        self.columns: Dict[str, np.ndarray] = columns
+        self.positions: Dict[str, int] = positions
+        self.exact: Dict[str, str] = exact
+
+
 class SemanticMemory:
     """Memoria semántica local y persistente para preguntas/respuestas.
 
     - Usa el mismo modelo de embeddings del sistema para codificar preguntas.
     - Calcula similitud coseno con embeddings normalizados.
-    - Persiste en disco (pickle) para uso posterior.
+    - Mantiene una matriz contigua de embeddings cuya fila i corresponde a entries[i].
+    - Persiste en disco con un registro de solo-anexado compactado periódicamente.
+    - Limita su tamaño (MEMORY_MAX_ENTRIES) desalojando entradas según una política
+      configurable (lru | lfu | ttl | cost) de forma incremental en cada inserción.
+    - Antes del codificador consulta un diccionario por forma canónica de la pregunta,
+      así las repeticiones literales se responden en O(1) sin calcular embeddings.
+    - Etiqueta cada respuesta con los fragmentos de conocimiento que la sustentan y
+      la versión del índice; al cambiar los documentos solo se invalidan las
+      entradas cuyos fragmentos desaparecieron o cambiaron.
+    - Admite entradas fijadas (bancos de preguntas oficiales importados en lote) que
+      no cuentan para el límite de capacidad y nunca se desalojan ni vencen.
+    - Es segura entre hilos: las búsquedas leen un snapshot inmutable sin locks y
+      los escritores (serializados entre sí) publican snapshots nuevos de forma atómica.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[MemoryLogStore] = None,
+        eviction_policy: Optional[EvictionPolicy] = None,
+        max_entries: Optional[int] = None,
+    ):
         self.embedding_manager = EmbeddingManager()
-        self.entries: List[MemoryEntry] = []
+        self._write_lock = threading.RLock()
+        self._usage_locks = [threading.Lock() for _ in range(_STRIPES)]
+        self._matrix = _EmbeddingMatrix(MEMORY_INITIAL_CAPACITY)
+        self._snapshot = _MemorySnapshot((), self._matrix.rows(), self._matrix.columns(), {}, {})
+        self.max_entries = MEMORY_MAX_ENTRIES if max_entries is None else max_entries
+        self.eviction_policy = eviction_policy or build_eviction_policy(MEMORY_EVICTION_POLICY, MEMORY_TTL_SECONDS)
+        self._evictions: Dict[str, int] = {"capacity": 0, "ttl": 0, "stale_knowledge": 0}
+        self.index_version = ""
+        self._lookups = _StripedCounter()
+        self._exact_hits = _StripedCounter()
+        self._semantic_lookups = _StripedCounter()
+        self._semantic_hits = _StripedCounter()
+        self._hits_by_age: Dict[str, _StripedCounter] = {label: _StripedCounter() for label, _ in _AGE_BUCKETS}
+        self._store = store or MemoryLogStore(
+            snapshot_path=MEMORY_SNAPSHOT_FILE,
+            log_path=MEMORY_LOG_FILE,
+            legacy_path=MEMORY_FILE,
+            compact_every=MEMORY_COMPACT_EVERY,
+        )
         self._load()
+        metrics.register_collector("semantic_memory", self._metric_families)
+
+    @property
+    def entries(self) -> List[MemoryEntry]:
+        """Entradas del snapshot vigente (copia; la fila i corresponde a entries[i])."""
+        return list(self._snapshot.entries)
+
+    # ----------------------
+    # Publicación de snapshots (escritores, bajo _write_lock)
+    # ----------------------
+    @staticmethod
+    def _entry_cost(entry: MemoryEntry) -> float:
+        """Costo aproximado en memoria (bytes) de conservar la entrada."""
+        return float(len(entry.question or "") + len(entry.answer or "") + np.asarray(entry.embedding).nbytes)
+
+    @classmethod
+    def _column_values(cls, entry: MemoryEntry) -> Dict[str, float]:
+        return {
+            "created_at": entry.created_at,
+            "last_used_at": entry.last_used_at,
+            "usage_count": entry.usage_count,
+            "cost": cls._entry_cost(entry),
+            "pinned": 1.0 if entry.pinned else 0.0,
+        }
+
+    def _publish(self, added: List[MemoryEntry] = (), removed_ids: Set[str] = frozenset()) -> None:
+        """Aplica inserciones/eliminaciones y publica un snapshot nuevo."""
+        current = self._snapshot
+        if removed_ids:
+            keep_rows = [i for i, e in enumerate(current.entries) if e.id not in removed_ids]
+            kept = [current.entries[i] for i in keep_rows]
+            self._matrix.rebuild(np.asarray(keep_rows, dtype=np.int64), [self._column_values(e) for e in kept])
+            entries = list(kept)
+            positions = {e.id: i for i, e in enumerate(entries)}
+            exact: Dict[str, str] = {}
+            for e in entries:
+                key = canonical_question(e.question)
+                if key:
+                    exact[key] = e.id
+        else:
+            entries = list(current.entries)
+            positions = dict(current.positions)
+            exact = dict(current.exact)
+
+        for entry in added:
+            row = self._matrix.append(entry.embedding, self._column_values(entry))
+            entries.append(entry)
+            positions[entry.id] = row
+            key = canonical_question(entry.question)
+            if key:
+                exact[key] = entry.id
+
+        # Publicación atómica: una sola asignación de referencia
+        self._snapshot = _MemorySnapshot(
+            tuple(entries), self._matrix.rows(), self._matrix.columns(), positions, exact
+        )
+
+    def _reset_entries(self, entries: List[MemoryEntry]) -> None:
+        with self._write_lock:
+            self._matrix.clear()
+            self._snapshot = _MemorySnapshot((), self._matrix.rows(), self._matrix.columns(), {}, {})
+            self._publish(added=list(entries))
 
     # ----------------------
     # Persistencia
     # ----------------------
     def _load(self) -> None:
-        if not os.path.exists(MEMORY_FILE):
-            self.entries = []
-            return
         try:
-            with open(MEMORY_FILE, "rb") as f:
-                data = pickle.load(f)
-            # Reconstruir entradas
-            self.entries = []
-            for item in data:
-                emb = np.array(item["embedding"], dtype=np.float32)
-                self.entries.append(
-                    MemoryEntry(
-                        question=item["question"],
-                        answer=item["answer"],
-                        embedding=_normalize(emb),
-                        created_at=item.get("created_at", time()),
-                        last_used_at=item.get("last_used_at", time()),
-                        usage_count=item.get("usage_count", 0),
-                        last_score=item.get("last_score", 0.0),
-                    )
-                )
+            entries = self._store.load()
+            for entry in entries:
+                entry.embedding = _normalize(np.asarray(entry.embedding, dtype=np.float32))
+            self._reset_entries(entries)
+            with self._write_lock:
+                self._enforce_limits()
         except Exception as e:
-            print(f"❌ Error cargando memoria semántica: {e}")
-            self.entries = []
+            log.error("❌ Error cargando memoria semántica", error=str(e))
+            self._reset_entries([])
+
+    def _maybe_compact(self) -> None:
+        """Lanza la compactación en segundo plano cuando el registro crece demasiado.
 
-    def _save(self) -> None:
+        Se ejecuta bajo el lock de escritura para que el estado capturado coincida con
+        el registro rotado; si otro escritor lo tiene, se deja para la próxima vez.
+        """
+        if not self._store.needs_compaction():
+            return
+        if not self._write_lock.acquire(blocking=False):
+            return
         try:
-            # Crear directorio si no existe
-            os.makedirs(os.path.dirname(MEMORY_FILE) or '.', exist_ok=True)
-            
-            data = [
-                {
-                    "question": e.question,
-                    "answer": e.answer,
-                    "embedding": e.embedding.astype(float).tolist(),
-                    "created_at": e.created_at,
-                    "last_used_at": e.last_used_at,
-                    "usage_count": e.usage_count,
-                    "last_score": e.last_score,
-                }
-                for e in self.entries
-            ]
-            with open(MEMORY_FILE, "wb") as f:
-                pickle.dump(data, f)
-        except Exception as e:
-            print(f"❌ Error guardando memoria semántica: {e}")
+            self._store.compact(list(self._snapshot.entries))
+        finally:
+            self._write_lock.release()
+
+    def compact(self, wait: bool = True) -> None:
+        """Fuerza la compactación del registro en un snapshot."""
+        with self._write_lock:
+            self._store.compact(list(self._snapshot.entries), wait=wait)
 
     # ----------------------
-    # Búsqueda
+    # Desalojo
+    # ----------------------
+    def _evict_ids(self, ids: Set[str], reason: str) -> int:
+        """Elimina las entradas indicadas en una sola publicación. Requiere _write_lock."""
+        ids = {entry_id for entry_id in ids if entry_id in self._snapshot.positions}
+        if not ids:
+            return 0
+        self._publish(removed_ids=ids)
+        self._evictions[reason] = self._evictions.get(reason, 0) + len(ids)
+        for entry_id in ids:
+            try:
+                self._store.log_delete(entry_id)
+            except Exception as e:
+                log.error("❌ Error registrando desalojo de memoria semántica", error=str(e))
+        return len(ids)
+
+    def _enforce_limits(self, budget: Optional[int] = None) -> int:
+        """Desaloja entradas vencidas y las que excedan la capacidad. Requiere _write_lock.
+
+        Trabaja de forma incremental: como máximo `budget` entradas vencidas por
+        llamada (las restantes se retiran en inserciones posteriores). Al superar
+        `max_entries` libera hasta MEMORY_EVICTION_BATCH posiciones de una vez, para que la
+        reconstrucción del snapshot se amortice entre varias inserciones.
+        """
+        if budget is None:
+            budget = MEMORY_EVICTION_BATCH
+        snapshot = self._snapshot
+        now = time()
+        evicted = 0
+        if self.eviction_policy.ttl_seconds > 0 and snapshot.entries:
+            mask = self.eviction_policy.expired(snapshot.columns, now) & (snapshot.columns["pinned"] == 0)
+            expired = np.flatnonzero(mask)[:max(0, budget)]
+            evicted += self._evict_ids({snapshot.entries[i].id for i in expired.tolist()}, "ttl")
+            snapshot = self._snapshot
+        # Las entradas fijadas no cuentan para la capacidad ni son candidatas
+        evictable = np.flatnonzero(snapshot.columns["pinned"] == 0)
+        n = evictable.size
+        if self.max_entries and self.max_entries > 0 and n > self.max_entries:
+            # Holgura acotada al 10% de la capacidad para no vaciar memorias pequeñas
+            headroom = min(max(0, MEMORY_EVICTION_BATCH - 1), self.max_entries // 10)
+            count = n - self.max_entries + headroom
+            priorities = self.eviction_policy.priorities(snapshot.columns, now)[evictable]
+            victims = evictable[np.argpartition(priorities, count - 1)[:count]] if count < n else evictable
+            evicted += self._evict_ids({snapshot.entries[i].id for i in victims.tolist()}, "capacity")
+        return evicted
+
+    def _record_hit_age(self, entry: MemoryEntry, now: float) -> None:
+        age = max(0.0, now - entry.created_at)
+        for label, limit in _AGE_BUCKETS:
+            if age < limit:
+                self._hits_by_age[label].add()
+                break
+
+    # ----------------------
+    # Búsqueda (lectores, sin locks)
     # ----------------------
     def encode_question(self, question: str) -> np.ndarray:
         emb = self.embedding_manager.encode_query(question)
@@ -94,52 +397,93 @@ class SemanticMemory:
         vec = np.array(emb).reshape(-1)
         return _normalize(vec.astype(np.float32))
 
+    def encode_questions(self, questions: List[str]) -> np.ndarray:
+        """Codifica varias preguntas en una sola pasada; filas normalizadas (N, D)."""
+        if not questions:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = np.asarray(self.embedding_manager.encode_queries(questions), dtype=np.float32)
+        vectors = vectors.reshape(len(questions), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
     def search(self, query_embedding: np.ndarray, top_k: int = None) -> List[Tuple[int, float]]:
         """Retorna lista de (index, score) ordenada por similitud desc."""
         if top_k is None:
             top_k = MEMORY_TOP_K
-        if not self.entries:
-            return []
-        # Matriz de embeddings normalizados
-        M = np.stack([e.embedding for e in self.entries], axis=0)
-        scores = M @ query_embedding  # coseno al estar normalizados
-        idxs = np.argsort(scores)[-top_k:][::-1]
-        return [(int(i), float(scores[int(i)])) for i in idxs]
+        # coseno al estar normalizados; un solo producto matriz-vector + argpartition
+        return _top_k(self._snapshot.vectors, query_embedding, top_k)
 
     def find_best(self, question: str) -> Optional[Tuple[MemoryEntry, float]]:
-        q_emb = self.encode_question(question)
-        candidates = self.search(q_emb, top_k=MEMORY_TOP_K)
+        self._lookups.add()
+        snapshot = self._snapshot
+
+        # Nivel 1: coincidencia exacta por forma canónica (sin codificador)
+        with span("memory.exact"):
+            exact_id = snapshot.exact.get(canonical_question(question))
+        if exact_id is not None:
+            hit = self._register_hit(snapshot, snapshot.positions[exact_id], 1.0)
+            if hit is not None:
+                self._exact_hits.add()
+                return hit
+
+        # Nivel 2: búsqueda semántica
+        self._semantic_lookups.add()
+        with span("memory.encode"):
+            q_emb = self.encode_question(question)
+        with span("memory.search", entries=len(snapshot.entries)):
+            candidates = _top_k(snapshot.vectors, q_emb, MEMORY_TOP_K)
         if not candidates:
             return None
         best_idx, best_score = candidates[0]
         if best_score >= MEMORY_SIMILARITY_THRESHOLD:
-            entry = self.entries[best_idx]
-            # actualizar metadatos
-            entry.usage_count += 1
-            entry.last_used_at = time()
-            entry.last_score = best_score
-            self._save()
-            return entry, best_score
+            hit = self._register_hit(snapshot, best_idx, best_score)
+            if hit is not None:
+                self._semantic_hits.add()
+            return hit
         return None
 
+    def _register_hit(self, snapshot: _MemorySnapshot, index: int, score: float) -> Optional[Tuple[MemoryEntry, float]]:
+        """Actualiza metadatos de uso de la entrada acertada; None si estaba vencida."""
+        entry = snapshot.entries[index]
+        now = time()
+        ttl = self.eviction_policy.ttl_seconds
+        if ttl > 0 and not entry.pinned and now - entry.created_at > ttl:
+            # Entrada vencida: se retira y la pregunta sigue el flujo normal
+            with self._write_lock:
+                self._evict_ids({entry.id}, "ttl")
+            return None
+        # Contadores de uso por franjas: sin lock global en la ruta de lectura
+        with self._usage_locks[hash(entry.id) % _STRIPES]:
+            entry.usage_count += 1
+            entry.last_used_at = now
+            entry.last_score = score
+            usage_count = entry.usage_count
+        # Las columnas solo orientan el desalojo; una carrera aquí es inocua
+        snapshot.columns["usage_count"][index] = usage_count
+        snapshot.columns["last_used_at"][index] = now
+        self._record_hit_age(entry, now)
+        try:
+            self._store.log_usage(entry)
+            self._maybe_compact()
+        except Exception as e:
+            log.error("❌ Error guardando uso de memoria semántica", error=str(e))
+        return entry, score
+
     # ----------------------
     # Inserción/actualización
     # ----------------------
-    def add(self, question: str, answer: str, question_embedding: Optional[np.ndarray] = None) -> MemoryEntry:
+    def add(
+        self,
+        question: str,
+        answer: str,
+        question_embedding: Optional[np.ndarray] = None,
+        chunk_ids: Optional[Iterable[str]] = None,
+        index_version: str = "",
+    ) -> MemoryEntry:
         # No cachear respuestas negativas/vacías
-        text = (answer or "").strip().lower()
-        negative_markers = [
-            "no tengo información suficiente",
-            "no puedo responder",
-            "no puedo proporcionar",
-            "no pude generar una respuesta",
-            "no dispongo de las regulaciones",
-            "no está en mi contexto",
-            "te aconsejo consultar",
-            "consulta el reglamento",
-            "consulta con la oficina",
-        ]
-        if not text or any(m in text for m in negative_markers):
+        text = (answer or "").strip()
+        if not text or _keywords.search("answer.negative", text):
             # saltar persistencia de respuestas poco útiles
             return MemoryEntry(question=question, answer=answer, embedding=np.zeros((1,), dtype=np.float32))
 
@@ -155,23 +499,196 @@ class SemanticMemory:
             last_used_at=time(),
             usage_count=0,
             last_score=0.0,
+            chunk_ids=sorted(set(chunk_ids or [])),
+            index_version=index_version or self.index_version,
         )
-        self.entries.append(entry)
-        self._save()
+        self.add_entries([entry])
         return entry
 
+    def add_entries(self, entries: List[MemoryEntry]) -> int:
+        """Inserta un lote de entradas ya codificadas publicando un solo snapshot."""
+        if not entries:
+            return 0
+        with self._write_lock:
+            self._publish(added=list(entries))
+            try:
+                for entry in entries:
+                    self._store.log_add(entry)
+                self._enforce_limits()
+            except Exception as e:
+                log.error("❌ Error guardando memoria semántica", error=str(e))
+        self._maybe_compact()
+        return len(entries)
+
+    def import_pinned(self, pairs: List[Tuple[str, str]], source: str) -> Dict[str, int]:
+        """Carga un banco de preguntas como entradas fijadas.
+
+        Las preguntas se codifican en una sola pasada por lotes y se publican en un
+        único snapshot. Las entradas fijadas importadas antes desde el mismo `source`
+        se reemplazan, de modo que reimportar un archivo es idempotente.
+
+        Args:
+            pairs: Pares (pregunta, respuesta).
+            source: Identificador del archivo de origen.
+
+        Returns:
+            Conteo de entradas importadas y reemplazadas.
+        """
+        unique: Dict[str, Tuple[str, str]] = {}
+        for question, answer in pairs:
+            key = canonical_question(question)
+            if key and (answer or "").strip():
+                # Ante preguntas repetidas prevalece la última del archivo
+                unique[key] = (question.strip(), answer.strip())
+        items = list(unique.values())
+        embeddings = self.encode_questions([q for q, _ in items])
+        now = time()
+        entries = [
+            MemoryEntry(
+                question=question,
+                answer=answer,
+                embedding=embeddings[i],
+                created_at=now,
+                last_used_at=now,
+                pinned=True,
+                source=source,
+                index_version=self.index_version,
+            )
+            for i, (question, answer) in enumerate(items)
+        ]
+        with self._write_lock:
+            replaced = {e.id for e in self._snapshot.entries if e.pinned and e.source == source}
+            self._publish(added=entries, removed_ids=replaced)
+            try:
+                for entry_id in replaced:
+                    self._store.log_delete(entry_id)
+                for entry in entries:
+                    self._store.log_add(entry)
+            except Exception as e:
+                log.error("❌ Error guardando banco de preguntas en memoria semántica", error=str(e))
+        self._maybe_compact()
+        return {"imported": len(entries), "replaced": len(replaced), "skipped": len(pairs) - len(entries)}
+
+    # ----------------------
+    # Invalidación por cambios de conocimiento
+    # ----------------------
+    def invalidate_stale(self, live_ids: Set[str], index_version: str) -> int:
+        """Retira las entradas fundamentadas en fragmentos que ya no existen.
+
+        Args:
+            live_ids: Ids de fragmentos y documentos presentes en el índice actual.
+            index_version: Versión del índice actual.
+
+        Returns:
+            Número de entradas invalidadas.
+        """
+        with self._write_lock:
+            stale = {
+                entry.id for entry in self._snapshot.entries
+                if entry.chunk_ids and not live_ids.issuperset(entry.chunk_ids)
+            }
+            removed = self._evict_ids(stale, "stale_knowledge")
+            # Las entradas que siguen vigentes quedan asociadas a la nueva versión
+            restamped = 0
+            for entry in self._snapshot.entries:
+                if entry.index_version != index_version:
+                    entry.index_version = index_version
+                    restamped += 1
+            self.index_version = index_version
+            if restamped:
+                try:
+                    self._store.log_index_version(index_version)
+                except Exception as e:
+                    log.error("❌ Error registrando versión del índice en memoria semántica", error=str(e))
+        if removed:
+            log.info("🧹 Memoria semántica: respuestas invalidadas por cambios en documentos", removed=removed)
+            self._maybe_compact()
+        return removed
+
     # ----------------------
     # Utilidades
     # ----------------------
     def stats(self) -> dict:
+        lookups = self._lookups.value
+        exact_hits = self._exact_hits.value
+        semantic_lookups = self._semantic_lookups.value
+        semantic_hits = self._semantic_hits.value
+        hits_by_age = {label: counter.value for label, counter in self._hits_by_age.items()}
+        hits = sum(hits_by_age.values())
+        snapshot = self._snapshot
         return {
-            "entries": len(self.entries),
+            "entries": len(snapshot.entries),
+            "pinned": int(np.count_nonzero(snapshot.columns["pinned"])),
             "threshold": MEMORY_SIMILARITY_THRESHOLD,
             "top_k": MEMORY_TOP_K,
+            "matrix_capacity": self._matrix.capacity,
+            "max_entries": self.max_entries,
+            "eviction_policy": self.eviction_policy.name,
+            "index_version": self.index_version,
+            "ttl_seconds": self.eviction_policy.ttl_seconds,
+            "evictions": dict(self._evictions),
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "tiers": {
+                "exact": {
+                    "keys": len(snapshot.exact),
+                    "lookups": lookups,
+                    "hits": exact_hits,
+                    "hit_rate": (exact_hits / lookups) if lookups else 0.0,
+                },
+                "semantic": {
+                    "lookups": semantic_lookups,
+                    "hits": semantic_hits,
+                    "hit_rate": (semantic_hits / semantic_lookups) if semantic_lookups else 0.0,
+                },
+            },
+            "hits_by_age": {
+                label: {
+                    "hits": count,
+                    "share": (count / hits) if hits else 0.0,
+                    "hit_rate": (count / lookups) if lookups else 0.0,
+                }
+                for label, count in hits_by_age.items()
+            },
+            "persistence": self._store.stats(),
         }
 
+    def _metric_families(self) -> List[dict]:
+        """Familias para /metrics a partir de los contadores por franjas (sin costo en la ruta caliente)."""
+        snapshot = self._snapshot
+        return [
+            metrics.counter_family(
+                "aluna_semantic_memory_lookups",
+                "Búsquedas en memoria semántica por nivel",
+                {(("tier", "exact"),): self._lookups.value, (("tier", "semantic"),): self._semantic_lookups.value},
+            ),
+            metrics.counter_family(
+                "aluna_semantic_memory_hits",
+                "Aciertos de memoria semántica por nivel",
+                {(("tier", "exact"),): self._exact_hits.value, (("tier", "semantic"),): self._semantic_hits.value},
+            ),
+            metrics.counter_family(
+                "aluna_semantic_memory_evictions",
+                "Entradas desalojadas por motivo",
+                {(("reason", reason),): count for reason, count in self._evictions.items()},
+            ),
+            metrics.gauge_family(
+                "aluna_semantic_memory_entries", "Entradas en memoria semántica", {(): len(snapshot.entries)}
+            ),
+            metrics.gauge_family(
+                "aluna_semantic_memory_pinned_entries",
+                "Entradas fijadas (bancos de preguntas)",
+                {(): int(np.count_nonzero(snapshot.columns["pinned"]))},
+            ),
+        ]
+
     def clear(self) -> int:
-        n = len(self.entries)
-        self.entries = []
-        self._save()
+        with self._write_lock:
+            n = len(self._snapshot.entries)
+            self._reset_entries([])
+            try:
+                self._store.reset()
+            except Exception as e:
+                log.error("❌ Error limpiando memoria semántica", error=str(e))
         return n
@@ -0,0 +1,345 @@
+"""
+Persistencia de la memoria semántica mediante registro de solo-anexado + snapshot.
+
+- Cada cambio (inserción, uso, eliminación, versión del índice) se anexa como una línea JSON al registro,
+  por lo que un hit de memoria cuesta O(1) en disco en lugar de reescribir todo.
+- Periódicamente el registro se compacta en segundo plano en un snapshot compacto
+  (.npz con los vectores en binario + metadatos en JSON).
+- Al iniciar se carga el snapshot y se reaplica la cola del registro. Todas las
+  operaciones son idempotentes, así que reaplicar un registro ya compactado es seguro.
+"""
+from __future__ import annotations
+import base64
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from models import MemoryEntry
+from services.tracing import span, traced
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.memory.store")
+
+SNAPSHOT_VERSION = 1
+
+# Campos de metadatos que se persisten junto al vector
+_META_FIELDS = (
+    "id", "question", "answer", "created_at", "last_used_at", "usage_count", "last_score",
+    "chunk_ids", "index_version", "pinned", "source",
+)
+
+
+def _entry_meta(entry: MemoryEntry) -> Dict[str, Any]:
+    meta = {name: getattr(entry, name) for name in _META_FIELDS}
+    meta["chunk_ids"] = list(entry.chunk_ids or [])
+    return meta
+
+
+def _encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).copy()
+
+
+def _entry_from_meta(meta: Dict[str, Any], vector: np.ndarray) -> MemoryEntry:
+    now = time()
+    return MemoryEntry(
+        id=meta["id"],
+        question=meta.get("question", ""),
+        answer=meta.get("answer", ""),
+        embedding=vector,
+        created_at=float(meta.get("created_at", now)),
+        last_used_at=float(meta.get("last_used_at", now)),
+        usage_count=int(meta.get("usage_count", 0)),
+        last_score=float(meta.get("last_score", 0.0)),
+        chunk_ids=list(meta.get("chunk_ids") or []),
+        index_version=meta.get("index_version", ""),
+        pinned=bool(meta.get("pinned", False)),
+        source=meta.get("source", ""),
+    )
+
+
+class MemoryLogStore:
+    """Almacén de la memoria semántica: snapshot binario + registro de cambios."""
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        log_path: str,
+        legacy_path: Optional[str] = None,
+        compact_every: int = 1000,
+    ):
+        """
+        Args:
+            snapshot_path: Archivo .npz con el último snapshot compactado.
+            log_path: Registro JSONL de cambios posteriores al snapshot.
+            legacy_path: Pickle del formato anterior, migrado si no hay snapshot ni registro.
+            compact_every: Número de registros tras el cual se compacta en segundo plano.
+        """
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compacting_path = log_path + ".compacting"
+        self.legacy_path = legacy_path
+        self.compact_every = max(1, int(compact_every))
+        self._lock = threading.Lock()
+        self._log_file = None
+        self._records_since_snapshot = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._compactions = 0
+        self._last_compaction_at = 0.0
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+
+    # ----------------------
+    # Carga
+    # ----------------------
+    @traced("memory_store.load")
+    def load(self) -> List[MemoryEntry]:
+        """Reconstruye las entradas: snapshot + registro en compactación + registro actual."""
+        entries: "OrderedDict[str, MemoryEntry]" = OrderedDict()
+        has_snapshot = os.path.exists(self.snapshot_path)
+        has_log = os.path.exists(self.log_path) or os.path.exists(self.compacting_path)
+
+        if not has_snapshot and not has_log and self.legacy_path and os.path.exists(self.legacy_path):
+            for entry in self._load_legacy_pickle():
+                entries[entry.id] = entry
+            log.info("📦 Memoria semántica migrada", source=self.legacy_path, entries=len(entries))
+            self._write_snapshot(list(entries.values()))
+            return list(entries.values())
+
+        if has_snapshot:
+            for entry in self._read_snapshot():
+                entries[entry.id] = entry
+
+        self._records_since_snapshot = 0
+        for path in (self.compacting_path, self.log_path):
+            self._records_since_snapshot += self._replay(path, entries)
+
+        # Una compactación interrumpida se completa ahora de forma síncrona
+        if os.path.exists(self.compacting_path):
+            self._write_snapshot(list(entries.values()))
+            self._truncate_logs()
+        return list(entries.values())
+
+    def _read_snapshot(self) -> List[MemoryEntry]:
+        with np.load(self.snapshot_path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            metas = json.loads(str(data["meta"]))
+        return [_entry_from_meta(meta, vectors[i].copy()) for i, meta in enumerate(metas)]
+
+    def _replay(self, path: str, entries: "OrderedDict[str, MemoryEntry]") -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except Exception:
+                    # Línea truncada (p. ej. caída a mitad de escritura): se ignora
+                    continue
+                count += 1
+                op = record.get("op")
+                if op == "add":
+                    entries[record["id"]] = _entry_from_meta(record, _decode_vector(record["embedding"]))
+                elif op == "use":
+                    entry = entries.get(record.get("id"))
+                    if entry is not None:
+                        entry.usage_count = int(record.get("usage_count", entry.usage_count))
+                        entry.last_used_at = float(record.get("last_used_at", entry.last_used_at))
+                        entry.last_score = float(record.get("last_score", entry.last_score))
+                elif op == "del":
+                    entries.pop(record.get("id"), None)
+                elif op == "version":
+                    # Las entradas presentes en ese momento quedan asociadas a la versión
+                    for entry in entries.values():
+                        entry.index_version = record.get("index_version", entry.index_version)
+                elif op == "clear":
+                    entries.clear()
+        return count
+
+    def _load_legacy_pickle(self) -> List[MemoryEntry]:
+        try:
+            with open(self.legacy_path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            log.error("❌ Error cargando memoria semántica heredada", error=str(e))
+            return []
+        now = time()
+        entries = []
+        for item in data:
+            entries.append(
+                MemoryEntry(
+                    question=item["question"],
+                    answer=item["answer"],
+                    embedding=np.array(item["embedding"], dtype=np.float32),
+                    created_at=item.get("created_at", now),
+                    last_used_at=item.get("last_used_at", now),
+                    usage_count=item.get("usage_count", 0),
+                    last_score=item.get("last_score", 0.0),
+                )
+            )
+        return entries
+
+    # ----------------------
+    # Registro de cambios
+    # ----------------------
+    @traced("memory_store.append")
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, "a", encoding="utf-8")
+            self._log_file.write(line + "\n")
+            self._log_file.flush()
+            self._records_since_snapshot += 1
+
+    def log_add(self, entry: MemoryEntry) -> None:
+        record = {"op": "add", **_entry_meta(entry), "embedding": _encode_vector(entry.embedding)}
+        self._append(record)
+
+    def log_usage(self, entry: MemoryEntry) -> None:
+        self._append({
+            "op": "use",
+            "id": entry.id,
+            "usage_count": entry.usage_count,
+            "last_used_at": entry.last_used_at,
+            "last_score": entry.last_score,
+        })
+
+    def log_delete(self, entry_id: str) -> None:
+        self._append({"op": "del", "id": entry_id})
+
+    def log_index_version(self, index_version: str) -> None:
+        """Asocia todas las entradas registradas hasta ahora a la versión del índice."""
+        self._append({"op": "version", "index_version": index_version})
+
+    def needs_compaction(self) -> bool:
+        with self._lock:
+            busy = self._compaction_thread is not None and self._compaction_thread.is_alive()
+            return not busy and self._records_since_snapshot >= self.compact_every
+
+    # ----------------------
+    # Compactación
+    # ----------------------
+    def compact(self, entries: List[MemoryEntry], wait: bool = False) -> None:
+        """Compacta el estado dado en un snapshot nuevo.
+
+        `entries` debe reflejar exactamente todos los registros anexados hasta ahora:
+        el registro actual se rota de inmediato y el snapshot se escribe en segundo
+        plano (o en el mismo hilo si `wait=True`).
+
+        El estado se captura bajo el mismo lock que rota el registro: un uso anexado
+        mientras tanto queda en el snapshot o en el registro nuevo, nunca se pierde.
+        """
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                if not wait:
+                    return
+                self._compaction_thread.join()
+            metas = [_entry_meta(e) for e in entries]
+            vectors = [np.asarray(e.embedding, dtype=np.float32) for e in entries]
+            self._close_log_locked()
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.compacting_path):
+                    # Anexar al registro pendiente de una compactación anterior fallida
+                    with open(self.log_path, "r", encoding="utf-8") as src, \
+                            open(self.compacting_path, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_path)
+            self._records_since_snapshot = 0
+            thread = threading.Thread(
+                target=self._finish_compaction, args=(metas, vectors), name="memory-compactor", daemon=True
+            )
+            self._compaction_thread = thread
+        if wait:
+            thread.run()
+        else:
+            thread.start()
+
+    def _finish_compaction(self, metas: List[Dict[str, Any]], vectors: List[np.ndarray]) -> None:
+        try:
+            with span("memory_store.compact", entries=len(metas)):
+                self._write_snapshot_raw(metas, vectors)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+            self._compactions += 1
+            self._last_compaction_at = time()
+        except Exception as e:
+            log.error("❌ Error compactando memoria semántica", error=str(e))
+
+    def _write_snapshot(self, entries: List[MemoryEntry]) -> None:
+        self._write_snapshot_raw(
+            [_entry_meta(e) for e in entries],
+            [np.asarray(e.embedding, dtype=np.float32) for e in entries],
+        )
+
+    def _write_snapshot_raw(self, metas: List[Dict[str, Any]], vectors: List[np.ndarray]) -> None:
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        if vectors:
+            matrix = np.stack(vectors, axis=0).astype(np.float32, copy=False)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                vectors=matrix,
+                meta=np.array(json.dumps(metas, ensure_ascii=False)),
+                version=np.array(SNAPSHOT_VERSION),
+            )
+        os.replace(tmp_path, self.snapshot_path)
+
+    def reset(self) -> None:
+        """Elimina todo el contenido persistido (snapshot vacío y registros truncados)."""
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                self._compaction_thread.join()
+            self._close_log_locked()
+            self._write_snapshot([])
+            self._truncate_logs()
+            self._records_since_snapshot = 0
+
+    def _truncate_logs(self) -> None:
+        for path in (self.compacting_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _close_log_locked(self) -> None:
+        if self._log_file is not None:
+            try:
+                self._log_file.close()
+            finally:
+                self._log_file = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_log_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        def size(path: str) -> int:
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+
+        return {
+            "snapshot_file": self.snapshot_path,
+            "log_file": self.log_path,
+            "snapshot_bytes": size(self.snapshot_path),
+            "log_bytes": size(self.log_path) + size(self.compacting_path),
+            "log_records": self._records_since_snapshot,
+            "compactions": self._compactions,
+            "last_compaction_at": self._last_compaction_at,
+        }
@@ -0,0 +1,414 @@
+"""
+Métricas en proceso con exposición en formato de texto de Prometheus.
+
+- Contadores, medidores (gauges) e histogramas con etiquetas, de bajo costo
+  (un lock por métrica, sin asignaciones en la ruta caliente salvo la clave).
+- Colectores: funciones registradas que calculan valores al momento de exponer
+  (tamaños de caché, entradas en memoria, histogramas de trazas).
+- Multiproceso: si METRICS_MULTIPROC_DIR está definido, cada proceso vuelca sus
+  muestras a `<dir>/<pid>.json` periódicamente y al salir; /metrics combina los
+  archivos de todos los procesos (suma contadores e histogramas; los medidores
+  según su modo: sum | max | all, este último con etiqueta `pid`).
+"""
+from __future__ import annotations
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_MULTIPROC_DIR, METRICS_FLUSH_SECONDS
+
+# Buckets por defecto para duraciones en segundos
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"),
+)
+
+# Familia serializable: {"name", "type", "help", "mode", "samples": [[nombre, {etiquetas}, valor], ...]}
+Family = Dict[str, Any]
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def family(self) -> Family:
+        return {"name": self.name, "type": self.type, "help": self.help, "samples": self._samples()}
+
+    def _samples(self) -> List[list]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Valor monótono creciente."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [[self.name + "_total", dict(zip(self.labelnames, key)), value] for key, value in items]
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), mode: str = "all"):
+        super().__init__(name, help, labelnames)
+        self.mode = mode
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def family(self) -> Family:
+        family = super().family()
+        family["mode"] = self.mode
+        return family
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [[self.name, dict(zip(self.labelnames, key)), value] for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribución por buckets acumulativos (más suma y conteo)."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != float("inf"):
+            buckets = buckets + (float("inf"),)
+        self.buckets = buckets
+        # clave -> [conteos por bucket (no acumulativos)..., suma]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 1)
+            state[min(index, len(self.buckets) - 1)] += 1
+            state[-1] += value
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        return histogram_samples(self.name, self.labelnames, self.buckets, items)
+
+
+def histogram_samples(name, labelnames, buckets, items) -> List[list]:
+    """Muestras `_bucket`/`_sum`/`_count` a partir de conteos no acumulativos."""
+    samples = []
+    for key, state in items:
+        labels = dict(zip(labelnames, key))
+        cumulative = 0.0
+        for bound, count in zip(buckets, state[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            samples.append([name + "_bucket", {**labels, "le": le}, cumulative])
+        samples.append([name + "_sum", labels, state[-1]])
+        samples.append([name + "_count", labels, cumulative])
+    return samples
+
+
+class MetricsRegistry:
+    """Registro de métricas y colectores del proceso."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], List[Family]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, *args, **kwargs)
+        if not isinstance(metric, cls):
+            raise ValueError(f"La métrica {name} ya existe con otro tipo ({metric.type})")
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), mode: str = "all") -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames, mode=mode)
+
+    def histogram(
+        self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, key: str, fn: Callable[[], List[Family]]) -> None:
+        """Registra (o reemplaza) un colector que produce familias al exponer."""
+        with self._lock:
+            self._collectors[key] = fn
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        families = [metric.family() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"⚠️ Error en colector de métricas: {e}")
+        return families
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.counter(name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = (), mode: str = "all") -> Gauge:
+    return REGISTRY.gauge(name, help, labelnames, mode)
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help, labelnames, buckets)
+
+
+def counter_family(name: str, help: str, values: Dict[Tuple[Tuple[str, str], ...], float]) -> Family:
+    """Familia de contador para colectores: {((etiqueta, valor), ...): total}."""
+    return {
+        "name": name,
+        "type": "counter",
+        "help": help,
+        "samples": [[name + "_total", dict(labels), float(value)] for labels, value in values.items()],
+    }
+
+
+def gauge_family(name: str, help: str, values: Dict[Tuple[Tuple[str, str], ...], float], mode: str = "all") -> Family:
+    """Familia de medidor para colectores: {((etiqueta, valor), ...): número}."""
+    return {
+        "name": name,
+        "type": "gauge",
+        "help": help,
+        "mode": mode,
+        "samples": [[name, dict(labels), float(value)] for labels, value in values.items()],
+    }
+
+
+def register_collector(key: str, fn: Callable[[], List[Family]]) -> None:
+    REGISTRY.register_collector(key, fn)
+
+
+# ----------------------
+# Combinación multiproceso
+# ----------------------
+def _merge(per_process: Dict[str, List[Family]]) -> List[Family]:
+    merged: Dict[str, Family] = {}
+    sums: Dict[str, Dict[Tuple, list]] = {}
+    for pid, families in per_process.items():
+        for family in families:
+            name = family["name"]
+            target = merged.setdefault(name, {k: v for k, v in family.items() if k != "samples"})
+            acc = sums.setdefault(name, {})
+            mode = family.get("mode", "all")
+            for sample_name, labels, value in family["samples"]:
+                if family["type"] == "gauge" and mode == "all":
+                    labels = {**labels, "pid": str(pid)}
+                key = (sample_name, tuple(sorted(labels.items())))
+                if key not in acc:
+                    acc[key] = [sample_name, labels, value]
+                elif family["type"] == "gauge" and mode == "max":
+                    acc[key][2] = max(acc[key][2], value)
+                else:
+                    acc[key][2] += value
+            target["samples"] = list(acc.values())
+    return list(merged.values())
+
+
+class _MultiProcessWriter:
+    """Vuelca las muestras del proceso a METRICS_MULTIPROC_DIR/<pid>.json."""
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float):
+        self.registry = registry
+        self.directory = directory
+        self.interval = max(1.0, interval)
+        self._started = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            thread = threading.Thread(target=self._loop, name="metrics-writer", daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+            self._started = True
+
+    def _loop(self) -> None:
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        try:
+            payload = {"pid": os.getpid(), "ts": time(), "families": self.registry.collect()}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Error guardando métricas del proceso: {e}")
+
+    def read_all(self) -> Dict[str, List[Family]]:
+        """Familias por pid (el proceso actual primero).
+
+        Los contadores e histogramas de procesos terminados se conservan; sus
+        medidores se descartan cuando el archivo lleva más de 3 intervalos sin
+        actualizarse.
+        """
+        own = f"{os.getpid()}.json"
+        stale_before = time() - 3 * self.interval
+        per_process: Dict[str, List[Family]] = {}
+        for filename in sorted(os.listdir(self.directory), key=lambda name: name != own):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                    payload = json.load(f)
+            except Exception:
+                # Archivo corrupto: se omite en esta lectura
+                continue
+            families = payload.get("families", [])
+            if float(payload.get("ts", 0)) < stale_before:
+                families = [family for family in families if family["type"] != "gauge"]
+            per_process[str(payload.get("pid", filename[:-5]))] = families
+        return per_process
+
+
+_writer: Optional[_MultiProcessWriter] = (
+    _MultiProcessWriter(REGISTRY, METRICS_MULTIPROC_DIR, METRICS_FLUSH_SECONDS) if METRICS_MULTIPROC_DIR else None
+)
+
+
+def start_multiprocess_writer() -> None:
+    """Activa el volcado periódico del proceso actual (no-op sin METRICS_MULTIPROC_DIR)."""
+    if _writer is not None:
+        _writer.ensure_started()
+
+
+def collect_all() -> List[Family]:
+    """Familias del proceso actual o, en modo multiproceso, de todos los procesos."""
+    if _writer is None:
+        return REGISTRY.collect()
+    _writer.ensure_started()
+    _writer.flush()
+    return _merge(_writer.read_all())
+
+
+# ----------------------
+# Formato de texto
+# ----------------------
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_text(families: List[Family]) -> str:
+    """Serializa en el formato de exposición de texto de Prometheus (0.0.4)."""
+    lines: List[str] = []
+    for family in sorted(families, key=lambda f: f["name"]):
+        name = family["name"]
+        lines.append(f"# HELP {name} {_escape(family.get('help', ''))}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample_name, labels, value in family["samples"]:
+            if labels:
+                rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{sample_name}{{{rendered}}} {_format_value(float(value))}")
+            else:
+                lines.append(f"{sample_name} {_format_value(float(value))}")
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------
+# Latencias por etapa (services/tracing.py)
+# ----------------------
+def _stage_latency_families() -> List[Family]:
+    """Convierte los histogramas de trazas (ms) en `aluna_stage_duration_seconds`."""
+    from services.tracing import latency_snapshot
+
+    name = "aluna_stage_duration_seconds"
+    buckets: Optional[Tuple[float, ...]] = None
+    items = []
+    for stage, snap in latency_snapshot().items():
+        bounds = tuple(float("inf") if b == "+Inf" else float(b) / 1000.0 for b, _ in snap["buckets"])
+        buckets = buckets or bounds
+        counts = [float(c) for _, c in snap["buckets"]]
+        items.append(((stage,), counts + [snap["sum_ms"] / 1000.0]))
+    if not items:
+        return []
+    return [{
+        "name": name,
+        "type": "histogram",
+        "help": "Duración de tramos y etapas del pipeline (segundos)",
+        "samples": histogram_samples(name, ("stage",), buckets, items),
+    }]
+
+
+REGISTRY.register_collector("tracing.stages", _stage_latency_families)
@@ -0,0 +1,241 @@
+"""
+Ejecución concurrente de las etapas del flujo de chat.
+
+Cada solicitud crea un `PipelineRun` que agenda etapas (funciones) sobre un pool
+de hilos compartido. Una etapa puede declarar dependencias: se agenda cuando
+todas terminan, sin bloquear hilos del pool esperando. Las etapas especulativas
+(p. ej. la recuperación de contexto mientras se consulta la memoria) pueden
+cancelarse; si ya estaban en ejecución su resultado simplemente se descarta.
+Cada etapa abre un tramo de traza con su nombre; el contexto (traza activa) se
+copia al hilo del pool.
+"""
+from __future__ import annotations
+import contextvars
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.tracing import span
+
+
+class StageCancelled(Exception):
+    """La etapa fue cancelada antes de producir un resultado utilizable."""
+
+
+class _Stage:
+    __slots__ = ("name", "future", "started_at", "finished_at", "cancelled", "deferred")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.future: Future = Future()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        # Tarea especulativa pendiente cuando no hay pool (se ejecuta solo si se pide)
+        self.deferred: Optional[Callable[[], None]] = None
+
+
+class PipelineRun:
+    """Etapas de una solicitud; registra la duración de cada una."""
+
+    def __init__(self, pipeline: "ChatPipeline"):
+        self._pipeline = pipeline
+        self._stages: Dict[str, _Stage] = {}
+        self._lock = threading.Lock()
+        self.created_at = perf_counter()
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        after: Tuple[str, ...] = (),
+        speculative: bool = False,
+    ) -> None:
+        """Agenda la etapa `name`; recibe como argumentos los resultados de `after`.
+
+        Las etapas especulativas arrancan de inmediato sobre el pool; sin pool se
+        difieren hasta que alguien pida su resultado.
+        """
+        stage = _Stage(name)
+        with self._lock:
+            self._stages[name] = stage
+        deps = [self._stages[dep] for dep in after]
+        if not deps:
+            self._launch(stage, fn, (), speculative)
+            return
+
+        pending = [len(deps)]
+        pending_lock = threading.Lock()
+
+        def on_dependency_done(_future: Future) -> None:
+            with pending_lock:
+                pending[0] -= 1
+                ready = pending[0] == 0
+            if not ready:
+                return
+            failed = next((d for d in deps if d.future.cancelled() or d.future.exception() is not None), None)
+            if failed is not None:
+                # Una dependencia falló o se canceló: la etapa no se ejecuta
+                stage.cancelled = True
+                stage.future.set_exception(StageCancelled(f"dependencia '{failed.name}' no disponible"))
+                return
+            self._launch(stage, fn, tuple(d.future.result() for d in deps), speculative)
+
+        for dep in deps:
+            dep.future.add_done_callback(on_dependency_done)
+
+    def _launch(self, stage: _Stage, fn: Callable[..., Any], args: Tuple[Any, ...], speculative: bool) -> None:
+        def task() -> None:
+            if stage.cancelled:
+                stage.future.set_exception(StageCancelled(stage.name))
+                return
+            stage.started_at = perf_counter()
+            try:
+                with span(stage.name):
+                    result = fn(*args)
+            except BaseException as exc:
+                stage.finished_at = perf_counter()
+                stage.future.set_exception(exc)
+                return
+            stage.finished_at = perf_counter()
+            stage.future.set_result(result)
+
+        if speculative and not self._pipeline.enabled:
+            stage.deferred = task
+            return
+        self._pipeline.execute(task)
+
+    def run_inline(self, name: str, fn: Callable[[], Any]) -> Any:
+        """Ejecuta una etapa en el hilo actual registrando su duración."""
+        stage = _Stage(name)
+        with self._lock:
+            self._stages[name] = stage
+        stage.started_at = perf_counter()
+        try:
+            with span(name):
+                result = fn()
+        finally:
+            stage.finished_at = perf_counter()
+        stage.future.set_result(result)
+        return result
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Espera y retorna el resultado de la etapa (propaga su excepción)."""
+        stage = self._stages[name]
+        if stage.deferred is not None:
+            task, stage.deferred = stage.deferred, None
+            task()
+        if stage.cancelled and not stage.future.done():
+            raise StageCancelled(name)
+        return stage.future.result(timeout)
+
+    def has(self, name: str) -> bool:
+        return name in self._stages
+
+    def cancel(self, name: str) -> None:
+        """Cancela una etapa especulativa; si ya corre, su resultado se ignora."""
+        stage = self._stages.get(name)
+        if stage is not None and not stage.future.done():
+            stage.cancelled = True
+            stage.deferred = None
+
+    def timings(self) -> Dict[str, Dict[str, Any]]:
+        """Duración (ms) de cada etapa y su desfase respecto al inicio de la solicitud."""
+        out = {}
+        for name, stage in list(self._stages.items()):
+            entry: Dict[str, Any] = {"cancelled": stage.cancelled}
+            if stage.started_at is not None:
+                entry["start_ms"] = (stage.started_at - self.created_at) * 1000.0
+                if stage.finished_at is not None:
+                    entry["duration_ms"] = (stage.finished_at - stage.started_at) * 1000.0
+            out[name] = entry
+        return out
+
+    def finish(self) -> Dict[str, Dict[str, Any]]:
+        """Cierra la ejecución y acumula sus tiempos en las estadísticas del pipeline."""
+        timings = self.timings()
+        self._pipeline.record(timings, (perf_counter() - self.created_at) * 1000.0)
+        return timings
+
+
+class ChatPipeline:
+    """Pool de hilos compartido y estadísticas agregadas por etapa."""
+
+    def __init__(self, max_workers: int = 8, enabled: bool = True):
+        """
+        Args:
+            max_workers: Hilos del pool compartido entre solicitudes.
+            enabled: Si es False las etapas se ejecutan en el hilo que las agenda
+                (útil para depurar); el orden y los tiempos se conservan.
+        """
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="chat-stage") if enabled else None
+        self._lock = threading.Lock()
+        self._requests = 0
+        # Etapas enviadas al pool que aún esperan un hilo libre
+        self._queued = 0
+        self._wall_ms_total = 0.0
+        self._stage_totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "cancelled": 0})
+
+    def start(self) -> PipelineRun:
+        return PipelineRun(self)
+
+    def execute(self, task: Callable[[], None]) -> None:
+        if self._executor is None:
+            task()
+            return
+
+        def run() -> None:
+            with self._lock:
+                self._queued -= 1
+            task()
+
+        with self._lock:
+            self._queued += 1
+        try:
+            # La tarea hereda la traza activa de quien la agenda
+            self._executor.submit(contextvars.copy_context().run, run)
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def record(self, timings: Dict[str, Dict[str, Any]], wall_ms: float) -> None:
+        with self._lock:
+            self._requests += 1
+            self._wall_ms_total += wall_ms
+            for name, entry in timings.items():
+                totals = self._stage_totals[name]
+                if entry.get("cancelled"):
+                    totals["cancelled"] += 1
+                duration = entry.get("duration_ms")
+                if duration is None:
+                    continue
+                totals["count"] += 1
+                totals["total_ms"] += duration
+                totals["max_ms"] = max(totals["max_ms"], duration)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                name: {
+                    "count": int(t["count"]),
+                    "avg_ms": (t["total_ms"] / t["count"]) if t["count"] else 0.0,
+                    "max_ms": t["max_ms"],
+                    "cancelled": int(t["cancelled"]),
+                }
+                for name, t in self._stage_totals.items()
+            }
+            return {
+                "enabled": self.enabled,
+                "requests": self._requests,
+                "queued": self._queued,
+                "avg_wall_ms": (self._wall_ms_total / self._requests) if self._requests else 0.0,
+                "stages": stages,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
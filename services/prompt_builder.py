@@ -4,6 +4,7 @@ Servicio para construccion de prompts
 from typing import List, Optional
 
 from models import ChatTurn, GeneralKnowledgeResult, PromptContext
+from services.keyword_matcher import shared_matcher
 from config import (
     BOT_CONTEXT,
     BOT_NAME,
@@ -12,6 +13,10 @@ from config import (
     UNIVERSIDAD_KEYWORDS,
 )
 
+_keywords = shared_matcher()
+_keywords.register("university", UNIVERSIDAD_KEYWORDS)
+_keywords.register("department", DEPENDENCIAS)
+
 
 class PromptBuilder:
     """Constructor de prompts para el chatbot"""
@@ -19,11 +24,9 @@ class PromptBuilder:
     @staticmethod
     def suggest_department(question: str) -> str:
         """Sugiere una dependencia basada en palabras clave en la pregunta."""
-        question_lower = question.lower()
-
-        for keyword, dependencia in DEPENDENCIAS.items():
-            if keyword in question_lower:
-                return dependencia
+        hit = _keywords.scan(question).first("department")
+        if hit is not None:
+            return hit.payload
 
         return (
             "la dependencia correspondiente (por favor especifica tu consulta "
@@ -33,8 +36,7 @@ class PromptBuilder:
     @staticmethod
     def is_university_related(question: str) -> bool:
         """Determina si la pregunta esta relacionada con la universidad."""
-        question_lower = question.lower()
-        return any(keyword in question_lower for keyword in UNIVERSIDAD_KEYWORDS)
+        return _keywords.scan(question).has("university")
 
     @classmethod
     def build_prompt_context(
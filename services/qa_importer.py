@@ -0,0 +1,182 @@
+"""
+Importación en lote de bancos de preguntas oficiales a la memoria semántica.
+
+Formatos soportados:
+- DOCX/PDF con bloques "PREGUNTA: ... CONTEXT: ... RESPUESTA_RAPIDA: ..." seguidos
+  opcionalmente de "nombre: ... referencia: ... articulo: ..." (formato del
+  BANCO DE PREGUNTAS 027 DE 2023).
+- CSV con columnas pregunta/respuesta (o question/answer) y referencia opcional.
+- JSONL con objetos {"pregunta"|"question", "respuesta"|"answer", "referencia"?}.
+"""
+from __future__ import annotations
+import csv
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from models import QAPair
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.memory")
+
+# Orden de preferencia cuando un mismo banco existe en varios formatos
+SUPPORTED_EXTENSIONS = (".docx", ".jsonl", ".csv", ".pdf")
+
+_QUESTION_KEYS = ("pregunta", "question")
+_ANSWER_KEYS = ("respuesta", "respuesta_rapida", "answer")
+_REFERENCE_KEYS = ("referencia", "reference", "fuente")
+
+# Un bloque abarca desde PREGUNTA: hasta el siguiente PREGUNTA: o el final del texto
+_BLOCK_PATTERN = re.compile(r"PREGUNTA\s*:(.*?)(?=PREGUNTA\s*:|\Z)", re.IGNORECASE | re.DOTALL)
+_ANSWER_PATTERN = re.compile(r"RESPUESTA(?:_RAPIDA)?\s*:(.*?)(?=\bnombre\s*:|\Z)", re.IGNORECASE | re.DOTALL)
+_CONTEXT_PATTERN = re.compile(r"CONTEXT[O]?\s*:.*", re.IGNORECASE | re.DOTALL)
+_NAME_PATTERN = re.compile(r"\bnombre\s*:(.*?)(?=\breferencia\s*:|\bart[ií]culo\s*:|\n|\Z)", re.IGNORECASE | re.DOTALL)
+_ARTICLE_PATTERN = re.compile(r"\bart[ií]culo\s*:([^\n]*)", re.IGNORECASE)
+
+
+def _clean(text: str) -> str:
+    """Colapsa espacios (incluidos los no separables) y recorta comillas vacías."""
+    text = re.sub(r"\s+", " ", (text or "").replace("\xa0", " ")).strip()
+    return "" if text in ('""', "''") else text
+
+
+def parse_question_bank_text(text: str, source: str = "") -> List[QAPair]:
+    """Extrae pares pregunta/respuesta del texto plano de un banco de preguntas."""
+    pairs: List[QAPair] = []
+    for match in _BLOCK_PATTERN.finditer(text or ""):
+        block = match.group(1)
+        answer_match = _ANSWER_PATTERN.search(block)
+        if not answer_match:
+            continue
+        head = block[:answer_match.start()]
+        question = _clean(_CONTEXT_PATTERN.sub("", head))
+        answer = _clean(answer_match.group(1))
+        if not question or not answer:
+            continue
+
+        tail = block[answer_match.end():]
+        name = _NAME_PATTERN.search(tail)
+        article = _ARTICLE_PATTERN.search(tail)
+        reference = ", ".join(
+            part for part in (_clean(name.group(1)) if name else "", _clean(article.group(1)) if article else "")
+            if part
+        )
+        pairs.append(QAPair(question=question, answer=answer, source=source, reference=reference))
+    return pairs
+
+
+def _pick(row: Dict[str, str], keys) -> str:
+    lowered = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    for key in keys:
+        value = lowered.get(key)
+        if value:
+            return str(value)
+    return ""
+
+
+def _pairs_from_rows(rows, source: str) -> List[QAPair]:
+    pairs = []
+    for row in rows:
+        question = _clean(_pick(row, _QUESTION_KEYS))
+        answer = _clean(_pick(row, _ANSWER_KEYS))
+        if question and answer:
+            pairs.append(QAPair(
+                question=question,
+                answer=answer,
+                source=source,
+                reference=_clean(_pick(row, _REFERENCE_KEYS)),
+            ))
+    return pairs
+
+
+def _read_docx(path: str) -> str:
+    import docx
+
+    doc = docx.Document(path)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+
+def _read_pdf(path: str) -> str:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def load_qa_pairs(path: str, source: Optional[str] = None) -> List[QAPair]:
+    """Lee un banco de preguntas según su extensión.
+
+    Args:
+        path: Archivo del banco.
+        source: Nombre que identifica el banco (por defecto, el nombre del archivo).
+
+    Raises:
+        ValueError: Si la extensión no está soportada.
+    """
+    source = source or os.path.basename(path)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".docx":
+        return parse_question_bank_text(_read_docx(path), source)
+    if ext == ".pdf":
+        return parse_question_bank_text(_read_pdf(path), source)
+    if ext == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return _pairs_from_rows(csv.DictReader(f), source)
+    if ext == ".jsonl":
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rows.append(json.loads(line))
+        return _pairs_from_rows(rows, source)
+    raise ValueError(f"Formato de banco de preguntas no soportado: {ext}")
+
+
+def find_question_banks(directory: str, prefix: str) -> List[str]:
+    """Bancos de preguntas del directorio cuyo nombre empieza por `prefix`.
+
+    Si un banco está en varios formatos (p. ej. DOCX y PDF) se toma uno solo,
+    según el orden de SUPPORTED_EXTENSIONS.
+    """
+    if not os.path.isdir(directory):
+        return []
+    by_stem: Dict[str, str] = {}
+    for filename in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(filename)
+        ext = ext.lower()
+        if not filename.upper().startswith(prefix.upper()) or ext not in SUPPORTED_EXTENSIONS:
+            continue
+        current = by_stem.get(stem)
+        if current is None or SUPPORTED_EXTENSIONS.index(ext) < SUPPORTED_EXTENSIONS.index(os.path.splitext(current)[1].lower()):
+            by_stem[stem] = filename
+    return [os.path.join(directory, filename) for filename in sorted(by_stem.values())]
+
+
+def format_answer(pair: QAPair) -> str:
+    """Respuesta tal como se servirá, con la referencia normativa si existe."""
+    if pair.reference:
+        return f"{pair.answer} ({pair.reference})"
+    return pair.answer
+
+
+def import_question_bank(semantic_memory, path: str, source: Optional[str] = None) -> Dict[str, object]:
+    """Importa un banco de preguntas como entradas fijadas de la memoria semántica.
+
+    Args:
+        semantic_memory: Memoria semántica destino.
+        path: Archivo del banco.
+        source: Nombre que identifica el banco al reimportarlo (por defecto, el nombre
+            del archivo); las subidas pasan el nombre original, no el del temporal.
+
+    Returns:
+        Estadísticas de la importación (archivo, pares leídos, importados, reemplazados).
+    """
+    source = source or os.path.basename(path)
+    pairs = load_qa_pairs(path, source)
+    result = semantic_memory.import_pinned(
+        [(pair.question, format_answer(pair)) for pair in pairs],
+        source=source,
+    )
+    log.info("📥 Banco de preguntas importado", source=source, imported=result["imported"])
+    return {"file": source, "pairs": len(pairs), **result}
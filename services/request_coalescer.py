@@ -0,0 +1,118 @@
+"""
+Coalescencia de solicitudes idénticas en vuelo (single-flight).
+
+Cuando varias solicitudes con la misma clave llegan mientras la primera aún se está
+calculando, solo la primera ("líder") ejecuta el trabajo; las demás esperan y
+comparten su resultado (o su excepción).
+"""
+from __future__ import annotations
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from services.text_normalization import canonical_question
+
+
+def coalescing_key(version: str, question: str, history: Iterable[Any] = ()) -> str:
+    """Clave de coalescencia: versión del conocimiento + pregunta canónica + huella del historial.
+
+    La respuesta depende del historial incluido en el prompt, así que solo se comparte
+    entre solicitudes con el mismo historial (normalmente, sin historial). Retorna ""
+    (no coalescer) si la pregunta queda vacía al normalizarla.
+    """
+    canonical = canonical_question(question)
+    if not canonical:
+        return ""
+    digest = hashlib.sha1()
+    for turn in history:
+        digest.update(f"{turn.role}\x1f{turn.content}\x1e".encode("utf-8"))
+    return f"{version}:{digest.hexdigest()[:16]}:{canonical}"
+
+
+class _InFlightCall:
+    """Cálculo en curso compartido por todas las solicitudes con la misma clave."""
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout: Segundos máximos que un seguidor espera al líder. Si se agota,
+                el seguidor ejecuta el cálculo por su cuenta.
+        """
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._timeouts = 0
+        self._errors = 0
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Ejecuta `fn` una sola vez por clave en vuelo.
+
+        Returns:
+            Tupla (resultado, compartido). `compartido` es True cuando el resultado
+            proviene del cálculo de otra solicitud (esta llamada no ejecutó `fn`).
+        """
+        if not key:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self._timeouts += 1
+                return fn(), False
+            with self._lock:
+                self._coalesced += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self._leaders,
+                "coalesced": self._coalesced,
+                "timeouts": self._timeouts,
+                "errors": self._errors,
+            }
@@ -1,8 +1,30 @@
 """Herramientas para protocolos de seguridad y prevencion de crisis."""
 import re
-from typing import Any, Dict, List, Pattern
+from typing import Any, Dict, List, Optional, Pattern, Tuple
 
 from models import SafetyProtocolResult
+from services.keyword_matcher import KeywordMatcher
+from services.text_normalization import canonical_question, collapse_repeated_letters
+
+# Patrones que son una frase literal entre límites de palabra: se resuelven con el autómata
+_LITERAL_PATTERN_RE = re.compile(r"^\\b(\w+(?: \w+)*)\\b$")
+
+# Signos que separan cláusulas: una frase de crisis no puede cruzarlos
+_CLAUSE_BREAK_RE = re.compile(r"[.,;:!?¡¿()\[\]{}\"«»…—–]+")
+# Separador entre cláusulas en el texto normalizado; ningún patrón contiene "|"
+_CLAUSE_SEPARATOR = " | "
+
+
+def normalize_message(text: str) -> str:
+    """Forma normalizada sobre la que se evalúan los patrones de crisis.
+
+    Minúsculas, sin tildes ni signos de puntuación y con las letras repetidas
+    reducidas a una: "¡¡Ya no quiero víviiir!!" -> "ya no quiero vivir". Las
+    cláusulas quedan separadas por " | " para que una frase no se forme a través
+    de la puntuación: "No, quiero vivir" -> "no | quiero vivir".
+    """
+    clauses = (canonical_question(clause) for clause in _CLAUSE_BREAK_RE.split(text or ""))
+    return collapse_repeated_letters(_CLAUSE_SEPARATOR.join(clause for clause in clauses if clause))
 
 
 def _default_levels() -> Dict[str, Dict[str, Any]]:
@@ -132,36 +154,34 @@ class SafetyProtocol:
     def __init__(self, levels: Dict[str, Dict[str, List[str]]] = None, resources: List[str] = None):
         self.levels = levels or _default_levels()
         self.resources = resources or DEFAULT_RESOURCES
-        self._compiled: Dict[str, List[Pattern[str]]] = {
-            level: [re.compile(pattern, re.IGNORECASE) for pattern in data.get("patterns", [])]
-            for level, data in self.levels.items()
-        }
-
-        self._severity_order = self._compute_severity_order()
+        # Un autómata con las frases de todos los niveles (un conjunto de reglas por nivel)
+        self._matcher = KeywordMatcher(normalize=normalize_message)
+        self._compile()
 
     def evaluate(self, message: str) -> SafetyProtocolResult:
         """Analiza el mensaje y retorna la accion de seguridad necesaria."""
         if not message:
             return SafetyProtocolResult(triggered=False)
 
-        matched_terms: List[str] = []
-        detected_level = ""
-
+        # Una pasada del autómata encuentra las frases de todos los niveles; los patrones
+        # que no son frases literales se evalúan con una expresión combinada por nivel
+        keyword_matches = self._matcher.scan(message)
+        level_matches: Dict[str, List[str]] = {}
         for level in self._severity_order:
-            patterns = self._compiled.get(level, [])
-            level_matches: List[str] = []
-            for pattern in patterns:
-                match = pattern.search(message)
-                if match:
-                    level_matches.append(match.group(0))
-            if level_matches:
-                detected_level = level
-                matched_terms = level_matches
-                break
-
-        if not detected_level:
+            terms = keyword_matches.keywords(level)
+            fallback = self._regex_fallback.get(level)
+            if fallback is not None:
+                terms.extend(match.group(0) for match in fallback.finditer(keyword_matches.text))
+            if terms:
+                level_matches[level] = terms
+
+        if not level_matches:
             return SafetyProtocolResult(triggered=False)
 
+        # El nivel de mayor prioridad con coincidencias define la respuesta
+        detected_level = next(iter(level_matches))
+        matched_terms = level_matches[detected_level]
+
         level_data = self.levels.get(detected_level, {})
         response = self._build_response(detected_level, level_data)
         return SafetyProtocolResult(
@@ -172,6 +192,7 @@ class SafetyProtocol:
             label=level_data.get("label", ""),
             recommendations=level_data.get("recommendations", []) or [],
             alert_required=bool(level_data.get("alert_required", False)),
+            level_matches=level_matches,
         )
 
     def _build_response(self, level: str, level_data: Dict[str, Any]) -> str:
@@ -200,11 +221,7 @@ class SafetyProtocol:
         if not new_levels:
             return
         self.levels = new_levels
-        self._compiled = {
-            level: [re.compile(pattern, re.IGNORECASE) for pattern in data.get("patterns", [])]
-            for level, data in self.levels.items()
-        }
-        self._severity_order = self._compute_severity_order()
+        self._compile()
 
     def update_resources(self, resources: List[str]) -> None:
         """Actualiza el listado base de recursos profesionales."""
@@ -212,6 +229,42 @@ class SafetyProtocol:
             return
         self.resources = resources
 
+    def _compile(self) -> None:
+        """Compila las frases literales en el autómata y combina el resto en una regex por nivel.
+
+        Los patrones que no son frases literales se evalúan sobre el texto normalizado
+        (ver `normalize_message`), por lo que deben escribirse sin tildes ni letras dobles.
+        """
+        for level in list(self._matcher.stats()["rule_sets"]):
+            if level not in self.levels:
+                self._matcher.unregister(level)
+        self._regex_fallback: Dict[str, Pattern[str]] = {}
+        for level, data in self.levels.items():
+            literals, regexes = self._split_patterns(data.get("patterns", []))
+            self._matcher.register(level, literals, whole_word=True)
+            combined = self._combine(regexes)
+            if combined is not None:
+                self._regex_fallback[level] = combined
+        self._severity_order = self._compute_severity_order()
+
+    @staticmethod
+    def _combine(patterns: List[str]) -> Optional[Pattern[str]]:
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+    @staticmethod
+    def _split_patterns(patterns: List[str]) -> Tuple[List[str], List[str]]:
+        literals: List[str] = []
+        regexes: List[str] = []
+        for pattern in patterns:
+            match = _LITERAL_PATTERN_RE.match(pattern)
+            if match:
+                literals.append(match.group(1))
+            else:
+                regexes.append(pattern)
+        return literals, regexes
+
     def _compute_severity_order(self) -> List[str]:
         """Ordena los niveles por prioridad declarada."""
         return sorted(
@@ -0,0 +1,676 @@
+"""
+Backend SQLite (modo WAL) para historial, conversaciones y metadatos de la memoria semántica.
+
+- Una sola base compartida por todos los procesos de la máquina: WAL permite lectores
+  concurrentes con un escritor y `busy_timeout` hace esperar (en lugar de fallar) a
+  los escritores de otros workers.
+- Cada hilo usa su propia conexión. Las sentencias son constantes con parámetros, así
+  que la caché de sentencias de sqlite3 las prepara una sola vez por conexión.
+- Las escrituras de historial y memoria pasan por una confirmación agrupada: las de
+  solicitudes concurrentes del proceso se aplican en una sola transacción.
+- El esquema se versiona con PRAGMA user_version.
+- La búsqueda de conversaciones usa una tabla FTS5 escrita en la misma transacción que
+  los mensajes, así que todos los workers buscan sobre el mismo índice. Si SQLite no
+  incluye FTS5, la búsqueda queda desactivada para este backend.
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import STORAGE_SQLITE_PATH, STORAGE_SQLITE_SYNCHRONOUS, STORAGE_SQLITE_BUSY_TIMEOUT_MS
+from models import ChatTurn, MemoryEntry
+from services import metrics
+from services.conversation_search import tokenize
+from services.group_commit import GroupCommit
+from services.tracing import traced
+from services.structured_logging import get_logger
+
+log = get_logger("aluna.storage")
+
+SCHEMA_VERSION = 1
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_by_session ON history (session_id, id);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    first_message_preview TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversations_by_updated ON conversations (updated_at, id);
+
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS memory_entries (
+    id TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    last_score REAL NOT NULL DEFAULT 0,
+    chunk_ids TEXT NOT NULL DEFAULT '[]',
+    index_version TEXT NOT NULL DEFAULT '',
+    pinned INTEGER NOT NULL DEFAULT 0,
+    source TEXT NOT NULL DEFAULT ''
+)
+"""
+
+# Un documento FTS5 por conversación con sus términos ya normalizados por
+# conversation_search.tokenize (sin tildes ni palabras vacías, como el índice en memoria)
+_SEARCH_TABLE = "CREATE VIRTUAL TABLE conversation_search USING fts5 (terms, tokenize = 'unicode61')"
+_SEARCH_DOCS_TABLE = """
+CREATE TABLE IF NOT EXISTS conversation_search_docs (
+    doc INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL UNIQUE
+)
+"""
+
+# Columnas de metadatos de conversación que se pueden actualizar
+_CONVERSATION_FIELDS = ("title", "created_at", "updated_at", "first_message_preview")
+# Columnas del listado del sidebar
+_META_FIELDS = ("id", "title", "created_at", "updated_at", "first_message_preview", "message_count")
+
+_transactions = metrics.counter(
+    "aluna_storage_transactions", "Transacciones de escritura en la base SQLite por resultado", ("outcome",)
+)
+_appends = metrics.counter("aluna_history_appends", "Turnos agregados al historial")
+
+
+def _index_messages(conn: sqlite3.Connection, conversation_id: str, texts) -> None:
+    """Agrega los términos de mensajes nuevos al documento de búsqueda de la conversación."""
+    terms = " ".join(term for text in texts for term in tokenize(text))
+    if not terms:
+        return
+    row = conn.execute(
+        "SELECT doc FROM conversation_search_docs WHERE conversation_id = ?", (conversation_id,)
+    ).fetchone()
+    if row is None:
+        doc = conn.execute(
+            "INSERT INTO conversation_search_docs (conversation_id) VALUES (?)", (conversation_id,)
+        ).lastrowid
+        conn.execute("INSERT INTO conversation_search (rowid, terms) VALUES (?, ?)", (doc, terms))
+    else:
+        conn.execute("UPDATE conversation_search SET terms = terms || ' ' || ? WHERE rowid = ?", (terms, row[0]))
+
+
+def _unindex_conversation(conn: sqlite3.Connection, conversation_id: str) -> None:
+    """Quita la conversación del índice de búsqueda (al limpiarla, reemplazarla o eliminarla)."""
+    row = conn.execute(
+        "SELECT doc FROM conversation_search_docs WHERE conversation_id = ?", (conversation_id,)
+    ).fetchone()
+    if row is not None:
+        conn.execute("DELETE FROM conversation_search WHERE rowid = ?", row)
+        conn.execute("DELETE FROM conversation_search_docs WHERE doc = ?", row)
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class SQLiteDatabase:
+    """Base SQLite compartida: una conexión por hilo, WAL y esquema versionado."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        synchronous: str = STORAGE_SQLITE_SYNCHRONOUS,
+        busy_timeout_ms: int = STORAGE_SQLITE_BUSY_TIMEOUT_MS,
+    ):
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"PRAGMA synchronous desconocido: {synchronous!r} (usa {', '.join(SYNCHRONOUS_MODES)})")
+        self.path = path or STORAGE_SQLITE_PATH
+        self.synchronous = synchronous
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._pid = os.getpid()
+        self.full_text_search = False
+        self._migrate()
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (se crea al primer uso)."""
+        if os.getpid() != self._pid:
+            # Proceso hijo (p. ej. worker de gunicorn con preload): no reutilizar las
+            # conexiones heredadas del padre
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,  # transacciones explícitas con BEGIN/COMMIT
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transacción de escritura; toma el lock de escritura al empezar (BEGIN IMMEDIATE)."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            _transactions.inc(outcome="rollback")
+            raise
+        _transactions.inc(outcome="commit")
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Lectura consistente de varias consultas (no bloquea a los escritores en WAL)."""
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        with self.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"La base {self.path} tiene un esquema más nuevo ({version}) que esta versión")
+            if version < SCHEMA_VERSION:
+                for statement in _SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                log.info("🗄️ Esquema SQLite inicializado", path=self.path, version=SCHEMA_VERSION)
+            self.full_text_search = self._ensure_search_index(conn)
+
+    def _ensure_search_index(self, conn: sqlite3.Connection) -> bool:
+        """Crea la tabla FTS5 si falta e indexa las conversaciones existentes. False sin FTS5."""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversation_search'").fetchone():
+            return True
+        try:
+            conn.execute(_SEARCH_TABLE)
+        except sqlite3.OperationalError as e:
+            log.warning("⚠️ SQLite sin FTS5: búsqueda de conversaciones desactivada", path=self.path, error=str(e))
+            return False
+        conn.execute(_SEARCH_DOCS_TABLE)
+        rows = conn.execute(
+            "SELECT conversation_id, content FROM conversation_messages ORDER BY conversation_id, seq"
+        ).fetchall()
+        by_conversation: Dict[str, List[str]] = {}
+        for conversation_id, content in rows:
+            by_conversation.setdefault(conversation_id, []).append(content)
+        for conversation_id, texts in by_conversation.items():
+            _index_messages(conn, conversation_id, texts)
+        log.info("🔎 Índice de búsqueda de conversaciones creado", path=self.path, conversations=len(by_conversation))
+        return True
+
+    def checkpoint(self) -> None:
+        """Vuelca el WAL a la base sin bloquear a lectores ni escritores."""
+        self.connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "file": self.path,
+            "size_bytes": _file_size(self.path),
+            "wal_bytes": _file_size(self.path + "-wal"),
+            "synchronous": self.synchronous,
+            "connections": len(self._connections),
+        }
+
+
+class SQLiteHistoryStore:
+    """Historial de chat en SQLite, con la misma interfaz que HistoryStore.
+
+    No mantiene caché en memoria: con varios workers escribiendo, la consulta por el
+    índice (session_id, id) es la fuente de verdad y lee solo las filas pedidas.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self._writer = GroupCommit(self._commit_batch)
+
+    def _commit_batch(self, items: List[Tuple[str, tuple]]) -> List[Optional[int]]:
+        results: List[Optional[int]] = []
+        with self.db.transaction() as conn:
+            for op, params in items:
+                if op == "append":
+                    conn.execute(
+                        "INSERT INTO history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)", params
+                    )
+                    results.append(None)
+                else:
+                    results.append(conn.execute("DELETE FROM history WHERE session_id = ?", params).rowcount)
+        return results
+
+    @traced("history.append")
+    def append(self, session_id: str, role: str, content: str, timestamp: Optional[float] = None) -> None:
+        if not session_id or not role or content is None:
+            return
+        ts = float(timestamp if timestamp is not None else time())
+        self._writer.submit(("append", (session_id, role, content, ts)))
+        _appends.inc()
+
+    @traced("history.get_recent")
+    def get_recent(self, session_id: Optional[str], limit: int = 8) -> List[ChatTurn]:
+        """Últimos `limit` turnos de la sesión (todos si `limit` <= 0)."""
+        if not session_id:
+            return []
+        conn = self.db.connection()
+        if not limit or limit <= 0:
+            rows = conn.execute(
+                "SELECT role, content, timestamp FROM history WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT role, content, timestamp FROM history WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, int(limit)),
+            ).fetchall()
+            rows.reverse()
+        return [ChatTurn(role=role, content=content, timestamp=ts) for role, content, ts in rows]
+
+    @traced("history.clear")
+    def clear(self, session_id: Optional[str]) -> int:
+        """Borra el historial de una sesión. Retorna número de turnos eliminados."""
+        if not session_id:
+            return 0
+        return self._writer.submit(("clear", (session_id,)))
+
+    def sessions(self) -> List[str]:
+        rows = self.db.connection().execute("SELECT DISTINCT session_id FROM history").fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self) -> Dict[str, int]:
+        self.db.checkpoint()
+        return {}
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, **self.db.stats()}
+
+
+class SQLiteConversationStore:
+    """Conversaciones del sidebar en SQLite: metadatos en una fila y mensajes por separado."""
+
+    backend = "sqlite"
+    # Varios workers escriben la misma base
+    shared = True
+
+    _META_COLUMNS = ", ".join(_META_FIELDS)
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        # El índice de búsqueda vive en la base (FTS5), no en cada proceso
+        self.full_text_search = db.full_text_search
+
+    @staticmethod
+    def _messages(conn: sqlite3.Connection, conversation_id: str) -> List[Dict]:
+        rows = conn.execute(
+            "SELECT type, content, timestamp FROM conversation_messages WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,),
+        ).fetchall()
+        return [{"type": t, "content": c, "timestamp": ts} for t, c, ts in rows]
+
+    @staticmethod
+    def _record(row: tuple, messages: List[Dict]) -> Dict:
+        conversation_id, title, created_at, updated_at, preview = row
+        return {
+            "id": conversation_id,
+            "title": title,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "messages": messages,
+            "first_message_preview": preview,
+        }
+
+    @staticmethod
+    def _set_clause(updates: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        fields = [name for name in _CONVERSATION_FIELDS if name in updates]
+        return ", ".join(f"{name} = ?" for name in fields), [updates[name] for name in fields]
+
+    def create(self, conversation: Dict) -> None:
+        self.save(conversation)
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        with self.db.snapshot() as conn:
+            row = conn.execute(
+                "SELECT id, title, created_at, updated_at, first_message_preview FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            return self._record(row, self._messages(conn, conversation_id))
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self.db.snapshot() as conn:
+            rows = conn.execute(
+                "SELECT id, title, created_at, updated_at, first_message_preview FROM conversations "
+                "ORDER BY updated_at DESC, id DESC LIMIT ?",
+                (int(limit) if limit and limit > 0 else -1,),
+            ).fetchall()
+            return [self._record(row, self._messages(conn, row[0])) for row in rows]
+
+    def get_metadata(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.connection().execute(
+            f"SELECT {self._META_COLUMNS} FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return dict(zip(_META_FIELDS, row)) if row is not None else None
+
+    def list_metadata(self, limit: int = 50, after: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        """Metadatos del sidebar por el índice (updated_at, id), sin leer mensajes."""
+        limit = int(limit) if limit and limit > 0 else -1
+        conn = self.db.connection()
+        if after:
+            rows = conn.execute(
+                f"SELECT {self._META_COLUMNS} FROM conversations WHERE (updated_at, id) < (?, ?) "
+                "ORDER BY updated_at DESC, id DESC LIMIT ?",
+                (after[0], after[1], limit),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {self._META_COLUMNS} FROM conversations ORDER BY updated_at DESC, id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(_META_FIELDS, row)) for row in rows]
+
+    def append_messages(self, conversation_id: str, messages: List[Dict], updates: Dict[str, Any]) -> bool:
+        """Agrega los mensajes y actualiza los metadatos en una sola transacción."""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None:
+                return False
+            conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, seq, type, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (conversation_id, row[0] + i, m["type"], m["content"], m["timestamp"])
+                    for i, m in enumerate(messages)
+                ],
+            )
+            clause, values = self._set_clause(updates)
+            conn.execute(
+                f"UPDATE conversations SET message_count = message_count + ?{', ' + clause if clause else ''} WHERE id = ?",
+                (len(messages), *values, conversation_id),
+            )
+            if self.full_text_search:
+                _index_messages(conn, conversation_id, (m["content"] for m in messages))
+            return True
+
+    def append_message(self, conversation_id: str, message: Dict, updates: Dict[str, Any]) -> bool:
+        return self.append_messages(conversation_id, [message], updates)
+
+    def update(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        clause, values = self._set_clause(updates)
+        if not clause:
+            return self.get(conversation_id) is not None
+        with self.db.transaction() as conn:
+            return conn.execute(f"UPDATE conversations SET {clause} WHERE id = ?", (*values, conversation_id)).rowcount > 0
+
+    def clear_messages(self, conversation_id: str, updates: Dict[str, Any]) -> bool:
+        clause, values = self._set_clause(updates)
+        with self.db.transaction() as conn:
+            changed = conn.execute(
+                f"UPDATE conversations SET message_count = 0{', ' + clause if clause else ''} WHERE id = ?",
+                (*values, conversation_id),
+            ).rowcount
+            if changed:
+                conn.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+                if self.full_text_search:
+                    _unindex_conversation(conn, conversation_id)
+            return changed > 0
+
+    def delete(self, conversation_id: str) -> bool:
+        with self.db.transaction() as conn:
+            if self.full_text_search:
+                _unindex_conversation(conn, conversation_id)
+            # Los mensajes se eliminan en cascada
+            return conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+
+    def save(self, conversation: Dict) -> None:
+        """Inserta o reemplaza la conversación completa (metadatos y mensajes)."""
+        self.save_conversations([conversation])
+
+    def save_conversations(self, conversations: List[Dict], conn: Optional[sqlite3.Connection] = None) -> None:
+        """Inserta o reemplaza muchas conversaciones completas en una sola transacción.
+
+        Con `conn` escribe dentro de una transacción ya abierta (migración).
+        """
+        if conn is None:
+            with self.db.transaction() as conn:
+                self.save_conversations(conversations, conn)
+            return
+        conn.executemany(
+            "INSERT INTO conversations (id, title, created_at, updated_at, first_message_preview, message_count) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET title = excluded.title, "
+            "created_at = excluded.created_at, updated_at = excluded.updated_at, "
+            "first_message_preview = excluded.first_message_preview, message_count = excluded.message_count",
+            [
+                (
+                    conversation["id"],
+                    conversation.get("title", ""),
+                    conversation.get("created_at", ""),
+                    conversation.get("updated_at", ""),
+                    conversation.get("first_message_preview", ""),
+                    len(conversation.get("messages") or []),
+                )
+                for conversation in conversations
+            ],
+        )
+        conn.executemany(
+            "DELETE FROM conversation_messages WHERE conversation_id = ?",
+            [(conversation["id"],) for conversation in conversations],
+        )
+        conn.executemany(
+            "INSERT INTO conversation_messages (conversation_id, seq, type, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [
+                (conversation["id"], seq, m.get("type", ""), m.get("content", ""), m.get("timestamp", ""))
+                for conversation in conversations
+                for seq, m in enumerate(conversation.get("messages") or [])
+            ],
+        )
+        if self.full_text_search:
+            for conversation in conversations:
+                messages = conversation.get("messages") or []
+                _unindex_conversation(conn, conversation["id"])
+                _index_messages(conn, conversation["id"], (m.get("content", "") for m in messages))
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Tuple[str, float]], int]:
+        """Conversaciones que contienen algún término de la consulta, por relevancia (BM25 de FTS5).
+
+        Returns:
+            (página de (conversation_id, puntaje), total de conversaciones encontradas)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        with self.db.snapshot() as conn:
+            total = conn.execute(
+                "SELECT COUNT(*) FROM conversation_search WHERE conversation_search MATCH ?", (match,)
+            ).fetchone()[0]
+            rows = conn.execute(
+                "SELECT d.conversation_id, -bm25(conversation_search) AS score FROM conversation_search "
+                "JOIN conversation_search_docs AS d ON d.doc = conversation_search.rowid "
+                "WHERE conversation_search MATCH ? ORDER BY score DESC, d.conversation_id LIMIT ? OFFSET ?",
+                (match, int(limit), int(offset)),
+            ).fetchall()
+        return [(conversation_id, float(score)) for conversation_id, score in rows], total
+
+    def stats(self) -> Dict[str, Any]:
+        count = self.db.connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {
+            "backend": self.backend,
+            "conversations": count,
+            "full_text_search": self.full_text_search,
+            **self.db.stats(),
+        }
+
+
+class SQLiteMemoryStore:
+    """Metadatos y vectores de la memoria semántica en SQLite.
+
+    Misma interfaz que MemoryLogStore. Cada cambio es una fila actualizada en su
+    lugar, así que no hay registro que compactar; `compact` solo vuelca el WAL.
+    Cada proceso mantiene su propia matriz en memoria cargada al iniciar: los workers
+    comparten la persistencia de forma segura, no los cambios en caliente.
+    """
+
+    backend = "sqlite"
+
+    _COLUMNS = (
+        "id, question, answer, embedding, created_at, last_used_at, usage_count, last_score, "
+        "chunk_ids, index_version, pinned, source"
+    )
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self._writer = GroupCommit(self._commit_batch)
+
+    @staticmethod
+    def _row(entry: MemoryEntry) -> tuple:
+        return (
+            entry.id,
+            entry.question,
+            entry.answer,
+            np.asarray(entry.embedding, dtype=np.float32).tobytes(),
+            float(entry.created_at),
+            float(entry.last_used_at),
+            int(entry.usage_count),
+            float(entry.last_score),
+            json.dumps(list(entry.chunk_ids or []), ensure_ascii=False),
+            entry.index_version or "",
+            1 if entry.pinned else 0,
+            entry.source or "",
+        )
+
+    def _commit_batch(self, items: List[Tuple[str, tuple]]) -> List[None]:
+        with self.db.transaction() as conn:
+            for op, params in items:
+                if op == "add":
+                    conn.execute(f"INSERT OR REPLACE INTO memory_entries ({self._COLUMNS}) VALUES "
+                                 "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", params)
+                elif op == "use":
+                    conn.execute(
+                        "UPDATE memory_entries SET usage_count = ?, last_used_at = ?, last_score = ? WHERE id = ?", params
+                    )
+                elif op == "del":
+                    conn.execute("DELETE FROM memory_entries WHERE id = ?", params)
+                elif op == "version":
+                    conn.execute("UPDATE memory_entries SET index_version = ?", params)
+        return [None] * len(items)
+
+    @traced("memory_store.load")
+    def load(self) -> List[MemoryEntry]:
+        rows = self.db.connection().execute(f"SELECT {self._COLUMNS} FROM memory_entries ORDER BY rowid").fetchall()
+        return [
+            MemoryEntry(
+                id=entry_id,
+                question=question,
+                answer=answer,
+                embedding=np.frombuffer(embedding, dtype=np.float32).copy(),
+                created_at=created_at,
+                last_used_at=last_used_at,
+                usage_count=usage_count,
+                last_score=last_score,
+                chunk_ids=json.loads(chunk_ids or "[]"),
+                index_version=index_version,
+                pinned=bool(pinned),
+                source=source,
+            )
+            for (entry_id, question, answer, embedding, created_at, last_used_at, usage_count, last_score,
+                 chunk_ids, index_version, pinned, source) in rows
+        ]
+
+    def log_add(self, entry: MemoryEntry) -> None:
+        self._writer.submit(("add", self._row(entry)))
+
+    def log_usage(self, entry: MemoryEntry) -> None:
+        self._writer.submit(("use", (entry.usage_count, entry.last_used_at, entry.last_score, entry.id)))
+
+    def log_delete(self, entry_id: str) -> None:
+        self._writer.submit(("del", (entry_id,)))
+
+    def log_index_version(self, index_version: str) -> None:
+        self._writer.submit(("version", (index_version,)))
+
+    def save_entries(self, entries: List[MemoryEntry], conn: Optional[sqlite3.Connection] = None) -> None:
+        """Inserta o reemplaza muchas entradas en una sola transacción (migración).
+
+        Con `conn` escribe dentro de una transacción ya abierta.
+        """
+        if conn is None:
+            with self.db.transaction() as conn:
+                self.save_entries(entries, conn)
+            return
+        conn.executemany(
+            f"INSERT OR REPLACE INTO memory_entries ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._row(entry) for entry in entries],
+        )
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def compact(self, entries: List[MemoryEntry], wait: bool = False) -> None:
+        self.db.checkpoint()
+
+    def reset(self) -> None:
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM memory_entries")
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        count = self.db.connection().execute("SELECT COUNT(*) FROM memory_entries").fetchone()[0]
+        return {"backend": self.backend, "entries": count, **self.db.stats()}
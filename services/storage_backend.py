@@ -0,0 +1,128 @@
+"""
+Backends de persistencia intercambiables para historial, conversaciones y memoria semántica.
+
+Un backend crea los tres almacenes con interfaces comunes:
+- history_store():      append / get_recent / clear / sessions / stats (como HistoryStore)
+- conversation_store(): create / get / list / append_message / ... (ver services.conversation_store)
+- memory_store():       load / log_add / log_usage / log_delete / log_index_version / compact / reset / stats
+                        (como MemoryLogStore)
+
+`files` usa los archivos propios de cada almacén (un solo proceso escritor por archivo).
+`sqlite` usa una base WAL compartida que varios workers de gunicorn pueden usar a la vez
+en la misma máquina; `python -m scripts.migrate_storage` copia allí los datos existentes.
+"""
+from __future__ import annotations
+import threading
+from typing import Any, Dict, Optional, Type
+
+from config import (
+    STORAGE_BACKEND,
+    CONVERSATIONS_DIR,
+    MEMORY_FILE,
+    MEMORY_SNAPSHOT_FILE,
+    MEMORY_LOG_FILE,
+    MEMORY_COMPACT_EVERY,
+)
+from services.conversation_store import FileConversationStore
+from services.history_store import HistoryStore
+from services.memory_store import MemoryLogStore
+from services.sqlite_storage import (
+    SQLiteConversationStore,
+    SQLiteDatabase,
+    SQLiteHistoryStore,
+    SQLiteMemoryStore,
+)
+
+
+class StorageBackend:
+    """Backend base: fábrica de los almacenes persistentes."""
+
+    name = "base"
+
+    def history_store(self):
+        raise NotImplementedError
+
+    def conversation_store(self):
+        raise NotImplementedError
+
+    def memory_store(self):
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class FileStorageBackend(StorageBackend):
+    """Archivos por almacén: historial segmentado, un archivo por conversación y snapshot + registro."""
+
+    name = "files"
+
+    def history_store(self) -> HistoryStore:
+        return HistoryStore()
+
+    def conversation_store(self) -> FileConversationStore:
+        return FileConversationStore(CONVERSATIONS_DIR)
+
+    def memory_store(self) -> MemoryLogStore:
+        return MemoryLogStore(
+            snapshot_path=MEMORY_SNAPSHOT_FILE,
+            log_path=MEMORY_LOG_FILE,
+            legacy_path=MEMORY_FILE,
+            compact_every=MEMORY_COMPACT_EVERY,
+        )
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """Una base SQLite (WAL) compartida por los tres almacenes y por todos los workers."""
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None, **options: Any):
+        self.db = SQLiteDatabase(path, **options)
+
+    def history_store(self) -> SQLiteHistoryStore:
+        return SQLiteHistoryStore(self.db)
+
+    def conversation_store(self) -> SQLiteConversationStore:
+        return SQLiteConversationStore(self.db)
+
+    def memory_store(self) -> SQLiteMemoryStore:
+        return SQLiteMemoryStore(self.db)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.db.stats()}
+
+
+STORAGE_BACKENDS: Dict[str, Type[StorageBackend]] = {
+    FileStorageBackend.name: FileStorageBackend,
+    SQLiteStorageBackend.name: SQLiteStorageBackend,
+}
+
+
+def build_storage_backend(name: str = STORAGE_BACKEND, **options: Any) -> StorageBackend:
+    """Crea el backend por nombre (files | sqlite)."""
+    backend_cls = STORAGE_BACKENDS.get((name or "").strip().lower())
+    if backend_cls is None:
+        # A diferencia de otras opciones no se usa un valor por defecto: escribir en otro
+        # lugar del configurado dejaría los datos repartidos entre dos almacenes
+        raise ValueError(f"Backend de almacenamiento desconocido: {name!r} (usa {', '.join(STORAGE_BACKENDS)})")
+    return backend_cls(**options)
+
+
+_shared: Optional[StorageBackend] = None
+_shared_lock = threading.Lock()
+
+
+def shared_backend() -> StorageBackend:
+    """Backend configurado (STORAGE_BACKEND), compartido por los servicios del proceso."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = build_storage_backend()
+        return _shared
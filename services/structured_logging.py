@@ -0,0 +1,187 @@
+"""
+Registro estructurado y no bloqueante.
+
+- `get_logger("aluna.chat")` devuelve un logger que acepta pares clave/valor:
+  `log.info("🧠 Respuesta desde memoria", sim=0.93)`.
+- Los registros se encolan (QueueHandler) y un hilo de fondo (QueueListener) los
+  formatea y escribe; el hilo que atiende la solicitud nunca espera E/S de logs.
+  Si la cola está llena el registro se descarta y se cuenta en
+  `aluna_log_records_dropped_total`.
+- Nivel global con LOG_LEVEL y niveles por módulo con LOG_LEVELS
+  ("aluna.chat=DEBUG,aluna.llm=WARNING"); formato `text` o `json` con LOG_FORMAT.
+"""
+from __future__ import annotations
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, Dict, List
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_FILE, LOG_QUEUE_SIZE
+from services import metrics
+
+ROOT_LOGGER = "aluna"
+
+_dropped = metrics.counter("aluna_log_records_dropped", "Registros descartados por cola de logs llena")
+_listeners: List[logging.handlers.QueueListener] = []
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de bloquear si la cola está llena."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El formateo ocurre en el hilo de fondo; solo se fija el mensaje con sus argumentos
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """`hora nivel logger mensaje clave=valor ...`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name} {record.getMessage()}"
+        fields: Dict[str, Any] = getattr(record, "fields", None) or {}
+        if fields:
+            line += " " + " ".join(f"{key}={_text_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in (getattr(record, "fields", None) or {}).items():
+            # Un campo con el nombre de una clave base no la sobrescribe
+            payload[f"field.{key}" if key in payload else key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _text_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    text = str(value)
+    return json.dumps(text, ensure_ascii=False) if (" " in text or not text) else text
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Adaptador que guarda los kwargs extra como campos estructurados del registro.
+
+    El nivel y el mensaje son solo posicionales para que `level=` o `msg=` puedan
+    usarse como campos.
+    """
+
+    _RESERVED = ("exc_info", "stack_info", "stacklevel", "extra")
+
+    def log(self, level: int, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        options = {key: kwargs.pop(key) for key in self._RESERVED if key in kwargs}
+        options["extra"] = {"fields": kwargs}
+        options.setdefault("stacklevel", 3)
+        self.logger.log(level, msg, *args, **options)
+
+    def debug(self, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg: Any, /, *args: Any, **kwargs: Any) -> None:
+        kwargs.setdefault("exc_info", True)
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """"aluna.chat=DEBUG,aluna.llm=WARNING" -> {"aluna.chat": 10, "aluna.llm": 30}."""
+    levels: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name and isinstance(logging.getLevelName(level), int):
+            levels[name] = logging.getLevelName(level)
+    return levels
+
+
+def queued_handler(*targets: logging.Handler, maxsize: int = LOG_QUEUE_SIZE) -> logging.Handler:
+    """Handler que encola registros para `targets`, escritos por un hilo de fondo."""
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, maxsize))
+    listener = logging.handlers.QueueListener(log_queue, *targets, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return _DroppingQueueHandler(log_queue)
+
+
+def _stop_listeners() -> None:
+    """Vacía las colas al salir del proceso."""
+    while _listeners:
+        try:
+            _listeners.pop().stop()
+        except Exception:
+            pass
+
+
+def configure_logging(force: bool = False) -> None:
+    """Instala el handler encolado en el logger raíz `aluna` (idempotente)."""
+    global _configured
+    with _configure_lock:
+        if _configured and not force:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        formatter: logging.Formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+        targets: List[logging.Handler] = []
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(formatter)
+        targets.append(stream)
+        if LOG_FILE:
+            file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            targets.append(file_handler)
+
+        root.addHandler(queued_handler(*targets))
+        root.setLevel(parse_levels(f"{ROOT_LOGGER}={LOG_LEVEL}").get(ROOT_LOGGER, logging.INFO))
+        root.propagate = False
+        for name, level in parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+        if not _configured:
+            atexit.register(_stop_listeners)
+        _configured = True
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """Logger estructurado bajo `aluna.*`; configura el registro en el primer uso."""
+    configure_logging()
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + "."):
+        name = f"{ROOT_LOGGER}.{name}"
+    return StructuredLogger(logging.getLogger(name), {})
@@ -0,0 +1,70 @@
+"""
+Utilidades de normalización de texto compartidas por los servicios.
+"""
+from __future__ import annotations
+import re
+import unicodedata
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_REPEATED_LETTER_RE = re.compile(r"([^\W\d_])(?=\1)\1*")
+_REPEATED_ASCII_LETTER_RE = re.compile(r"([A-Za-z])(?=\1)\1*")
+
+
+def _strip_accents_nfkd(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+# Reemplazo directo para Latin-1 y Latin extendido (U+0080-U+024F): solo se tocan
+# los caracteres no ASCII; fuera de ese rango se recurre a NFKD
+_ACCENT_MAP = {
+    chr(code): _strip_accents_nfkd(chr(code))
+    for code in range(0x80, 0x250)
+    if _strip_accents_nfkd(chr(code)) != chr(code)
+}
+_LATIN_RE = re.compile("[\u0080-\u024f]")
+_BEYOND_TABLE_RE = re.compile("[^\x00-\u024f]")
+
+
+def _replace_accent(match: "re.Match[str]") -> str:
+    ch = match.group(0)
+    return _ACCENT_MAP.get(ch, ch)
+
+
+def strip_accents(text: str) -> str:
+    """Elimina tildes y diacríticos conservando la letra base (á -> a, ñ -> n)."""
+    if text.isascii():
+        return text
+    if _BEYOND_TABLE_RE.search(text) is not None:
+        return _strip_accents_nfkd(text)
+    return _LATIN_RE.sub(_replace_accent, text)
+
+
+def fold_text(text: str) -> str:
+    """Pasa a minúsculas, elimina tildes y colapsa espacios."""
+    if not text:
+        return ""
+    return " ".join(strip_accents(text.casefold()).split())
+
+
+def canonical_question(text: str) -> str:
+    """Forma canónica de una pregunta para comparaciones exactas.
+
+    Ignora mayúsculas, tildes, signos de puntuación y espacios repetidos, de modo que
+    "¿Cómo me matriculo?" y "como me  matriculo" producen la misma clave.
+    """
+    if not text:
+        return ""
+    folded = strip_accents(text.casefold())
+    folded = _PUNCTUATION_RE.sub(" ", folded).replace("_", " ")
+    return " ".join(folded.split())
+
+
+def collapse_repeated_letters(text: str) -> str:
+    """Reduce cada letra repetida consecutiva a una sola ("noooo" -> "no").
+
+    También reduce dobles legítimas ("llamar" -> "lamar"), por lo que debe aplicarse
+    por igual al texto y a las frases con las que se compara.
+    """
+    pattern = _REPEATED_ASCII_LETTER_RE if text.isascii() else _REPEATED_LETTER_RE
+    return pattern.sub(r"\1", text)
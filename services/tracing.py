@@ -0,0 +1,281 @@
+"""
+Trazas ligeras de latencia por etapa.
+
+- `span(nombre)` mide un bloque de código. Si hay una traza activa (una por
+  solicitud HTTP) el tramo se agrega a ella; en cualquier caso su duración se
+  acumula en un histograma de latencias en proceso.
+- La traza activa viaja en `contextvars`, por lo que las tareas enviadas al pool
+  del pipeline con el contexto copiado (ver services/pipeline.py) cuelgan sus
+  tramos de la misma solicitud.
+- `init_tracing(app)` abre una traza por solicitud, agrega la cabecera
+  `Server-Timing` y escribe una línea JSON por solicitud en el registro de trazas.
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import TRACING_ENABLED, TRACE_LOG_FILE, TRACE_SLOW_MS
+from services.structured_logging import queued_handler
+
+# Límites superiores (ms) de los buckets de los histogramas de latencia
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"),
+)
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("aluna_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("aluna_span", default=None)
+_span_ids = itertools.count(1)
+
+trace_logger = logging.getLogger("aluna.trace")
+
+
+class LatencyHistogram:
+    """Histograma de latencias con buckets fijos."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms: float) -> None:
+        index = bisect_left(self.buckets, value_ms)
+        with self._lock:
+            self._counts[min(index, len(self._counts) - 1)] += 1
+            self._sum += value_ms
+            self._count += 1
+            if value_ms > self._max:
+                self._max = value_ms
+
+    def _quantile(self, counts: List[int], total: int, maximum: float, q: float) -> float:
+        """Estimación por interpolación lineal dentro del bucket (acotada al máximo)."""
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                upper = bound if bound != float("inf") else max(lower, maximum)
+                return min(maximum, lower + (upper - lower) * ((rank - seen) / count))
+            seen += count
+            lower = bound
+        return maximum
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, total_sum, maximum = self._count, self._sum, self._max
+        return {
+            "count": total,
+            "sum_ms": total_sum,
+            "avg_ms": (total_sum / total) if total else 0.0,
+            "max_ms": maximum,
+            "p50_ms": self._quantile(counts, total, maximum, 0.50),
+            "p95_ms": self._quantile(counts, total, maximum, 0.95),
+            "p99_ms": self._quantile(counts, total, maximum, 0.99),
+            # Pares [límite superior, conteo] (no acumulativos)
+            "buckets": [["+Inf" if b == float("inf") else b, c] for b, c in zip(self.buckets, counts)],
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str) -> LatencyHistogram:
+    hist = _histograms.get(name)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(name, LatencyHistogram())
+    return hist
+
+
+def latency_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Histogramas de latencia por nombre de tramo."""
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {name: hist.snapshot() for name, hist in sorted(items)}
+
+
+class Trace:
+    """Tramos de una solicitud."""
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.started_at = time()
+        self._t0 = perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.duration_ms: Optional[float] = None
+
+    def add_span(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def offset_ms(self, t: float) -> float:
+        return (t - self._t0) * 1000.0
+
+    def finish(self) -> float:
+        self.duration_ms = (perf_counter() - self._t0) * 1000.0
+        return self.duration_ms
+
+    def totals_by_name(self) -> Dict[str, float]:
+        """Duración acumulada (ms) por nombre de tramo, en orden de aparición."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for record in sorted(spans, key=lambda r: r["start_ms"]):
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration_ms"]
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda r: r["start_ms"])
+        return {
+            "trace": self.name,
+            "ts": self.started_at,
+            "duration_ms": self.duration_ms,
+            **self.attrs,
+            "spans": spans,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Mide el bloque; los atributos agregados al dict devuelto quedan en el tramo."""
+    if not TRACING_ENABLED:
+        yield attrs
+        return
+    trace = _current_trace.get()
+    span_id = next(_span_ids)
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    start = perf_counter()
+    error: Optional[str] = None
+    try:
+        yield attrs
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        end = perf_counter()
+        _current_span.reset(token)
+        duration_ms = (end - start) * 1000.0
+        histogram(name).observe(duration_ms)
+        if trace is not None:
+            record: Dict[str, Any] = {
+                "name": name,
+                "id": span_id,
+                "parent": parent,
+                "start_ms": round(trace.offset_ms(start), 3),
+                "duration_ms": round(duration_ms, 3),
+                "thread": threading.current_thread().name,
+            }
+            if attrs:
+                record["attrs"] = attrs
+            if error:
+                record["error"] = error
+            trace.add_span(record)
+
+
+def traced(name: str):
+    """Decorador equivalente a envolver la función en `span(name)`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name: str, **attrs: Any) -> Tuple[Trace, contextvars.Token]:
+    trace = Trace(name, attrs)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token) -> Optional[Trace]:
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None and trace.duration_ms is None:
+        trace.finish()
+    return trace
+
+
+def server_timing_header(trace: Trace) -> str:
+    """Valor de `Server-Timing`: una métrica por nombre de tramo más el total."""
+    parts = []
+    for name, total in trace.totals_by_name().items():
+        metric = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
+        parts.append(f"{metric};dur={total:.1f}")
+    if trace.duration_ms is not None:
+        parts.append(f"total;dur={trace.duration_ms:.1f}")
+    return ", ".join(parts)
+
+
+def _configure_trace_log() -> None:
+    if not TRACE_LOG_FILE or trace_logger.handlers:
+        return
+    os.makedirs(os.path.dirname(TRACE_LOG_FILE) or ".", exist_ok=True)
+    handler = logging.FileHandler(TRACE_LOG_FILE, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    # Escritura en segundo plano: la respuesta no espera la E/S del registro de trazas
+    trace_logger.addHandler(queued_handler(handler))
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+
+def log_trace(trace: Trace) -> None:
+    """Escribe la traza como una línea JSON si supera TRACE_SLOW_MS."""
+    if not TRACE_LOG_FILE or (trace.duration_ms or 0.0) < TRACE_SLOW_MS:
+        return
+    trace_logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+
+def init_tracing(app) -> None:
+    """Abre una traza por solicitud y publica `Server-Timing` en la respuesta."""
+    if not TRACING_ENABLED:
+        return
+    from flask import g, request
+
+    _configure_trace_log()
+
+    @app.before_request
+    def _start_request_trace():
+        g._trace, g._trace_token = start_trace(
+            "http", method=request.method, path=request.path, endpoint=request.endpoint
+        )
+
+    @app.after_request
+    def _finish_request_trace(response):
+        token = g.pop("_trace_token", None)
+        trace = g.pop("_trace", None)
+        if token is None or trace is None:
+            return response
+        try:
+            end_trace(token)
+        except ValueError:
+            # El token pertenece a otro contexto (p. ej. respuesta en streaming)
+            trace.finish()
+        histogram(f"http.{request.endpoint or 'unknown'}").observe(trace.duration_ms or 0.0)
+        trace.attrs["status"] = response.status_code
+        response.headers["Server-Timing"] = server_timing_header(trace)
+        log_trace(trace)
+        return response
@@ -10,11 +10,34 @@ import numpy as np
 from PIL import Image
 from typing import Optional, Dict, List, Tuple, Any
 import torch
-import logging
+import functools
+from time import perf_counter
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from services import metrics
+from services.tracing import traced
+from services.structured_logging import get_logger
+
+# Registro encolado (ver services/structured_logging.py)
+logger = get_logger("aluna.vision")
+
+_analyses = metrics.counter("aluna_vision_analyses", "Análisis de imagen por origen y resultado", ("source", "outcome"))
+_analysis_latency = metrics.histogram(
+    "aluna_vision_analysis_duration_seconds", "Duración del análisis de imagen (segundos)", ("source",)
+)
+
+
+def _measured(source: str):
+    """Cuenta el análisis (ok/error) y observa su duración."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            result = fn(*args, **kwargs)
+            _analysis_latency.observe(perf_counter() - started, source=source)
+            _analyses.inc(source=source, outcome="error" if "error" in result else "ok")
+            return result
+        return wrapper
+    return decorator
 
 
 class VisionService:
@@ -135,6 +158,8 @@ class VisionService:
             }
         }
 
+    @traced("vision.analyze")
+    @_measured("path")
     def analyze_image(self, image_path: str) -> Dict[str, Any]:
         """
         Analiza una imagen para identificar objetos culturales indígenas
@@ -178,6 +203,8 @@ class VisionService:
             logger.error(f"Error analizando imagen: {e}")
             return {"error": f"Error procesando imagen: {str(e)}"}
 
+    @traced("vision.analyze")
+    @_measured("bytes")
     def analyze_image_from_bytes(self, image_bytes: bytes, filename: str) -> Dict[str, Any]:
         """
         Analiza una imagen desde bytes directamente
@@ -248,6 +275,7 @@ class VisionService:
             logger.error(f"Error cargando imagen: {e}")
             return None
 
+    @traced("vision.describe")
     def _generate_image_description(self, image: Image.Image) -> str:
         """Genera una descripción textual de la imagen usando BLIP"""
         try:
@@ -264,6 +292,7 @@ class VisionService:
             logger.error(f"Error generando descripción: {e}")
             return "No se pudo generar descripción de la imagen"
 
+    @traced("vision.classify")
     def _classify_objects(self, image: Image.Image) -> List[Dict[str, Any]]:
         """Clasifica objetos en la imagen"""
         try:
@@ -316,6 +345,7 @@ class VisionService:
         matches.sort(key=lambda x: x["confidence"], reverse=True)
         return matches[:3]  # Retornar top 3 matches
 
+    @traced("vision.colors")
     def _analyze_dominant_colors(self, image_path: str) -> List[Dict[str, Any]]:
         """Analiza los colores dominantes en la imagen"""
         try:
@@ -365,6 +395,7 @@ class VisionService:
             logger.error(f"Error analizando colores: {e}")
             return []
 
+    @traced("vision.texture")
     def _analyze_texture_patterns(self, image_path: str) -> Dict[str, Any]:
         """Analiza texturas y patrones en la imagen"""
         try:
@@ -277,10 +277,9 @@ class OrigenChat {
             await this.createNewConversation();
         }
 
-        // Agregar mensaje del usuario si hay texto
+        // Agregar mensaje del usuario si hay texto (el backend lo registra con la respuesta, o solo la pregunta si falla)
         if (message) {
             this.addMessage('user', message);
-            await this.saveMessage('user', message);
         }
 
         // Renderizar imágenes en el chat como mensajes del usuario y preparar upload
@@ -323,12 +322,9 @@ class OrigenChat {
             
             const aiResponse = response.answer || 'Lo siento, no pude procesar tu pregunta.';
             
-            // Agregar respuesta de ORIGEN
+            // Agregar respuesta de ORIGEN (/api/chat ya guardó pregunta y respuesta)
             this.addMessage('ai', aiResponse);
             
-            // Guardar respuesta en el backend
-            await this.saveMessage('ai', aiResponse);
-            
             // Recargar la lista de conversaciones para actualizar el título
             await this.loadConversations();
             
@@ -352,7 +348,8 @@ class OrigenChat {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                question: message
+                question: message,
+                conversation_id: this.currentConversationId
             })
         });
 
@@ -909,7 +906,8 @@ class OrigenChat {
 
     async loadConversations() {
         try {
-            const response = await fetch('/api/conversations/');
+            // El sidebar solo muestra título y fecha: pedir únicamente esos metadatos
+            const response = await fetch('/api/conversations/?fields=id,title,updated_at');
             const data = await response.json();
             
             if (data.success) {
@@ -1126,25 +1124,6 @@ class OrigenChat {
         }
     }
 
-    async saveMessage(type, content) {
-        if (!this.currentConversationId) return;
-        
-        try {
-            await fetch(`/api/conversations/${this.currentConversationId}/messages`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    type: type,
-                    content: content
-                })
-            });
-        } catch (error) {
-            console.error('Error guardando mensaje:', error);
-        }
-    }
-
     updateConversationHeader(title, date) {
         this.conversationTitle.textContent = title;
         this.conversationDate.textContent = this.formatConversationDate(date);
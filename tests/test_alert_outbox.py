@@ -0,0 +1,91 @@
+"""
+Prueba del outbox de alertas de seguridad contra un webhook local
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from services.alert_outbox import AlertOutbox, STATUS_DELIVERED, STATUS_FAILED, STATUS_PENDING
+
+
+class _StubWebhook(BaseHTTPRequestHandler):
+    """Responde 500 a los primeros `failures` intentos y 200 después."""
+
+    failures = 0
+    received = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).received.append((self.headers.get("Idempotency-Key"), self.headers.get("Authorization"), body))
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_response(500)
+        else:
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _wait_for(outbox, alert_id, status, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        current = outbox.status(alert_id)
+        if current and current["status"] == status:
+            return current
+        time.sleep(0.02)
+    raise AssertionError(f"la alerta no llegó a {status}: {outbox.status(alert_id)}")
+
+
+def test_alert_outbox_delivery_and_retry():
+    """Las alertas se entregan en segundo plano, con reintentos y estado persistido"""
+    print("Probando AlertOutbox...")
+    server = HTTPServer(("127.0.0.1", 0), _StubWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/alerts"
+    path = os.path.join(tempfile.mkdtemp(), "outbox.jsonl")
+
+    try:
+        # Sin despachador la alerta queda pendiente y persistida
+        offline = AlertOutbox(path, webhook_url=url)
+        queued_id = offline.enqueue({"severity": "high", "question": "no quiero vivir"})
+        assert offline.status(queued_id)["status"] == STATUS_PENDING
+
+        # Un nuevo proceso la reanuda; el webhook falla dos veces antes de aceptar
+        _StubWebhook.failures = 2
+        outbox = AlertOutbox(path, webhook_url=url, token="secreto", retry_base=0.05, max_attempts=5)
+        assert outbox.start()
+        delivered = _wait_for(outbox, queued_id, STATUS_DELIVERED)
+        assert delivered["attempts"] == 3 and delivered["last_error"] == ""
+        keys = [key for key, _, _ in _StubWebhook.received]
+        assert keys == [queued_id] * 3
+        _, auth, body = _StubWebhook.received[-1]
+        assert auth == "Bearer secreto" and body["severity"] == "high" and body["attempt"] == 3
+        print(f"   ✓ Entregada tras {delivered['attempts']} intentos")
+
+        # Agotar los intentos marca la alerta como fallida
+        outbox.max_attempts = 2
+        _StubWebhook.failures = 10
+        failed_id = outbox.enqueue({"severity": "high"})
+        failed = _wait_for(outbox, failed_id, STATUS_FAILED)
+        assert failed["attempts"] == 2 and "500" in failed["last_error"]
+        outbox.stop()
+
+        # El estado sobrevive al reinicio (registro compactado)
+        reopened = AlertOutbox(path, webhook_url=url)
+        assert reopened.status(queued_id)["status"] == STATUS_DELIVERED
+        assert reopened.status(failed_id)["status"] == STATUS_FAILED
+        stats = reopened.stats()
+        assert stats[STATUS_DELIVERED] == 1 and stats[STATUS_FAILED] == 1 and stats[STATUS_PENDING] == 0
+        print(f"   ✓ Estado persistido: {stats}")
+    finally:
+        server.shutdown()
+    print("\n✅ Outbox de alertas verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_alert_outbox_delivery_and_retry()
@@ -43,5 +43,226 @@ def test_conversation_manager():
         shutil.rmtree("conversations_test")
         print("🧹 Archivos de prueba eliminados")
 
+def test_file_conversation_store():
+    """Un archivo de mensajes por conversación e índice de metadatos con registro"""
+    import json
+    import os
+    import tempfile
+    from services.conversation_store import FileConversationStore
+
+    path = tempfile.mkdtemp()
+    # El archivo único de versiones anteriores se migra al abrir
+    legacy = [{"id": "antigua", "title": "Hola", "created_at": "2024-01-01", "updated_at": "2024-01-01",
+               "messages": [{"type": "user", "content": "hola", "timestamp": "2024-01-01"}],
+               "first_message_preview": "hola"}]
+    with open(os.path.join(path, "conversations.json"), "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    manager = ConversationManager(store=FileConversationStore(path, compact_every=5), cache_size=0)
+    assert manager.get_conversation("antigua") == legacy[0]
+    assert not os.path.exists(os.path.join(path, "conversations.json"))
+
+    conv = manager.create_conversation()
+    manager.add_message(conv["id"], "user", "¿Qué es la Sierra Nevada?")
+    manager.add_message(conv["id"], "ai", "Un macizo montañoso.")
+    manager.update_title(conv["id"], "Sierra")
+    # Solo se anexan líneas al archivo de la conversación
+    with open(manager.store._messages_path(conv["id"]), encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    assert not manager.add_message("../otra", "user", "hola")
+
+    manager.delete_conversation("antigua")
+    manager.store.close()
+    # Al reabrir: snapshot compactado + cola del registro
+    reopened = ConversationManager(store=FileConversationStore(path, compact_every=5))
+    assert [c["id"] for c in reopened.get_all_conversations()] == [conv["id"]]
+    stored = reopened.get_conversation(conv["id"])
+    assert stored["title"] == "Sierra" and [m["type"] for m in stored["messages"]] == ["user", "ai"]
+    assert reopened.store.stats()["index_log_records"] < 5
+    print(f"   ✓ Almacén por conversación: {reopened.store.stats()}")
+
+def test_conversation_listing_pages():
+    """Listado del sidebar: solo metadatos, paginado por cursor y con proyección"""
+    import os
+    import tempfile
+    from services.conversation_store import FileConversationStore
+    from services.sqlite_storage import SQLiteConversationStore, SQLiteDatabase
+
+    base = tempfile.mkdtemp()
+    for store in (FileConversationStore(os.path.join(base, "conversations")),
+                  SQLiteConversationStore(SQLiteDatabase(os.path.join(base, "aluna.db")))):
+        manager = ConversationManager(store=store)
+        for i in range(7):
+            # Varias con la misma fecha: el id desempata el orden
+            store.save({"id": f"c{i}", "title": f"Tema {i}", "created_at": "2024", "updated_at": f"2024-0{i // 2}",
+                        "messages": [{"type": "user", "content": "x", "timestamp": "2024"}] * i})
+        manager.update_title("c0", "Reciente")
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = manager.list_conversations(limit=3, cursor=cursor, fields=["title", "message_count"])
+            seen.extend(page)
+            if cursor is None:
+                break
+        assert [c["id"] for c in seen] == ["c0", "c6", "c5", "c4", "c3", "c2", "c1"]
+        assert seen[0] == {"id": "c0", "title": "Reciente", "message_count": 0} and seen[1]["message_count"] == 6
+        try:
+            manager.list_conversations(fields=["messages"])
+            assert False, "Campo no permitido"
+        except ValueError:
+            pass
+        print(f"   ✓ Listado paginado ({store.backend})")
+
+def test_write_behind_cache():
+    """Las escrituras quedan en memoria hasta el flush; las lecturas salen de la caché"""
+    import os
+    import tempfile
+    from services.conversation_store import FileConversationStore
+
+    path = tempfile.mkdtemp()
+    store = FileConversationStore(path)
+    manager = ConversationManager(store=store, cache_size=2, flush_interval=3600)
+    conv = manager.create_conversation()
+    manager.add_message(conv["id"], "user", "¿Dónde queda la biblioteca?")
+    manager.add_message(conv["id"], "ai", "En el bloque 3.")
+    # Lectura tras escritura desde memoria; el almacén aún no tiene la conversación
+    assert [m["type"] for m in manager.get_conversation(conv["id"])["messages"]] == ["user", "ai"]
+    assert store.get(conv["id"]) is None and manager.store.stats()["cache"]["dirty"] == 1
+
+    assert manager.store.flush() == 1
+    assert store.get(conv["id"]) == manager.get_conversation(conv["id"])
+    # Cambios posteriores: solo los mensajes nuevos y los campos modificados
+    manager.clear_conversation(conv["id"])
+    manager.add_message(conv["id"], "user", "Otra pregunta")
+    manager.update_title(conv["id"], "Biblioteca")
+    # Las conversaciones sucias no se expulsan aunque se supere el tamaño de la caché
+    others = [manager.create_conversation()["id"] for _ in range(3)]
+    assert store.get(conv["id"])["title"] == "¿Dónde queda la biblioteca?"
+    # El listado escribe antes lo pendiente
+    listed = {c["id"]: c for c in manager.list_conversations(limit=10)[0]}
+    assert set(listed) == {conv["id"], *others} and listed[conv["id"]]["message_count"] == 1
+    stored = store.get(conv["id"])
+    assert stored["title"] == "Biblioteca" and [m["content"] for m in stored["messages"]] == ["Otra pregunta"]
+    assert manager.store.stats()["cache"]["cached"] <= 2
+
+    # Una conversación creada y borrada antes del flush nunca llega al almacén
+    temporary = manager.create_conversation()["id"]
+    assert manager.delete_conversation(temporary) and manager.get_conversation(temporary) is None
+    manager.store.close()
+    assert store.get(temporary) is None
+    print(f"   ✓ Caché write-behind: {manager.store.stats()['cache']}")
+
+def test_write_behind_flush_in_flight():
+    """Mientras se escribe, la conversación no se expulsa; si la escritura falla, sus cambios se conservan"""
+    import tempfile
+    import threading
+    from services.conversation_store import FileConversationStore
+
+    class _SlowStore(FileConversationStore):
+        def __init__(self, path):
+            super().__init__(path)
+            self.started = threading.Event()
+            self.release = threading.Event()
+            self.fail = True
+
+        def append_messages(self, conversation_id, messages, updates):
+            self.started.set()
+            self.release.wait(5)
+            if self.fail:
+                raise OSError("disco lleno")
+            return super().append_messages(conversation_id, messages, updates)
+
+    store = _SlowStore(tempfile.mkdtemp())
+    manager = ConversationManager(store=store, cache_size=1, flush_interval=3600)
+    conv = manager.create_conversation()["id"]
+    others = [manager.create_conversation()["id"] for _ in range(2)]
+    manager.flush()
+    manager.add_message(conv, "user", "¿Hay clases el sábado?")
+
+    flusher = threading.Thread(target=manager.flush)
+    flusher.start()
+    assert store.started.wait(5)
+    # Cargar otras conversaciones fuerza expulsiones mientras la escritura sigue en curso
+    for other in others:
+        manager.get_conversation(other)
+    assert [m["content"] for m in manager.get_conversation(conv)["messages"]] == ["¿Hay clases el sábado?"]
+    store.release.set()
+    flusher.join()
+
+    # La escritura falló: los mensajes siguen pendientes y llegan en el siguiente flush
+    assert manager.store.stats()["cache"]["dirty"] == 1
+    store.fail = False
+    manager.flush()
+    assert [m["content"] for m in store.get(conv)["messages"]] == ["¿Hay clases el sábado?"]
+    print("   ✓ Escritura en curso protegida de la expulsión")
+
+def test_chat_turn_single_write():
+    """Pregunta y respuesta se registran juntas y el historial del prompt sale de la conversación"""
+    import os
+    import tempfile
+    from services.sqlite_storage import SQLiteConversationStore, SQLiteDatabase
+
+    db = SQLiteDatabase(os.path.join(tempfile.mkdtemp(), "aluna.db"))
+    transactions = []
+    original = db.transaction
+    db.transaction = lambda: transactions.append(1) or original()
+    manager = ConversationManager(store=SQLiteConversationStore(db), flush_interval=3600)
+    conv = manager.create_conversation()
+    assert manager.add_turn(conv["id"], "¿Cuál es el horario de la biblioteca?", "De 7 a 21.")
+    assert manager.add_turn(conv["id"], "¿Y los sábados?", "De 8 a 12.")
+    assert not manager.add_turn("no-existe", "hola", "hola")
+    manager.flush()
+    # Creación + los dos turnos pendientes en una sola transacción
+    assert len(transactions) == 1
+
+    stored = manager.store.store.get(conv["id"])
+    assert stored["title"] == "¿Cuál es el horario de la biblioteca?"
+    assert [m["type"] for m in stored["messages"]] == ["user", "ai", "user", "ai"]
+    turns = manager.recent_turns(conv["id"], limit=3)
+    assert [(t.role, t.content) for t in turns] == [
+        ("assistant", "De 7 a 21."), ("user", "¿Y los sábados?"), ("assistant", "De 8 a 12.")
+    ]
+    assert manager.recent_turns("no-existe") == []
+    print("   ✓ Turnos de chat en una sola escritura")
+
+def test_conversation_search():
+    """Índice invertido incremental: agregar, limpiar y eliminar; ranking y paginación"""
+    import os
+    import tempfile
+    from services.conversation_store import FileConversationStore
+
+    path = tempfile.mkdtemp()
+    manager = ConversationManager(store=FileConversationStore(path))
+    matricula = manager.create_conversation()["id"]
+    manager.add_turn(matricula, "¿Cómo hago la matrícula?", "La MATRÍCULA se hace en línea.")
+    mencion = manager.create_conversation()["id"]
+    manager.add_turn(mencion, "¿Dónde queda la biblioteca?",
+                     "En el bloque 3. " + "Abre de lunes a sábado. " * 10 + "Allí también orientan sobre matrícula.")
+    otra = manager.create_conversation()["id"]
+    manager.add_message(otra, "user", "Horario del comedor")
+
+    results, total = manager.search("¿dónde estaba lo de la matrícula?")
+    assert total == 2 and [r["id"] for r in results] == [matricula, mencion]
+    assert "matrícula" in results[0]["message"]["snippet"].lower()
+    # Fragmento recortado alrededor del término en mensajes largos
+    assert results[1]["message"]["snippet"].startswith("…") and "matrícula" in results[1]["message"]["snippet"]
+    page, _ = manager.search("matricula", limit=1, offset=1)
+    assert [r["id"] for r in page] == [mencion]
+
+    manager.clear_conversation(matricula)
+    manager.delete_conversation(mencion)
+    assert manager.search("matrícula") == ([], 0)
+    # Al reiniciar se reconstruye desde el almacén
+    manager.flush()
+    restarted = ConversationManager(store=FileConversationStore(path))
+    assert [r["id"] for r in restarted.search("comedor")[0]] == [otra]
+    print(f"   ✓ Búsqueda de conversaciones: {restarted.search_index.stats()}")
+
 if __name__ == "__main__":
     test_conversation_manager()
+    test_file_conversation_store()
+    test_conversation_listing_pages()
+    test_write_behind_cache()
+    test_write_behind_flush_in_flight()
+    test_chat_turn_single_write()
+    test_conversation_search()
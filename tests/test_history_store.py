@@ -0,0 +1,188 @@
+"""
+Prueba del historial persistente segmentado con índice de posiciones por sesión
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from services.history_store import HistoryStore, ZSTD_AVAILABLE
+
+
+def _store(path, **kwargs):
+    # Segmentos pequeños y compactador solo a demanda
+    kwargs.setdefault("segment_max_bytes", 400)
+    kwargs.setdefault("compact_interval", 0)
+    return HistoryStore(path, **kwargs)
+
+
+def test_history_offset_index():
+    """Las sesiones se cargan desde sus posiciones sin recorrer todos los segmentos"""
+    print("Probando HistoryStore...")
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    # Un archivo único de versiones anteriores se adopta como primer segmento
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"session_id": "eva", "role": "user", "content": "antiguo", "timestamp": 1.0}) + "\n")
+
+    store = _store(path)
+    for i in range(5):
+        store.append("ana", "user", f"pregunta {i}")
+        store.append("luis", "user", f"hola {i}")
+    store.append("ana", "assistant", "respuesta con tilde: matrícula")
+    store.save_index()
+    assert store.stats()["segments"] > 1 and not os.path.exists(path)
+
+    reopened = _store(path)
+    scanned = []
+    original_scan = reopened._scan_segment_locked
+    reopened._scan_segment_locked = lambda segment, start=0, end=None: scanned.append(segment) or original_scan(segment, start, end)
+
+    ana = reopened.get_recent("ana", limit=0)
+    assert [t.content for t in ana] == [f"pregunta {i}" for i in range(5)] + ["respuesta con tilde: matrícula"]
+    assert [t.content for t in reopened.get_recent("luis", limit=2)] == ["hola 3", "hola 4"]
+    assert [t.content for t in reopened.get_recent("eva")] == ["antiguo"]
+    # Solo se revisó la cola del segmento activo
+    assert set(scanned) == {reopened.stats()["active_segment"]}
+    print(f"   ✓ Sesiones cargadas por índice: {reopened.stats()}")
+
+    # El archivo vacío versionado en el repositorio no se elimina ni se adopta
+    placeholder = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    open(placeholder, "w").close()
+    store = _store(placeholder)
+    store.append("ana", "user", "hola")
+    assert os.path.getsize(placeholder) == 0
+    assert [t.content for t in _store(placeholder).get_recent("ana")] == ["hola"]
+
+
+def test_history_tombstones_and_compaction():
+    """Borrar es una lápida; el compactador reescribe solo los segmentos afectados"""
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    store = _store(path)
+    for i in range(6):
+        store.append("ana", "user", f"pregunta {i}")
+    for i in range(12):
+        store.append("luis", "user", f"hola {i}")
+    luis_only = {
+        segment: os.stat(p).st_ino for segment, p in store._segments.items()
+        if segment != store._active and all(
+            json.loads(line)["session_id"] == "luis" for line in open(p, "rb")
+        )
+    }
+    assert luis_only
+
+    assert store.clear("ana") == 6
+    assert store.stats()["dirty_segments"] >= 1 and store.stats()["tombstones"] == 1
+    assert store.get_recent("ana") == []
+    store.append("ana", "user", "empiezo de nuevo")
+    assert [t.content for t in store.get_recent("ana")] == ["empiezo de nuevo"]
+
+    # La lápida sobrevive a un reinicio antes de compactar
+    restarted = _store(path)
+    assert [t.content for t in restarted.get_recent("ana", limit=0)] == ["empiezo de nuevo"]
+    atexit.unregister(restarted.close)  # instancia descartada: no debe guardar al salir
+
+    summary = store.compact()
+    assert summary["rewritten"] >= 1 and store._dirty <= {store._active}
+    # Los segmentos sin líneas de la sesión borrada no se tocaron
+    assert all(os.stat(store._segments[s]).st_ino == ino for s, ino in luis_only.items())
+    on_disk = [json.loads(line) for p in store._segments.values() for line in open(p, "rb")]
+    assert not any(r["session_id"] == "ana" and r.get("content", "").startswith("pregunta") for r in on_disk)
+    assert [t.content for t in store.get_recent("luis", limit=0)] == [f"hola {i}" for i in range(12)]
+
+    reopened = _store(path)
+    assert [t.content for t in reopened.get_recent("ana", limit=0)] == ["empiezo de nuevo"]
+    assert len(reopened.get_recent("luis", limit=0)) == 12
+    print(f"   ✓ Compactación: {summary} -> {reopened.stats()}")
+
+
+def test_history_recent_turns_cache():
+    """La caché guarda solo los últimos turnos por sesión y expulsa las menos usadas"""
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    store = _store(path, cache_max_sessions=2, cache_turns=3, lock_stripes=1)
+    cache = store._shards[0].entries
+    for i in range(5):
+        store.append("ana", "user", f"pregunta {i}")
+    assert [t.content for t in store.get_recent("ana", limit=3)] == ["pregunta 2", "pregunta 3", "pregunta 4"]
+    store.append("ana", "assistant", "respuesta")
+    assert [t.content for t in store.get_recent("ana", limit=2)] == ["pregunta 4", "respuesta"]
+    # Más turnos de los que guarda la caché se leen del disco
+    assert len(store.get_recent("ana", limit=0)) == 6
+    assert len(cache["ana"].turns) == 3
+
+    store.get_recent("luis", limit=3)
+    store.get_recent("eva", limit=3)
+    stats = store.stats()
+    assert list(cache) == ["luis", "eva"] and stats["cache_evictions"] == 1
+    assert stats["cache_hits"] == 1 and stats["cache_misses"] == 3
+
+    # Límite por bytes: solo cabe la sesión recién cargada
+    store.cache_max_bytes = cache["eva"].size + 1
+    store.append("luis", "user", "x" * 500)
+    assert "luis" not in cache or "eva" not in cache
+    assert [t.content for t in store.get_recent("ana", limit=1)] == ["respuesta"]
+    assert list(cache) == ["ana"] and store.stats()["cache_bytes"] == cache["ana"].size
+    print(f"   ✓ Caché de turnos recientes: {store.stats()}")
+
+
+def test_history_group_commit():
+    """Escrituras concurrentes se agrupan sin perder ni desordenar turnos por sesión"""
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    store = _store(path, segment_max_bytes=1 << 20, fsync="always")
+    batches = []
+    commit = store._writer._commit
+    store._writer._commit = lambda items: batches.append(len(items)) or commit(items)
+
+    sessions = [f"u{n}" for n in range(16)]
+    for sid in sessions:
+        store.get_recent(sid, limit=4)  # la mitad de las escrituras actualiza la caché
+    start = threading.Barrier(len(sessions) * 2)
+
+    def worker(sid):
+        start.wait()
+        for i in range(25):
+            store.append(sid, "user", f"{sid} turno {i}")
+
+    threads = [threading.Thread(target=worker, args=(f"{sid}{suffix}",)) for sid in sessions for suffix in ("", "-b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(batches) == 800
+    for sid in sessions:
+        expected = [f"{sid} turno {i}" for i in range(25)]
+        assert [t.content for t in store.get_recent(sid, limit=4)] == expected[-4:]
+        assert [t.content for t in store.get_recent(sid, limit=0)] == expected
+    store.close()
+    assert [t.content for t in _store(path).get_recent("u3-b", limit=0)][-1] == "u3-b turno 24"
+    print(f"   ✓ Confirmación agrupada: {len(batches)} escrituras para {sum(batches)} turnos")
+
+
+def test_history_retention_and_compression():
+    """Los segmentos fríos se comprimen y los vencidos se eliminan"""
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.jsonl")
+    store = _store(path, compress_after=0, retention_days=1)
+    for i in range(12):
+        store.append(f"s{i % 3}", "user", f"mensaje {i}")
+    closed = sorted(s for s in store._segments if s != store._active)
+    summary = store.compact()
+    if ZSTD_AVAILABLE:
+        assert summary["compressed"] == len(closed)
+        assert [t.content for t in store.get_recent("s0", limit=1)] == ["mensaje 9"]
+
+    # Un segmento con más de un día sin cambios se elimina
+    old = time.time() - 2 * 86400
+    os.utime(store._segments[closed[0]], (old, old))
+    assert store.compact()["expired"] == 1
+    assert closed[0] not in store._segments
+    assert store.stats()["segments"] == len(closed)
+    print("\n✅ Historial verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_history_offset_index()
+    test_history_tombstones_and_compaction()
+    test_history_recent_turns_cache()
+    test_history_group_commit()
+    test_history_retention_and_compression()
@@ -0,0 +1,61 @@
+"""
+Prueba del motor compartido de palabras clave (Aho-Corasick)
+"""
+from services.keyword_matcher import KeywordMatcher
+
+
+def test_keyword_matcher():
+    """Una pasada encuentra reglas solapadas de varios conjuntos, sin distinguir tildes"""
+    print("Probando KeywordMatcher...")
+
+    matcher = KeywordMatcher(cache_size=8)
+    matcher.register("universidad", ["matrícula", "matricula", "beca"])
+    matcher.register("dependencia", {"pago": "Tesorería", "matrícula de posgrado": "Posgrados", "matrícula": "Registro"})
+    matcher.register("conector", ["es", "de"], whole_word=True)
+
+    matches = matcher.scan("¿Cuál es el costo de la MATRICULA de posgrado y el pago?")
+    print(f"   ✓ Texto normalizado: {matches.text}")
+    assert matches.keywords("universidad") == ["matrícula"]
+    # `first` respeta el orden de declaración, no el de aparición
+    assert matches.first("dependencia").payload == "Tesorería"
+    assert matches.by_payload("dependencia") == {
+        "Tesorería": ["pago"], "Posgrados": ["matrícula de posgrado"], "Registro": ["matrícula"],
+    }
+    # Palabra completa: "es" no coincide dentro de "posgrado" ni "costo"
+    assert [hit.keyword for hit in matches.get("conector")] == ["es", "de", "de"]
+    assert not matcher.scan("estudiantes destacados").has("conector")
+
+    # La misma pregunta reutiliza la pasada memorizada
+    assert matcher.scan("¿Cuál es el costo de la MATRICULA de posgrado y el pago?") is matches
+    assert matcher.stats()["cache_hits"] == 1
+
+    assert matcher.search("universidad", "Solicité una BECA completa") == "beca"
+    assert matcher.search("universidad", "horario de biblioteca") is None
+
+    # Reemplazar un conjunto reconstruye el autómata
+    matcher.register("universidad", ["biblioteca"])
+    assert matcher.scan("horario de biblioteca").has("universidad")
+    matcher.unregister("universidad")
+    assert not matcher.scan("horario de biblioteca").has("universidad")
+    print("   ✓ Conjuntos, orden y caché verificados")
+
+
+def test_keyword_search():
+    """`search` encuentra las marcas con o sin tildes en listas cortas y largas"""
+    matcher = KeywordMatcher()
+    markers = ["no tengo información suficiente", "no está en mi contexto", "consulta el reglamento"]
+    matcher.register("negativa", markers)
+    matcher.register("larga", markers + [f"marca de relleno {i}" for i in range(20)])
+
+    for rule_set in ("negativa", "larga"):
+        assert matcher.search(rule_set, "Lo siento, NO TENGO INFORMACIÓN SUFICIENTE.") == "no tengo informacion suficiente"
+        assert matcher.search(rule_set, "Eso no esta en mi contexto") == "no esta en mi contexto"
+        assert matcher.search(rule_set, "La matrícula se hace en línea.") is None
+        assert matcher.search(rule_set, "") is None
+    assert matcher.search("inexistente", "no está en mi contexto") is None
+    print("\n✅ Motor de palabras clave verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_keyword_matcher()
+    test_keyword_search()
@@ -0,0 +1,54 @@
+"""
+Prueba de las políticas de desalojo de la memoria semántica
+"""
+import numpy as np
+
+from services.memory_eviction import (
+    CostAwarePolicy,
+    LFUPolicy,
+    LRUPolicy,
+    TTLPolicy,
+    build_eviction_policy,
+)
+
+NOW = 1000.0
+
+# Cuatro entradas pensadas para que cada política elija una víctima distinta
+COLUMNS = {
+    "created_at": np.array([100.0, 50.0, 300.0, 200.0]),
+    "last_used_at": np.array([400.0, 500.0, 350.0, 450.0]),
+    "usage_count": np.array([5.0, 3.0, 9.0, 0.0]),
+    "cost": np.array([10000.0, 100.0, 100.0, 100.0]),
+    "pinned": np.zeros(4),
+}
+
+
+def test_eviction_policies():
+    """Cada política desaloja primero la entrada que le corresponde"""
+    print("Probando políticas de desalojo...")
+    expected_victims = {"ttl": 1, "lru": 2, "lfu": 3, "cost": 0}
+    for name, victim in expected_victims.items():
+        policy = build_eviction_policy(name)
+        priorities = policy.priorities(COLUMNS, NOW)
+        assert priorities.shape == (4,)
+        assert int(np.argmin(priorities)) == victim, (name, priorities)
+        print(f"   ✓ {name}: desaloja la entrada {victim}")
+
+    assert isinstance(build_eviction_policy(" LFU "), LFUPolicy)
+    assert isinstance(build_eviction_policy("ttl"), TTLPolicy)
+    assert isinstance(build_eviction_policy("cost"), CostAwarePolicy)
+    # Un nombre desconocido usa LRU
+    assert isinstance(build_eviction_policy("desconocida"), LRUPolicy)
+
+
+def test_ttl_expiry_mask():
+    """La expiración por edad usa created_at y se desactiva con ttl <= 0"""
+    assert not build_eviction_policy("lru").expired(COLUMNS, NOW).any()
+    expired = build_eviction_policy("lru", ttl_seconds=750).expired(COLUMNS, NOW)
+    assert expired.tolist() == [True, True, False, True]
+    print("\n✅ Políticas de desalojo verificadas correctamente!")
+
+
+if __name__ == "__main__":
+    test_eviction_policies()
+    test_ttl_expiry_mask()
@@ -0,0 +1,168 @@
+"""
+Pruebas de persistencia de la memoria semántica (registro de solo-anexado + snapshot)
+"""
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+from models import MemoryEntry
+from services.memory_store import MemoryLogStore
+
+
+def _entry(i, **fields):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[i % 4] = 1.0
+    return MemoryEntry(question=f"Pregunta {i}", answer=f"Respuesta {i}", embedding=vector, **fields)
+
+
+def _store(directory, **kwargs):
+    return MemoryLogStore(
+        snapshot_path=os.path.join(directory, "memory.npz"),
+        log_path=os.path.join(directory, "memory.log"),
+        **kwargs,
+    )
+
+
+def test_snapshot_and_log_replay():
+    """El snapshot más la cola del registro reconstruyen el estado, incluido el uso"""
+    print("Probando persistencia de la memoria semántica...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        entries = [_entry(i) for i in range(3)]
+        for entry in entries:
+            store.log_add(entry)
+        store.compact(entries, wait=True)
+        assert os.path.exists(store.snapshot_path)
+        assert not os.path.exists(store.log_path) and not os.path.exists(store.compacting_path)
+
+        # Cambios posteriores al snapshot: solo en el registro
+        entries[0].usage_count, entries[0].last_used_at, entries[0].last_score = 4, 123.0, 0.9
+        store.log_usage(entries[0])
+        store.log_delete(entries[1].id)
+        extra = _entry(7, chunk_ids=["c7"], index_version="v1")
+        store.log_index_version("v2")
+        store.log_add(extra)
+        store.close()
+
+        loaded = {e.id: e for e in _store(directory).load()}
+        assert set(loaded) == {entries[0].id, entries[2].id, extra.id}
+        assert loaded[entries[0].id].index_version == "v2" and loaded[entries[2].id].index_version == "v2"
+        assert loaded[entries[0].id].usage_count == 4 and loaded[entries[0].id].last_score == 0.9
+        assert loaded[extra.id].chunk_ids == ["c7"] and loaded[extra.id].index_version == "v1"
+        assert np.array_equal(loaded[extra.id].embedding, extra.embedding)
+    print("   ✓ Snapshot + registro reaplicado")
+
+
+def test_truncated_last_line_is_ignored():
+    """Una línea a medio escribir al final del registro no impide cargar el resto"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        entries = [_entry(i) for i in range(2)]
+        for entry in entries:
+            store.log_add(entry)
+        store.close()
+        with open(store.log_path, "a", encoding="utf-8") as f:
+            f.write('{"op": "add", "id": "incompleta", "question": "Preg')
+
+        loaded = _store(directory).load()
+        assert [e.id for e in loaded] == [e.id for e in entries]
+    print("   ✓ Línea truncada ignorada")
+
+
+def test_interrupted_compaction_is_completed():
+    """Si el proceso cae tras rotar el registro, la carga siguiente termina la compactación"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        first = [_entry(i) for i in range(2)]
+        for entry in first:
+            store.log_add(entry)
+        store.compact(first, wait=True)
+
+        # Registro rotado sin snapshot nuevo (caída durante la compactación) + registro actual
+        pending = _entry(5)
+        store.log_add(pending)
+        store.close()
+        os.replace(store.log_path, store.compacting_path)
+        later = _entry(6)
+        store.log_add(later)
+        store.log_delete(first[0].id)
+        store.close()
+
+        loaded = _store(directory).load()
+        expected = [first[1].id, pending.id, later.id]
+        assert [e.id for e in loaded] == expected
+        assert not os.path.exists(store.compacting_path) and not os.path.exists(store.log_path)
+        # El snapshot escrito al cargar ya contiene todo
+        assert [e.id for e in _store(directory).load()] == expected
+    print("   ✓ Compactación interrumpida completada")
+
+
+class _UsedAfterCapture(list):
+    """Entradas que reciben un hit (en otro hilo) justo después de que compact las captura"""
+
+    def __init__(self, store, entries):
+        super().__init__(entries)
+        self.store = store
+        self.worker = None
+
+    def __iter__(self):
+        yield from super().__iter__()
+        if self.worker is None:
+            entry = self[0]
+            entry.usage_count += 1
+            self.worker = threading.Thread(target=self.store.log_usage, args=(entry,))
+            self.worker.start()
+            # Sin el lock de compact, el uso se anexaría al registro que está por rotarse
+            self.worker.join(0.5)
+
+
+def test_usage_during_compaction_is_kept():
+    """Un uso anexado mientras se compacta queda en el snapshot o en el registro nuevo"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = _store(directory)
+        entries = [_entry(i) for i in range(2)]
+        for entry in entries:
+            store.log_add(entry)
+
+        captured = _UsedAfterCapture(store, entries)
+        store.compact(captured, wait=True)
+        captured.worker.join()
+        store.close()
+
+        loaded = {e.id: e for e in _store(directory).load()}
+        assert loaded[entries[0].id].usage_count == 1
+    print("   ✓ Uso concurrente con la compactación conservado")
+
+
+def test_legacy_pickle_migration():
+    """El pickle del formato anterior se migra a snapshot en la primera carga"""
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, "memory.pkl")
+        with open(legacy_path, "wb") as f:
+            pickle.dump([
+                {"question": "¿Horario?", "answer": "De 8 a 5", "embedding": [1.0, 0.0, 0.0],
+                 "created_at": 10.0, "usage_count": 3},
+                {"question": "¿Sede?", "answer": "Santa Marta", "embedding": [0.0, 1.0, 0.0]},
+            ], f)
+
+        loaded = _store(directory, legacy_path=legacy_path).load()
+        assert [e.question for e in loaded] == ["¿Horario?", "¿Sede?"]
+        assert loaded[0].usage_count == 3 and loaded[0].created_at == 10.0
+        assert loaded[0].embedding.dtype == np.float32
+        assert os.path.exists(os.path.join(directory, "memory.npz"))
+
+        # Las cargas siguientes usan el snapshot con los mismos ids
+        again = _store(directory, legacy_path=legacy_path).load()
+        assert [e.id for e in again] == [e.id for e in loaded]
+    print("\n✅ Persistencia de la memoria semántica verificada correctamente!")
+
+
+if __name__ == "__main__":
+    test_snapshot_and_log_replay()
+    test_truncated_last_line_is_ignored()
+    test_interrupted_compaction_is_completed()
+    test_usage_during_compaction_is_kept()
+    test_legacy_pickle_migration()
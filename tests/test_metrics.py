@@ -0,0 +1,43 @@
+"""
+Prueba del registro de métricas y su exposición en formato Prometheus
+"""
+from services.metrics import MetricsRegistry, _merge, gauge_family, render_text
+
+
+def test_metrics_exposition():
+    """Contadores, medidores e histogramas se serializan y combinan entre procesos"""
+    print("Probando métricas...")
+
+    registry = MetricsRegistry()
+    requests = registry.counter("prueba_requests", "Solicitudes", ("source",))
+    latency = registry.histogram("prueba_duration_seconds", "Duración", buckets=(0.1, 1.0))
+    requests.inc(source="llm")
+    requests.inc(2, source="llm")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3.0)
+    registry.register_collector("cache", lambda: [gauge_family("prueba_cache_size", "Tamaño", {(): 4})])
+
+    text = render_text(registry.collect())
+    print(text)
+    assert "# TYPE prueba_requests counter" in text
+    assert 'prueba_requests_total{source="llm"} 3' in text
+    assert 'prueba_duration_seconds_bucket{le="0.1"} 1' in text
+    assert 'prueba_duration_seconds_bucket{le="1"} 2' in text
+    assert 'prueba_duration_seconds_bucket{le="+Inf"} 3' in text
+    assert "prueba_duration_seconds_count 3" in text
+    assert "prueba_cache_size 4" in text
+
+    # Dos workers: los contadores se suman y los medidores conservan el pid
+    families = registry.collect()
+    merged = render_text(_merge({"101": families, "202": families}))
+    assert 'prueba_requests_total{source="llm"} 6' in merged
+    assert 'prueba_duration_seconds_bucket{le="+Inf"} 6' in merged
+    assert 'prueba_cache_size{pid="101"} 4' in merged
+    assert 'prueba_cache_size{pid="202"} 4' in merged
+
+    print("\n✅ Métricas verificadas correctamente!")
+
+
+if __name__ == "__main__":
+    test_metrics_exposition()
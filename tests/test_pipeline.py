@@ -0,0 +1,139 @@
+"""
+Prueba del pipeline concurrente de etapas del chat
+"""
+import threading
+import time
+
+from services.pipeline import ChatPipeline, StageCancelled
+
+
+def _raises(fn, exc_type):
+    try:
+        fn()
+    except exc_type:
+        return True
+    return False
+
+
+def test_stages_run_concurrently():
+    """Las etapas independientes se solapan y las dependientes reciben sus resultados"""
+    print("Probando pipeline de etapas...")
+    pipeline = ChatPipeline(max_workers=4)
+    run = pipeline.start()
+
+    def slow(value):
+        time.sleep(0.2)
+        return value
+
+    started = time.perf_counter()
+    run.submit("safety", lambda: slow("seguro"))
+    run.submit("history", lambda: slow(["turno"]))
+    run.submit("prompt", lambda safety, history: f"{safety}:{len(history)}", after=("safety", "history"))
+    assert run.result("prompt", timeout=2) == "seguro:1"
+    elapsed = time.perf_counter() - started
+    assert elapsed < 0.35, elapsed
+
+    timings = run.finish()
+    assert set(timings) == {"safety", "history", "prompt"}
+    assert all(t["duration_ms"] >= 0 and not t["cancelled"] for t in timings.values())
+    assert pipeline.stats()["requests"] == 1 and pipeline.stats()["stages"]["safety"]["count"] == 1
+    pipeline.shutdown()
+    print(f"   ✓ Etapas en paralelo ({elapsed * 1000:.0f} ms)")
+
+
+def test_speculative_retrieval_cancelled_on_memory_hit():
+    """Un acierto de memoria cancela la recuperación especulativa y se descarta su resultado"""
+    pipeline = ChatPipeline(max_workers=4)
+    run = pipeline.start()
+    release = threading.Event()
+    retrieval_started = threading.Event()
+
+    def retrieval():
+        retrieval_started.set()
+        release.wait(2)
+        return "contexto"
+
+    run.submit("memory", lambda: ("entrada", 0.97))
+    run.submit("retrieval", retrieval, speculative=True)
+    assert run.result("memory", timeout=2) == ("entrada", 0.97)
+    assert retrieval_started.wait(2)
+    run.cancel("retrieval")
+    assert _raises(lambda: run.result("retrieval"), StageCancelled)
+    release.set()
+
+    timings = run.finish()
+    assert timings["retrieval"]["cancelled"] and not timings["memory"]["cancelled"]
+    assert pipeline.stats()["stages"]["retrieval"]["cancelled"] == 1
+    pipeline.shutdown()
+
+    # Sin pool la etapa especulativa se difiere: cancelada, nunca se ejecuta
+    calls = []
+    sequential = ChatPipeline(enabled=False)
+    run = sequential.start()
+    run.submit("memory", lambda: ("entrada", 0.97))
+    run.submit("retrieval", lambda: calls.append("retrieval"), speculative=True)
+    assert run.result("memory") == ("entrada", 0.97)
+    run.cancel("retrieval")
+    assert _raises(lambda: run.result("retrieval"), StageCancelled)
+    assert calls == []
+
+    # Sin acierto, pedir el resultado ejecuta la etapa diferida
+    run = sequential.start()
+    run.submit("retrieval", lambda: "contexto", speculative=True)
+    assert run.result("retrieval") == "contexto"
+    print("   ✓ Recuperación especulativa cancelada")
+
+
+def test_queue_depth():
+    """stats() cuenta las etapas enviadas que esperan un hilo libre"""
+    pipeline = ChatPipeline(max_workers=1)
+    run = pipeline.start()
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(2)
+        return "listo"
+
+    run.submit("memory", blocking)
+    assert started.wait(2)
+    run.submit("retrieval", lambda: "contexto")
+    run.submit("history", lambda: [])
+    assert pipeline.stats()["queued"] == 2
+    release.set()
+    assert run.result("retrieval", timeout=2) == "contexto" and run.result("history", timeout=2) == []
+    assert pipeline.stats()["queued"] == 0
+    assert ChatPipeline(enabled=False).stats()["queued"] == 0
+    pipeline.shutdown()
+    print("   ✓ Profundidad de la cola")
+
+
+def test_stage_errors():
+    """El error de una etapa se propaga al pedir su resultado y cancela a sus dependientes"""
+    pipeline = ChatPipeline(max_workers=2)
+    run = pipeline.start()
+    ran = []
+
+    def failing():
+        raise ValueError("índice no disponible")
+
+    run.submit("retrieval", failing)
+    run.submit("prompt", lambda context: ran.append(context), after=("retrieval",))
+    assert _raises(lambda: run.result("retrieval", timeout=2), ValueError)
+    assert _raises(lambda: run.result("prompt", timeout=2), StageCancelled)
+    assert ran == []
+    assert run.timings()["prompt"]["cancelled"]
+
+    # Una etapa en línea propaga su error y registra su duración
+    assert _raises(lambda: run.run_inline("generation", failing), ValueError)
+    assert "duration_ms" in run.timings()["generation"]
+    pipeline.shutdown()
+    print("\n✅ Pipeline verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_stages_run_concurrently()
+    test_speculative_retrieval_cancelled_on_memory_hit()
+    test_queue_depth()
+    test_stage_errors()
@@ -0,0 +1,73 @@
+"""
+Prueba del analizador de bancos de preguntas oficiales
+"""
+import os
+import tempfile
+
+from services.qa_importer import format_answer, import_question_bank, parse_question_bank_text
+
+
+def test_parse_question_bank_text():
+    """Extrae pregunta, respuesta y referencia normativa del formato del banco 027"""
+    print("Probando analizador de bancos de preguntas...")
+
+    text = (
+        "BANCO DE PREGUNTAS 027 DE 2023\n"
+        "El Acuerdo Académico 027 de 2023 fija el régimen de permanencia.\n"
+        "PREGUNTA: ¿Cuántas veces puedo repetir una misma asignatura?\n"
+        "CONTEXT:\n"
+        "RESPUESTA_RAPIDA: Solo puedes inscribirla tres veces.\n"
+        "nombre: Acuerdo Académico 027 de 2023\n"
+        "referencia: límite de repitencia\n"
+        "articulo: Artículo 6\n"
+        "\n"
+        "PREGUNTA: ¿Qué asistencia mínima necesito?\n"
+        "CONTEXT: \"\"\n"
+        "RESPUESTA_RAPIDA: El 80 %\xa0de las clases.\n"
+        "PREGUNTA: Pregunta sin respuesta\n"
+    )
+    pairs = parse_question_bank_text(text, source="banco.docx")
+
+    for pair in pairs:
+        print(f"   ✓ {pair.question} -> {format_answer(pair)}")
+    assert len(pairs) == 2
+    assert pairs[0].question == "¿Cuántas veces puedo repetir una misma asignatura?"
+    assert pairs[0].reference == "Acuerdo Académico 027 de 2023, Artículo 6"
+    assert format_answer(pairs[0]).endswith("(Acuerdo Académico 027 de 2023, Artículo 6)")
+    assert pairs[1].answer == "El 80 % de las clases."
+    assert pairs[1].reference == "" and pairs[1].source == "banco.docx"
+    print("   ✓ Formato del banco 027")
+
+
+class _RecordingMemory:
+    """Memoria semántica mínima que registra lo importado"""
+
+    def __init__(self):
+        self.sources = []
+
+    def import_pinned(self, pairs, source):
+        self.sources.append(source)
+        return {"imported": len(pairs), "replaced": 0, "skipped": 0}
+
+
+def test_import_source_name():
+    """Un banco subido conserva su nombre original como origen, igual que desde KNOWLEDGE_DIR"""
+    memory = _RecordingMemory()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "BANCO DE PREGUNTAS 027 DE 2023.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("pregunta,respuesta\n¿Horario?,De 8 a 5\n")
+        from_dir = import_question_bank(memory, path)
+
+        temp_path = os.path.join(directory, "banco.csv")
+        os.replace(path, temp_path)
+        uploaded = import_question_bank(memory, temp_path, source="BANCO DE PREGUNTAS 027 DE 2023.csv")
+
+    assert memory.sources == ["BANCO DE PREGUNTAS 027 DE 2023.csv"] * 2
+    assert from_dir["file"] == uploaded["file"] and uploaded["imported"] == 1
+    print("\n✅ Banco de preguntas analizado correctamente!")
+
+
+if __name__ == "__main__":
+    test_parse_question_bank_text()
+    test_import_source_name()
@@ -0,0 +1,91 @@
+"""
+Prueba de coalescencia de preguntas idénticas en vuelo
+"""
+import threading
+import time
+
+from models import ChatTurn
+from services.request_coalescer import RequestCoalescer, coalescing_key
+
+
+def test_request_coalescer():
+    """Varias llamadas concurrentes con la misma clave ejecutan el cálculo una sola vez"""
+    print("Probando RequestCoalescer...")
+
+    coalescer = RequestCoalescer(timeout=5)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return "respuesta"
+
+    results = []
+
+    def worker():
+        results.append(coalescer.run("v1:horarios", compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    # Dar tiempo a que todas las llamadas se unan al cálculo en curso
+    while coalescer.stats()["in_flight"] == 0:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    stats = coalescer.stats()
+    print(f"   ✓ Estadísticas: {stats}")
+    assert len(calls) == 1
+    assert all(value == "respuesta" for value, _ in results)
+    assert sum(1 for _, shared in results if shared) == 7
+    assert stats["coalesced"] == 7 and stats["in_flight"] == 0
+
+    # Una clave nueva vuelve a calcular
+    value, shared = coalescer.run("v2:horarios", lambda: "otra")
+    assert value == "otra" and not shared
+    print("\n✅ Coalescencia verificada correctamente!")
+
+
+
+def test_coalescing_key_history():
+    """La misma pregunta con historiales distintos no comparte respuesta"""
+    print("Probando la clave de coalescencia con historial...")
+
+    question = "¿Qué horario tiene la biblioteca?"
+    history_a = [
+        ChatTurn(role="user", content="Soy de Bogotá"),
+        ChatTurn(role="assistant", content="¡Hola!"),
+    ]
+    history_b = [
+        ChatTurn(role="user", content="Me llamo Ana y tengo una cita médica"),
+        ChatTurn(role="assistant", content="Cuéntame más"),
+    ]
+
+    key_a = coalescing_key("v1", question, history_a)
+    key_b = coalescing_key("v1", question, history_b)
+    assert key_a and key_b and key_a != key_b
+
+    # Sin historial (o con el mismo) las variantes de la pregunta sí se agrupan
+    assert coalescing_key("v1", question) == coalescing_key("v1", "que horario tiene la BIBLIOTECA")
+    assert coalescing_key("v1", question, history_a) == coalescing_key("v1", question, list(history_a))
+    assert coalescing_key("v1", question) != key_a
+    # Otra versión del conocimiento o una pregunta vacía no se agrupan
+    assert coalescing_key("v2", question) != coalescing_key("v1", question)
+    assert coalescing_key("v1", "¿?") == ""
+
+    # Con claves distintas, cada solicitud calcula su propia respuesta
+    coalescer = RequestCoalescer(timeout=5)
+    value_a, shared_a = coalescer.run(key_a, lambda: "respuesta para A")
+    value_b, shared_b = coalescer.run(key_b, lambda: "respuesta para B")
+    assert (value_a, value_b) == ("respuesta para A", "respuesta para B")
+    assert not shared_a and not shared_b
+    print("✅ Historiales distintos producen claves distintas")
+
+
+if __name__ == "__main__":
+    test_request_coalescer()
+    test_coalescing_key_history()
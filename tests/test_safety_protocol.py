@@ -0,0 +1,90 @@
+"""
+Corpus de exhaustividad del protocolo de seguridad
+"""
+from services.safety_protocol import SafetyProtocol, normalize_message
+
+# Mensajes reales o verosímiles con la severidad esperada (tildes, letras alargadas,
+# mayúsculas y puntuación incluidas a propósito)
+CRISIS_CORPUS = [
+    ("Me quiero morir", "high"),
+    ("ya no quiero vívir", "high"),
+    ("no quiero viviiiir", "high"),
+    ("Pienso en el SUICÍDIO todos los días", "high"),
+    ("he pensado en quitarme la vida...", "high"),
+    ("Voy a suicidarmeee", "high"),
+    ("tengo un plan para suicidarme, ya lo decidí", "high"),
+    ("siento que no vale la pena vivír", "high"),
+    ("I want to die", "high"),
+    ("i just want to kill myself!!", "high"),
+    ("Ya no quiero seguir así", "moderate"),
+    ("no encuentro salida a nada", "moderate"),
+    ("NO PUEDO MÁS", "moderate"),
+    ("nooo puedo maaas", "moderate"),
+    ("quisiera dormirme y no despertar", "moderate"),
+    ("estoy cansado de vivir", "moderate"),
+    ("preferiría desaparecer", "moderate"),
+    ("Estoy deprimido desde hace semanas", "low"),
+    ("estoy muy sola en esta ciudad", "low"),
+    ("no tengo ganas de nada, la verdad", "low"),
+    ("siento mucha tristeza", "low"),
+    ("Estoy perdiendo la esperanza con esta carrera", "low"),
+]
+
+SAFE_CORPUS = [
+    "¿Cómo es el proceso de matrícula?",
+    "No puedo masticar bien desde la cirugía",
+    "Quiero vivir en la residencia estudiantil",
+    "¿Cuál es el horario de la biblioteca?",
+    "Necesito apoyo psicológico para mis estudiantes",
+    "¿Qué dice el reglamento sobre la suspensión de semestre?",
+    # La puntuación separa cláusulas: estas frases no forman un patrón de crisis
+    "No, quiero vivir en Santa Marta toda la vida",
+    "No. Quiero vivir cerca de la universidad",
+    "¿Ya no? Quiero seguir así, me va bien",
+    "No; puedo más tarde, gracias",
+    "Eso no (quiero vivir solo) me preocupa",
+]
+
+
+def test_safety_recall_corpus():
+    """Todas las frases de crisis se detectan con su severidad, sin falsas alarmas"""
+    print("Probando corpus de seguridad...")
+    safety = SafetyProtocol()
+
+    missed = [(message, expected, safety.evaluate(message).severity)
+              for message, expected in CRISIS_CORPUS
+              if safety.evaluate(message).severity != expected]
+    assert not missed, missed
+    false_alarms = [message for message in SAFE_CORPUS if safety.evaluate(message).triggered]
+    assert not false_alarms, false_alarms
+    print(f"   ✓ {len(CRISIS_CORPUS)} mensajes de crisis y {len(SAFE_CORPUS)} sin riesgo")
+
+    # Una sola evaluación reporta las coincidencias de todos los niveles
+    result = safety.evaluate("Me quiero moriiir, no puedo más y estoy muy solo")
+    assert result.severity == "high" and result.alert_required
+    assert result.level_matches == {
+        "high": ["me quiero morir"], "moderate": ["no puedo mas"], "low": ["estoy muy solo"],
+    }
+    assert result.matched_terms == ["me quiero morir"]
+    assert normalize_message("¡¡Ya no quiero víviiir!!") == "ya no quiero vivir"
+    assert normalize_message("No, quiero vivir aquí") == "no | quiero vivir aqui"
+    print("   ✓ Coincidencias por nivel verificadas")
+
+
+def test_safety_custom_patterns():
+    """Los patrones no literales se combinan por nivel y se evalúan sobre el texto normalizado"""
+    safety = SafetyProtocol()
+    safety.update_levels({
+        "high": {"patterns": [r"\bme voy a (?:lastimar|hacer dano)\b"], "priority": 0},
+        "low": {"patterns": [r"\bme siento solo\b"], "priority": 1},
+    })
+    assert safety.evaluate("Creo que me voy a hacer daño").severity == "high"
+    assert safety.evaluate("me siento solooo").severity == "low"
+    # Los niveles reemplazados dejan de evaluarse
+    assert not safety.evaluate("no puedo más").triggered
+    print("\n✅ Protocolo de seguridad verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_safety_recall_corpus()
+    test_safety_custom_patterns()
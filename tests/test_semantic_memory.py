@@ -0,0 +1,300 @@
+"""
+Pruebas de la memoria semántica: matriz de embeddings, búsqueda top-k, eliminación y desalojo
+"""
+import hashlib
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import numpy as np
+
+from models import MemoryEntry
+from services import memory_manager
+from services.memory_eviction import build_eviction_policy
+from services.memory_manager import SemanticMemory, _EmbeddingMatrix, _top_k
+from services.memory_store import MemoryLogStore
+
+DIM = 16
+
+
+class _HashEncoder:
+    """Codificador determinista para no cargar el modelo de embeddings en las pruebas"""
+
+    def encode_query(self, query):
+        return self.encode_queries([query])
+
+    def encode_queries(self, queries, batch_size=64):
+        return np.stack([_vector(query) for query in queries])
+
+
+def _vector(text):
+    seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _memory(directory, **kwargs):
+    store = MemoryLogStore(
+        snapshot_path=f"{directory}/memory.npz", log_path=f"{directory}/memory.log", compact_every=10_000,
+    )
+    with mock.patch.object(memory_manager, "EmbeddingManager", _HashEncoder):
+        return SemanticMemory(store=store, **kwargs)
+
+
+def test_top_k_matches_brute_force():
+    """argpartition + orden parcial devuelve lo mismo que ordenar todos los cosenos"""
+    print("Probando top-k de la memoria semántica...")
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((200, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    for _ in range(5):
+        query = rng.standard_normal(DIM).astype(np.float32)
+        query /= np.linalg.norm(query)
+        cosines = np.array([float(np.dot(v, query)) for v in vectors])
+        expected = np.argsort(-cosines)
+        for k in (1, 5, 50, 200, 300):
+            result = _top_k(vectors, query, k)
+            assert [i for i, _ in result] == expected[:k].tolist()
+            assert np.allclose([s for _, s in result], cosines[expected[:k]], atol=1e-5)
+
+    assert _top_k(vectors[:0], vectors[0], 3) == []
+    assert _top_k(vectors, vectors[0], 0) == []
+    print("   ✓ Coincide con la búsqueda exhaustiva")
+
+
+def test_matrix_growth_and_removal():
+    """La matriz duplica su capacidad sin alterar las vistas publicadas y reconstruye al eliminar"""
+    rows = [_vector(f"pregunta {i}") for i in range(10)]
+    matrix = _EmbeddingMatrix(initial_capacity=4)
+    assert matrix.capacity == 0 and matrix.rows().shape == (0, 0)
+
+    published = None
+    for i, row in enumerate(rows):
+        index = matrix.append(row, {name: float(i) for name in _EmbeddingMatrix.COLUMNS})
+        assert index == i
+        if i == 3:
+            published = matrix.rows()
+    assert matrix.size == 10 and matrix.capacity == 16
+    assert np.array_equal(matrix.rows(), np.stack(rows))
+    assert np.array_equal(matrix.columns()["usage_count"], np.arange(10, dtype=np.float64))
+    # La vista tomada antes de crecer sigue mostrando las mismas filas
+    assert np.array_equal(published, np.stack(rows[:4]))
+
+    try:
+        matrix.append(np.zeros(DIM + 1, dtype=np.float32), {name: 0.0 for name in _EmbeddingMatrix.COLUMNS})
+        raise AssertionError("Se esperaba ValueError por dimensión incompatible")
+    except ValueError:
+        pass
+
+    keep = np.array([0, 2, 5, 9])
+    matrix.rebuild(keep, [{name: float(i) for name in _EmbeddingMatrix.COLUMNS} for i in keep])
+    assert matrix.size == 4 and matrix.capacity == 16
+    assert np.array_equal(matrix.rows(), np.stack([rows[i] for i in keep]))
+    assert matrix.columns()["created_at"].tolist() == [0.0, 2.0, 5.0, 9.0]
+    print("   ✓ Crecimiento por duplicación y reconstrucción verificados")
+
+
+def test_memory_removal_keeps_rows_aligned():
+    """Tras eliminar entradas, la fila i de la matriz sigue correspondiendo a entries[i]"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=0)
+        for i in range(6):
+            question = f"¿Pregunta número {i}?"
+            memory.add(question, f"Respuesta {i}", question_embedding=_vector(question), chunk_ids=[f"c{i}"])
+        assert len(memory.entries) == 6
+
+        # Desaparecen los fragmentos de las entradas 1 y 4
+        removed = memory.invalidate_stale({"c0", "c2", "c3", "c5"}, "v2")
+        assert removed == 2
+        entries = memory.entries
+        assert [e.answer for e in entries] == ["Respuesta 0", "Respuesta 2", "Respuesta 3", "Respuesta 5"]
+        for i, entry in enumerate(entries):
+            (index, score), = memory.search(entry.embedding, top_k=1)
+            assert index == i and abs(score - 1.0) < 1e-5
+        assert memory.stats()["entries"] == 4
+    print("   ✓ Filas alineadas tras eliminar entradas")
+
+
+def _entry(question, **fields):
+    now = time.time()
+    values = {"created_at": now, "last_used_at": now, **fields}
+    return MemoryEntry(question=question, answer=f"Respuesta a {question}", embedding=_vector(question), **values)
+
+
+def test_max_entries_eviction():
+    """Al superar max_entries se desalojan las menos prioritarias; las fijadas no cuentan"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=5, eviction_policy=build_eviction_policy("lru"))
+        now = time.time()
+        memory.add_entries([_entry(f"pregunta {i}", last_used_at=now - 100 + i) for i in range(8)])
+        memory.add_entries([_entry("pregunta oficial", pinned=True, last_used_at=now - 1000)])
+
+        questions = sorted(e.question for e in memory.entries)
+        assert questions == ["pregunta 3", "pregunta 4", "pregunta 5", "pregunta 6", "pregunta 7", "pregunta oficial"]
+        stats = memory.stats()
+        assert stats["evictions"]["capacity"] == 3 and stats["pinned"] == 1
+
+        # El desalojo también queda en el registro persistido
+        reloaded = _memory(directory, max_entries=5)
+        assert sorted(e.question for e in reloaded.entries) == questions
+    print("   ✓ Desalojo por capacidad")
+
+
+def test_ttl_expiry():
+    """Las entradas vencidas se retiran al insertar y al acertarlas; las fijadas no vencen"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=0, eviction_policy=build_eviction_policy("lru", ttl_seconds=60))
+        old = time.time() - 120
+        memory.add_entries([
+            _entry("pregunta vieja", created_at=old),
+            _entry("pregunta oficial vieja", created_at=old, pinned=True),
+            _entry("pregunta nueva"),
+        ])
+        assert sorted(e.question for e in memory.entries) == ["pregunta nueva", "pregunta oficial vieja"]
+        assert memory.stats()["evictions"]["ttl"] == 1
+
+        # Una entrada que vence después de insertarse se retira al acertarla
+        entry = next(e for e in memory.entries if e.question == "pregunta nueva")
+        entry.created_at = old
+        assert memory.find_best("pregunta nueva") is None
+        assert [e.question for e in memory.entries] == ["pregunta oficial vieja"]
+        assert memory.find_best("pregunta oficial vieja") is not None
+        assert memory.stats()["evictions"]["ttl"] == 2
+    print("   ✓ Expiración por TTL")
+
+
+def test_exact_tier():
+    """Las variantes de forma de una pregunta se resuelven por clave exacta, sin codificador"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=0)
+        memory.add_entries([
+            _entry("Pregunta número 11", chunk_ids=["c11"]),
+            _entry("Pregunta número 12", chunk_ids=["c12"]),
+        ])
+
+        with mock.patch.object(memory, "encode_question", side_effect=AssertionError("no debe codificar")):
+            entry, score = memory.find_best("PREGUNTA número 11??")
+        assert entry.question == "Pregunta número 11" and score == 1.0
+        tiers = memory.stats()["tiers"]
+        assert tiers["exact"]["keys"] == 2 and tiers["exact"]["hits"] == 1
+        assert tiers["semantic"]["lookups"] == 0
+
+        # Al invalidar la entrada desaparece también su clave exacta
+        assert memory.invalidate_stale({"c12"}, "v2") == 1
+        assert memory.stats()["tiers"]["exact"]["keys"] == 1
+        assert memory.find_best("PREGUNTA número 11??") is None
+        assert memory.stats()["tiers"]["semantic"]["lookups"] == 1
+
+        # Y al desalojarla por capacidad
+        memory.max_entries = 1
+        memory.add_entries([_entry("Pregunta número 13", last_used_at=time.time() + 10)])
+        assert [e.question for e in memory.entries] == ["Pregunta número 13"]
+        assert memory.stats()["tiers"]["exact"]["keys"] == 1
+        with mock.patch.object(memory, "encode_question", side_effect=AssertionError("no debe codificar")):
+            assert memory.find_best("pregunta numero 13")[1] == 1.0
+    print("   ✓ Nivel exacto")
+
+
+def test_invalidate_stale():
+    """Se retiran las respuestas con fragmentos desaparecidos y las demás pasan a la versión nueva"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=0)
+        memory.index_version = "v1"
+        memory.add("Pregunta con dos fragmentos", "Respuesta A", question_embedding=_vector("a"), chunk_ids=["c1", "c2"])
+        memory.add("Pregunta con un fragmento", "Respuesta B", question_embedding=_vector("b"), chunk_ids=["c3"])
+        memory.add("Pregunta general", "Respuesta C", question_embedding=_vector("c"))
+        memory.add_entries([_entry("Pregunta oficial", pinned=True, index_version="v1")])
+        assert {e.index_version for e in memory.entries} == {"v1"}
+
+        # Desaparece c2: solo la respuesta que lo usaba queda invalidada
+        assert memory.invalidate_stale({"c1", "c3"}, "v2") == 1
+        assert sorted(e.answer for e in memory.entries) == ["Respuesta B", "Respuesta C", "Respuesta a Pregunta oficial"]
+        assert {e.index_version for e in memory.entries} == {"v2"} and memory.index_version == "v2"
+        assert memory.stats()["evictions"]["stale_knowledge"] == 1
+
+        # Las respuestas nuevas usan la versión vigente; la versión sobrevive al reinicio
+        memory.add("Pregunta nueva", "Respuesta D", question_embedding=_vector("d"), chunk_ids=["c1"])
+        memory.compact()
+        assert memory.invalidate_stale({"c1", "c3"}, "v3") == 0
+        reloaded = _memory(directory, max_entries=0)
+        assert sorted(e.answer for e in reloaded.entries) == sorted(e.answer for e in memory.entries)
+        assert {e.index_version for e in reloaded.entries} == {"v3"}
+    print("   ✓ Invalidación por fragmentos y versión del índice")
+
+
+def test_clear_keeps_later_entries():
+    """Tras vaciar la memoria en vivo, lo que se agrega después sobrevive al reinicio"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=0)
+        memory.add("Pregunta vieja", "Respuesta vieja", question_embedding=_vector("vieja"))
+        assert memory.clear() == 1
+        assert memory.find_best("Pregunta vieja") is None
+        memory.add("Pregunta nueva", "Respuesta nueva", question_embedding=_vector("nueva"))
+        assert [e.answer for e in _memory(directory, max_entries=0).entries] == ["Respuesta nueva"]
+    print("   ✓ Vaciado en vivo")
+
+
+def test_concurrent_add_search_evict():
+    """Escritores, lectores y desalojos concurrentes sin errores y con conteos consistentes"""
+    with tempfile.TemporaryDirectory() as directory:
+        memory = _memory(directory, max_entries=50, eviction_policy=build_eviction_policy("lru"))
+        writers, readers, per_writer = 4, 4, 60
+        errors = []
+        done = threading.Event()
+
+        def write(w):
+            try:
+                for i in range(per_writer):
+                    question = f"pregunta {w}-{i}"
+                    memory.add(question, f"respuesta {w}-{i}", question_embedding=_vector(question))
+            except Exception as e:
+                errors.append(e)
+
+        def read(r):
+            try:
+                i = 0
+                while not done.is_set():
+                    question = f"pregunta {r}-{i % per_writer}"
+                    hit = memory.find_best(question)
+                    if hit is not None:
+                        assert hit[0].question == question and hit[1] == 1.0
+                    results = memory.search(_vector(question), top_k=3)
+                    assert len(results) <= 3 and all(-1.001 <= score <= 1.001 for _, score in results)
+                    i += 1
+            except Exception as e:
+                errors.append(e)
+
+        reader_threads = [threading.Thread(target=read, args=(r,)) for r in range(readers)]
+        writer_threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        done.set()
+        for thread in reader_threads:
+            thread.join()
+        assert not errors, errors
+
+        snapshot = memory._snapshot
+        stats = memory.stats()
+        assert len(snapshot.entries) == snapshot.vectors.shape[0] == len(snapshot.positions)
+        assert all(snapshot.entries[i].id == entry_id for entry_id, i in snapshot.positions.items())
+        assert set(snapshot.exact.values()) <= set(snapshot.positions)
+        assert stats["entries"] <= memory.max_entries
+        assert stats["entries"] + stats["evictions"]["capacity"] == writers * per_writer
+        assert len(_memory(directory, max_entries=0).entries) == stats["entries"]
+    print("\n✅ Memoria semántica verificada correctamente!")
+
+
+if __name__ == "__main__":
+    test_top_k_matches_brute_force()
+    test_matrix_growth_and_removal()
+    test_memory_removal_keeps_rows_aligned()
+    test_max_entries_eviction()
+    test_ttl_expiry()
+    test_exact_tier()
+    test_invalidate_stale()
+    test_clear_keeps_later_entries()
+    test_concurrent_add_search_evict()
@@ -0,0 +1,189 @@
+"""
+Prueba del backend SQLite (WAL) y de la migración desde los almacenes de archivos
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+
+import numpy as np
+
+from models import MemoryEntry
+from scripts import migrate_storage
+from services.conversation_manager import ConversationManager
+from services.conversation_store import FileConversationStore
+from services.history_store import HistoryStore
+from services.sqlite_storage import SQLiteConversationStore, SQLiteDatabase, SQLiteHistoryStore, SQLiteMemoryStore
+
+
+def test_sqlite_history_and_conversations():
+    """Historial con escrituras concurrentes y conversaciones con la misma interfaz que los archivos"""
+    print("Probando backend SQLite...")
+    db = SQLiteDatabase(os.path.join(tempfile.mkdtemp(), "aluna.db"))
+    history = SQLiteHistoryStore(db)
+
+    def writer(n):
+        for i in range(25):
+            history.append(f"s{n}", "user", f"mensaje {i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(history.sessions()) == [f"s{n}" for n in range(8)]
+    assert [t.content for t in history.get_recent("s3", limit=2)] == ["mensaje 23", "mensaje 24"]
+    assert len(history.get_recent("s3", limit=0)) == 25
+    assert history.clear("s3") == 25 and history.get_recent("s3") == []
+
+    manager = ConversationManager(store=SQLiteConversationStore(db))
+    conv = manager.create_conversation()
+    assert manager.add_message(conv["id"], "user", "¿Cuándo abren las inscripciones?")
+    assert manager.add_message(conv["id"], "ai", "En enero.")
+    assert not manager.add_message("no-existe", "user", "hola")
+    stored = manager.get_conversation(conv["id"])
+    assert stored["title"] == "¿Cuándo abren las inscripciones?"
+    assert [m["type"] for m in stored["messages"]] == ["user", "ai"]
+    assert manager.get_all_conversations()[0]["id"] == conv["id"]
+    assert manager.clear_conversation(conv["id"]) and manager.get_conversation(conv["id"])["messages"] == []
+    assert manager.delete_conversation(conv["id"]) and manager.get_conversation(conv["id"]) is None
+    db.close()
+    print(f"   ✓ Historial y conversaciones en SQLite: {db.stats()}")
+
+
+def test_cached_conversations_revalidated_across_workers():
+    """Con SQLite, la caché de un worker no sirve copias que otro worker ya cambió"""
+    path = os.path.join(tempfile.mkdtemp(), "aluna.db")
+    worker_a = ConversationManager(store=SQLiteConversationStore(SQLiteDatabase(path)), flush_interval=0)
+    worker_b = ConversationManager(store=SQLiteConversationStore(SQLiteDatabase(path)), flush_interval=0)
+
+    conv = worker_a.create_conversation()
+    worker_a.add_message(conv["id"], "user", "¿Dónde queda la biblioteca?")
+    assert len(worker_b.get_conversation(conv["id"])["messages"]) == 1
+    assert len(worker_b.get_conversation(conv["id"])["messages"]) == 1  # copia vigente: sin recarga
+
+    worker_a.add_message(conv["id"], "ai", "En el bloque central.")
+    assert [m["type"] for m in worker_b.get_conversation(conv["id"])["messages"]] == ["user", "ai"]
+
+    # Escribir sobre una copia desactualizada parte del estado actual
+    worker_a.add_message(conv["id"], "user", "¿Y el horario?")
+    worker_b.add_message(conv["id"], "ai", "De 7 a 21.")
+    expected = ["¿Dónde queda la biblioteca?", "En el bloque central.", "¿Y el horario?", "De 7 a 21."]
+    assert [m["content"] for m in worker_b.get_conversation(conv["id"])["messages"]] == expected
+    assert [m["content"] for m in worker_a.get_conversation(conv["id"])["messages"]] == expected
+
+    worker_a.delete_conversation(conv["id"])
+    assert worker_b.get_conversation(conv["id"]) is None
+    assert worker_b.store.stats()["cache"]["stale"] >= 3
+    print("   ✓ Caché revalidada entre workers")
+
+
+def test_conversation_search_shared_across_workers():
+    """La búsqueda en SQLite usa el índice FTS5 de la base: todos los workers ven lo mismo"""
+    path = os.path.join(tempfile.mkdtemp(), "aluna.db")
+    worker_a = ConversationManager(store=SQLiteConversationStore(SQLiteDatabase(path)))
+    worker_b = ConversationManager(store=SQLiteConversationStore(SQLiteDatabase(path)))
+    assert worker_a.search_in_store and worker_a.search_index is None
+
+    matricula = worker_a.create_conversation()["id"]
+    worker_a.add_turn(matricula, "¿Cómo hago la matrícula?", "La MATRÍCULA se hace en línea.")
+    comedor = worker_a.create_conversation()["id"]
+    worker_a.add_turn(comedor, "Horario del comedor", "De 12 a 2. También allí informan sobre matrícula.")
+
+    for worker in (worker_a, worker_b):
+        results, total = worker.search("¿dónde estaba lo de la matrícula?")
+        assert total == 2 and [r["id"] for r in results] == [matricula, comedor]
+        assert "matrícula" in results[0]["message"]["snippet"].lower()
+    assert [r["id"] for r in worker_b.search("matricula", limit=1, offset=1)[0]] == [comedor]
+
+    # Limpiar o eliminar desde otro worker no deja resultados viejos
+    worker_b.clear_conversation(matricula)
+    worker_b.flush()
+    results, total = worker_a.search("matrícula")
+    assert total == 1 and [r["id"] for r in results] == [comedor]
+    worker_b.delete_conversation(comedor)
+    assert worker_a.search("matrícula") == ([], 0)
+
+    # Una base creada antes del índice se indexa al abrirla
+    db = SQLiteDatabase(path)
+    with db.transaction() as conn:
+        conn.execute("DROP TABLE conversation_search")
+        conn.execute("DROP TABLE conversation_search_docs")
+    legacy = SQLiteConversationStore(db)
+    legacy.full_text_search = False
+    legacy.append_messages(matricula, [{"type": "user", "content": "Consulta sobre becas", "timestamp": ""}], {})
+    reopened = ConversationManager(store=SQLiteConversationStore(SQLiteDatabase(path)))
+    assert [r["id"] for r in reopened.search("becas")[0]] == [matricula]
+
+    # Un almacén compartido sin índice propio no busca con el índice parcial de un worker
+    class _SharedWithoutIndex(FileConversationStore):
+        shared = True
+
+    unsupported = ConversationManager(store=_SharedWithoutIndex(tempfile.mkdtemp()), cache_size=0)
+    try:
+        unsupported.search("matrícula")
+        assert False, "la búsqueda debía estar desactivada"
+    except RuntimeError:
+        pass
+    print("   ✓ Búsqueda FTS5 compartida entre workers")
+
+
+def test_migrate_storage_from_files():
+    """La migración copia historial, conversaciones y memoria; sin --replace no duplica"""
+    base = tempfile.mkdtemp()
+    history = HistoryStore(os.path.join(base, "chat_history.jsonl"), compact_interval=0)
+    history.append("ana", "user", "hola", timestamp=1.0)
+    history.append("ana", "assistant", "¡Hola!", timestamp=2.0)
+    history.close()
+    manager = ConversationManager(storage_path=os.path.join(base, "conversations"))
+    conv = manager.create_conversation()
+    manager.add_message(conv["id"], "user", "primera pregunta")
+    manager.flush()
+
+    db_path = os.path.join(base, "aluna.db")
+    args = ["--db", db_path, "--only", "history,conversations",
+            "--history-file", os.path.join(base, "chat_history.jsonl"),
+            "--conversations-dir", os.path.join(base, "conversations")]
+    assert migrate_storage.main(args)
+    assert migrate_storage.main(args)  # segunda vez: tablas con datos, se omiten
+
+    db = SQLiteDatabase(db_path)
+    assert [t.content for t in SQLiteHistoryStore(db).get_recent("ana")] == ["hola", "¡Hola!"]
+    migrated = SQLiteConversationStore(db).get(conv["id"])
+    assert migrated == FileConversationStore(os.path.join(base, "conversations")).get(conv["id"])
+
+    # --replace vacía y copia en la misma transacción: si la copia falla, la base no cambia
+    failure = sqlite3.OperationalError("disco lleno")
+    with mock.patch.object(SQLiteConversationStore, "save_conversations", side_effect=failure):
+        try:
+            migrate_storage.main(args + ["--replace"])
+            assert False, "la migración debía fallar"
+        except sqlite3.OperationalError:
+            pass
+    assert SQLiteConversationStore(db).get(conv["id"]) == migrated
+    assert [cid for cid, _ in SQLiteConversationStore(db).search("primera pregunta")[0]] == [conv["id"]]
+    assert migrate_storage.main(args + ["--replace"])
+    assert len(SQLiteHistoryStore(db).get_recent("ana", limit=0)) == 2
+    assert SQLiteConversationStore(db).search("primera pregunta")[1] == 1
+
+    memory = SQLiteMemoryStore(db)
+    entry = MemoryEntry(question="¿horario?", answer="8 a 17", embedding=np.ones(4, dtype=np.float32), pinned=True)
+    memory.save_entries([entry])
+    entry.usage_count = 3
+    memory.log_usage(entry)
+    memory.log_index_version("v2")
+    loaded = memory.load()
+    assert len(loaded) == 1 and loaded[0].usage_count == 3 and loaded[0].pinned
+    assert loaded[0].index_version == "v2"
+    assert np.allclose(loaded[0].embedding, entry.embedding)
+    db.close()
+    print("   ✓ Migración desde archivos")
+
+
+if __name__ == "__main__":
+    test_sqlite_history_and_conversations()
+    test_cached_conversations_revalidated_across_workers()
+    test_conversation_search_shared_across_workers()
+    test_migrate_storage_from_files()
+    print("✅ Pruebas de SQLite completadas")
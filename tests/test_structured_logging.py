@@ -0,0 +1,69 @@
+"""
+Prueba del registro estructurado encolado (StructuredLogger + QueueListener)
+"""
+import io
+import json
+import logging
+import time
+
+from services.structured_logging import JsonFormatter, StructuredLogger, TextFormatter, queued_handler
+
+
+def _logger(name, formatter):
+    """Logger con su propia cola y un destino en memoria"""
+    output = io.StringIO()
+    target = logging.StreamHandler(output)
+    target.setFormatter(formatter)
+    logger = logging.getLogger(name)
+    logger.handlers = [queued_handler(target)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return StructuredLogger(logger, {}), output
+
+
+def _lines(output, count, timeout=2.0):
+    """Espera a que el hilo de fondo escriba `count` líneas"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        lines = output.getvalue().splitlines()
+        if len(lines) >= count:
+            return lines
+        time.sleep(0.01)
+    raise AssertionError(f"Se esperaban {count} líneas: {output.getvalue()!r}")
+
+
+def test_reserved_field_names_json():
+    """`level` y `msg` como campos no pisan el nivel ni el mensaje del registro"""
+    print("Probando registro estructurado...")
+    log, output = _logger("aluna.test.structured.json", JsonFormatter())
+    log.info("Respuesta %s", "desde memoria", level="alto", msg="campo", sim=0.93)
+    log.debug("Detalle", logger="otro", ts="ayer")
+
+    first, second = (json.loads(line) for line in _lines(output, 2))
+    assert first["level"] == "INFO" and first["msg"] == "Respuesta desde memoria"
+    assert first["field.level"] == "alto" and first["field.msg"] == "campo" and first["sim"] == 0.93
+    assert first["logger"] == "aluna.test.structured.json"
+    assert second["level"] == "DEBUG" and second["field.logger"] == "otro" and second["field.ts"] == "ayer"
+    print("   ✓ Campos reservados en JSON")
+
+
+def test_reserved_field_names_text():
+    """En texto los campos se agregan como clave=valor tras el mensaje"""
+    log, output = _logger("aluna.test.structured.text", TextFormatter())
+    log.warning("Protocolo activado", level="🔴 Alto", msg="no quiero vivir", matches=2)
+    try:
+        raise ValueError("fallo de prueba")
+    except ValueError:
+        log.exception("Error capturado", stage="retrieval")
+
+    lines = _lines(output, 3)
+    assert " WARNING aluna.test.structured.text Protocolo activado " in lines[0]
+    assert lines[0].endswith('level="🔴 Alto" msg="no quiero vivir" matches=2')
+    assert " ERROR   aluna.test.structured.text Error capturado stage=retrieval" in lines[1]
+    assert any("ValueError: fallo de prueba" in line for line in lines[2:])
+    print("\n✅ Registro estructurado verificado correctamente!")
+
+
+if __name__ == "__main__":
+    test_reserved_field_names_json()
+    test_reserved_field_names_text()